@@ -0,0 +1,91 @@
+# api/authentication.py
+"""
+基于 JWT 声明 (claims) 的认证：登录签发 Token 时把角色和所属医院写进去，
+之后的请求直接从 Token 构造轻量的 TokenPrincipal，不再查 User / UserProfile 表
+
+- 登录：POST /api/token/ 使用 ClaimsTokenObtainPairSerializer (settings.SIMPLE_JWT['TOKEN_OBTAIN_SERIALIZER'])，
+  Token 里带 role / hospital_id / username / is_staff / is_superuser，响应里也返回 role / hospital_id
+- 认证：ClaimsJWTAuthentication 对带 role 声明的 Token 返回 TokenPrincipal；
+  升级前签发的旧 Token 没有这些声明，回退到 SimpleJWT 默认的查库逻辑
+- request.user.profile.role / .hospital_id 的读法保持不变，只有访问 .profile.hospital (写操作) 时才查一次医院；
+  医院被删除后 token 里的 hospital_id 仍然存在，写入前用 api.permission.get_admin_hospital 确认 (不存在时 403)
+- 角色或所属医院变更要等 access token 过期 (SIMPLE_JWT['ACCESS_TOKEN_LIFETIME']) 后才生效；
+  刷新 access token 时沿用 refresh token 里的声明，需要立即生效时让用户重新登录
+"""
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.models import Hospital, UserProfile
+
+ROLE_CLAIM = 'role'
+HOSPITAL_CLAIM = 'hospital_id'
+
+
+def add_principal_claims(token, user):
+    """把角色、所属医院写进 token (登录时查一次 UserProfile)"""
+    profile = UserProfile.objects.filter(user_id=user.pk).values('role', 'hospital_id').first() or {}
+    token['username'] = user.get_username()
+    token['is_staff'] = user.is_staff
+    token['is_superuser'] = user.is_superuser
+    token[ROLE_CLAIM] = profile.get('role')
+    token[HOSPITAL_CLAIM] = profile.get('hospital_id')
+    return token
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        return add_principal_claims(super().get_token(user), user)
+
+    def validate(self, attrs):
+        data = super().validate(attrs)
+        # 前端登录后直接拿到真实角色，不用信任登录页上选的角色
+        refresh = RefreshToken(data['refresh'])
+        data[ROLE_CLAIM] = refresh[ROLE_CLAIM]
+        data[HOSPITAL_CLAIM] = refresh[HOSPITAL_CLAIM]
+        return data
+
+
+def tokens_for_user(user):
+    """签发带声明的 refresh token (access token 用 .access_token 取)，脚本和测试里用"""
+    return ClaimsTokenObtainPairSerializer.get_token(user)
+
+
+class PrincipalProfile:
+    """和 UserProfile 读法一致的轻量对象：role / hospital_id 来自 token，hospital 按需查询"""
+    __slots__ = ('role', 'hospital_id', '_hospital')
+
+    def __init__(self, role, hospital_id):
+        self.role = role
+        self.hospital_id = hospital_id
+        self._hospital = None
+
+    @property
+    def hospital(self):
+        if self.hospital_id is None:
+            return None
+        if self._hospital is None:
+            self._hospital = Hospital.objects.filter(pk=self.hospital_id).first()
+        return self._hospital
+
+
+class TokenPrincipal(TokenUser):
+    """由 token 声明构造的用户，不对应数据库里的 User 实例 (不能 save / 用作外键)"""
+
+    @cached_property
+    def profile(self):
+        return PrincipalProfile(self.token.get(ROLE_CLAIM), self.token.get(HOSPITAL_CLAIM))
+
+    def __str__(self):
+        return f'{self.username} - {self.profile.role}'
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        if ROLE_CLAIM not in validated_token:
+            # 旧 token：查库
+            return super().get_user(validated_token)
+        return TokenPrincipal(validated_token)
@@ -0,0 +1,293 @@
+# api/db_router.py
+"""
+只读副本路由
+
+- settings.DATABASES 里 default 以外的别名都当作只读副本 (或用 DATABASE_REPLICAS['ALIASES'] 指定)；
+  没有配置副本时中间件直接卸载，所有查询照旧走 default
+- ReplicaRoutingMiddleware 按请求决定读库：
+    1. READ_ONLY_PATHS 下的接口 (统计、导出、公众搜索) 总是读副本：本身只读，能接受几秒延迟
+    2. 其他 GET/HEAD/OPTIONS 请求读副本，但同一用户 STICKY_SECONDS 秒内写过数据时读主库
+       (刚保存就刷新列表也能看到自己的修改)
+    3. 其他请求 (POST/PUT/PATCH/DELETE) 读写都在主库
+- 写操作总是走主库；主库事务内的读也走主库 (select_for_update、先写后读)
+- 副本连不上时标记为不可用，RETRY_SECONDS 秒内不再尝试，这段时间的读回到主库；
+  连上之后查询出错 (副本宕机、表结构还没同步) 时同样标记为不可用，没有写过数据的只读请求在主库上重新执行一次
+  (流式响应 (导出) 开始输出之后出错无法重试，仍然是 500)
+- 管理命令、信号里的后台任务等请求之外的代码不受影响，都在主库
+
+"同一用户" 按 Authorization 请求头识别，写过的标记存在 Django cache 里 (CACHE_ALIAS)；
+多进程部署时需要共享的缓存后端 (Redis / Memcached)，否则只在本进程内生效。
+
+响应缓存 (api/response_cache.py) 未命中时调用 use_primary()，写进缓存的数据都来自主库：
+副本延迟期间的请求不会把写入前的旧数据重新缓存起来
+"""
+import hashlib
+import random
+import sys
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.signals import got_request_exception
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+DEFAULTS = {
+    'ALIASES': None,        # None: DATABASES 里 default 以外的全部别名
+    'STICKY_SECONDS': 5,    # 写入后这段时间内该用户的读请求走主库 (应大于副本的正常延迟)
+    'RETRY_SECONDS': 30,    # 副本连接失败后多久再试
+    'CACHE_ALIAS': 'default',
+    'READ_ONLY_PATHS': ('/api/statistics/', '/api/exports/', '/api/public/'),
+}
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def get_replica_setting(name):
+    return getattr(settings, 'DATABASE_REPLICAS', {}).get(name, DEFAULTS[name])
+
+
+def replica_aliases():
+    aliases = get_replica_setting('ALIASES')
+    if aliases is None:
+        aliases = [alias for alias in settings.DATABASES if alias != DEFAULT_DB_ALIAS]
+    return list(aliases)
+
+
+# ---------------------------------------------------------
+# 副本可用性 (进程内)
+# ---------------------------------------------------------
+
+_down_until = {}
+_down_lock = threading.Lock()
+
+
+def mark_replica_down(alias):
+    with _down_lock:
+        _down_until[alias] = time.monotonic() + get_replica_setting('RETRY_SECONDS')
+
+
+def reset_replica_health():
+    with _down_lock:
+        _down_until.clear()
+
+
+def _is_down(alias):
+    with _down_lock:
+        until = _down_until.get(alias)
+        if until is not None and until <= time.monotonic():
+            del _down_until[alias]
+            until = None
+    return until is not None
+
+
+def pick_replica():
+    """随机选一个可用的副本并确认能连上；都不可用时返回 None"""
+    aliases = replica_aliases()
+    random.shuffle(aliases)
+    for alias in aliases:
+        if _is_down(alias):
+            continue
+        try:
+            connections[alias].ensure_connection()
+        except DatabaseError:
+            mark_replica_down(alias)
+            continue
+        return alias
+    return None
+
+
+# ---------------------------------------------------------
+# 请求级状态 + 路由器
+# ---------------------------------------------------------
+
+class _RoutingState:
+    __slots__ = ('use_replica', 'alias', 'wrote', 'replica_failed')
+
+    def __init__(self, use_replica):
+        self.use_replica = use_replica
+        self.alias = None   # 本请求选定的副本，第一次读时才选
+        self.wrote = False
+        self.replica_failed = False
+
+
+# ContextVar：ASGI 下同步视图 / 异步 ORM 在线程里执行时也能读到当前请求的状态
+_state = ContextVar('db_routing_state', default=None)
+
+
+class ReplicaRouter:
+    """settings.DATABASE_ROUTERS = ['api.db_router.ReplicaRouter']"""
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or not state.use_replica:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            # 主库事务里的读必须在同一个连接上
+            return DEFAULT_DB_ALIAS
+        if state.alias is None:
+            state.alias = pick_replica() or DEFAULT_DB_ALIAS
+        return state.alias
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # 主库和副本是同一份数据
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # 副本的表结构由复制同步过去
+        return db == DEFAULT_DB_ALIAS
+
+
+def use_primary():
+    """本请求之后的读都走主库 (当前不在请求里时什么也不做)"""
+    state = _state.get()
+    if state is not None:
+        state.use_replica = False
+
+
+def _replica_query_failed(sender, request=None, **kwargs):
+    """
+    got_request_exception：视图抛出的数据库异常来自本请求的副本时 (连接上有 errors_occurred 标记)，
+    标记副本不可用，由中间件决定是否在主库上重试
+    """
+    state = _state.get()
+    if state is None or state.alias in (None, DEFAULT_DB_ALIAS):
+        return
+    if isinstance(sys.exc_info()[1], DatabaseError) and connections[state.alias].errors_occurred:
+        mark_replica_down(state.alias)
+        state.replica_failed = True
+
+
+got_request_exception.connect(_replica_query_failed, dispatch_uid='api.db_router.replica_query_failed')
+
+
+def _sticky_key(request):
+    authorization = request.META.get('HTTP_AUTHORIZATION')
+    if not authorization:
+        return None
+    return 'api:db-sticky:' + hashlib.sha1(authorization.encode('utf-8')).hexdigest()
+
+
+def _use_replica(request, sticky):
+    if request.path.startswith(tuple(get_replica_setting('READ_ONLY_PATHS'))):
+        return True
+    return request.method in SAFE_METHODS and not sticky
+
+
+class ReplicaRoutingMiddleware:
+    """
+    放在 MetricsMiddleware 后面、其他中间件前面 (会话、认证等中间件的查询也按本请求的规则路由)。
+    流式响应 (导出) 在中间件返回之后才查库，迭代时重新挂上本请求的状态
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not replica_aliases():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.cache = caches[get_replica_setting('CACHE_ALIAS')]
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        key = _sticky_key(request)
+        sticky = key is not None and self.cache.get(key) is not None
+        state = _RoutingState(_use_replica(request, sticky))
+        self._keep_body(request, state)
+        response = self._run(request, state)
+        if self._should_retry(request, response, state):
+            state = _RoutingState(use_replica=False)
+            response = self._run(request, state)
+        if state.wrote and key is not None:
+            self.cache.set(key, 1, get_replica_setting('STICKY_SECONDS'))
+        return self._wrap_stream(response, state)
+
+    async def __acall__(self, request):
+        key = _sticky_key(request)
+        sticky = key is not None and await self.cache.aget(key) is not None
+        state = _RoutingState(_use_replica(request, sticky))
+        self._keep_body(request, state)
+        response = await self._arun(request, state)
+        if self._should_retry(request, response, state):
+            state = _RoutingState(use_replica=False)
+            response = await self._arun(request, state)
+        if state.wrote and key is not None:
+            await self.cache.aset(key, 1, get_replica_setting('STICKY_SECONDS'))
+        return self._wrap_stream(response, state)
+
+    def _run(self, request, state):
+        token = _state.set(state)
+        try:
+            return self.get_response(request)
+        finally:
+            _state.reset(token)
+
+    async def _arun(self, request, state):
+        token = _state.set(state)
+        try:
+            return await self.get_response(request)
+        finally:
+            _state.reset(token)
+
+    @staticmethod
+    def _keep_body(request, state):
+        # READ_ONLY_PATHS 下的 POST (公众搜索) 先把请求体读进内存，在主库重试时还能再解析一次
+        if state.use_replica and request.method not in SAFE_METHODS:
+            request.body
+
+    @staticmethod
+    def _should_retry(request, response, state):
+        # 副本查询出错、本请求还没写过数据：在主库上重新执行 (只重试一次，主库也出错时照常返回 500)
+        return state.replica_failed and not state.wrote and response.status_code >= 500
+
+    def _wrap_stream(self, response, state):
+        if response.streaming and state.use_replica:
+            wrap = self._async_stream if response.is_async else self._stream
+            response.streaming_content = wrap(response.streaming_content, state)
+        return response
+
+    @staticmethod
+    def _stream(content, state):
+        iterator = iter(content)
+        try:
+            while True:
+                token = _state.set(state)
+                try:
+                    chunk = next(iterator)
+                except StopIteration:
+                    break
+                finally:
+                    _state.reset(token)
+                yield chunk
+        finally:
+            if hasattr(iterator, 'close'):
+                iterator.close()
+
+    @staticmethod
+    async def _async_stream(content, state):
+        iterator = aiter(content)
+        try:
+            while True:
+                token = _state.set(state)
+                try:
+                    chunk = await anext(iterator)
+                except StopAsyncIteration:
+                    break
+                finally:
+                    _state.reset(token)
+                yield chunk
+        finally:
+            if hasattr(iterator, 'aclose'):
+                await iterator.aclose()
@@ -0,0 +1,238 @@
+# api/event_feed.py
+"""
+突发事件实时推送 (Server-Sent Events)
+
+    GET /api/events/stream/?hospital_id=3&severity=重大&severity=特别重大
+
+- 前端用 EventSource 订阅一个长连接，代替轮询 /api/events/
+- 推送的消息：
+    event.created           新事件 (事务提交后发送，带参与医院 id)
+    event.severity_changed  事件风险等级变化 (带 old_severity)
+    participation.created   事件新增参与医院
+- hospital_id / severity 可传多个，只推送相关的消息
+- 断线重连时浏览器自动带 Last-Event-ID，从最近的 REPLAY 条消息里补发
+- 每个订阅者一个有界队列，消费跟不上时发送 event: lagged 并断开，客户端应重新拉一次列表再订阅
+
+广播中心 (EventHub) 在进程内：信号处理器在写入的线程里调用 publish()，
+通过 loop.call_soon_threadsafe 把消息交给各订阅连接所在的事件循环。
+多进程部署时每个进程只看得到本进程的写入，需要把写入和推送放在同一个 ASGI 进程，
+或者把 EventHub 换成 Redis pub/sub 之类的跨进程实现 (接口不变)。
+
+只能在 ASGI 下提供 (backend/asgi.py，如 uvicorn backend.asgi:application)；WSGI 下返回 400，
+否则一个长连接会一直占住一个 worker
+"""
+import asyncio
+import itertools
+import json
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.http import JsonResponse, StreamingHttpResponse
+
+from api.models import HospitalEvent
+
+DEFAULTS = {
+    'MAX_SUBSCRIBERS': 1000,
+    'QUEUE_SIZE': 256,      # 每个订阅者最多积压的消息数
+    'HEARTBEAT': 15,        # 秒，空闲时发送注释行，防止代理断开空闲连接
+    'REPLAY': 500,          # 保留最近多少条消息用于 Last-Event-ID 补发
+    'RETRY_MS': 3000,       # 建议客户端的重连间隔
+}
+
+
+def get_feed_setting(name):
+    return getattr(settings, 'EVENT_FEED', {}).get(name, DEFAULTS[name])
+
+
+class Subscription:
+    __slots__ = ('loop', 'queue', 'hospital_ids', 'severities', 'lagged')
+
+    def __init__(self, loop, hospital_ids, severities):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=get_feed_setting('QUEUE_SIZE'))
+        self.hospital_ids = hospital_ids
+        self.severities = severities
+        self.lagged = False
+
+    def matches(self, message):
+        if self.hospital_ids and not self.hospital_ids.intersection(message.get('hospital_ids') or ()):
+            return False
+        # 风险等级变化时新旧等级任一匹配都推送，订阅方才知道事件移出了自己关注的等级
+        if self.severities and message.get('severity') not in self.severities \
+                and message.get('old_severity') not in self.severities:
+            return False
+        return True
+
+    def offer(self, message):
+        """在订阅者的事件循环里执行"""
+        if self.lagged:
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.lagged = True
+            # 腾出一个位置放结束标记，消费端读到后断开
+            self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+
+class EventHub:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        # 消息 id 从毫秒时间戳开始递增，进程重启后客户端带旧的 Last-Event-ID 也不会漏掉新消息
+        self._ids = itertools.count(time.time_ns() // 1_000_000)
+        self._recent = deque(maxlen=get_feed_setting('REPLAY'))
+
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def subscribe(self, hospital_ids=(), severities=()):
+        """在事件循环里调用；超过 MAX_SUBSCRIBERS 时返回 None"""
+        subscription = Subscription(asyncio.get_running_loop(), set(hospital_ids), set(severities))
+        with self._lock:
+            if len(self._subscribers) >= get_feed_setting('MAX_SUBSCRIBERS'):
+                return None
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, message_type, payload):
+        """可以在任意线程调用"""
+        with self._lock:
+            message = dict(payload, id=next(self._ids), type=message_type)
+            self._recent.append(message)
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            if subscription.matches(message):
+                try:
+                    subscription.loop.call_soon_threadsafe(subscription.offer, message)
+                except RuntimeError:
+                    # 事件循环已关闭 (连接所在的循环退出了)
+                    self.unsubscribe(subscription)
+        return message
+
+    def replay(self, last_id, subscription):
+        """id 大于 last_id 且符合过滤条件的最近消息"""
+        with self._lock:
+            recent = list(self._recent)
+        return [message for message in recent if message['id'] > last_id and subscription.matches(message)]
+
+
+hub = EventHub()
+
+
+# ---------------------------------------------------------
+# 发布 (由 api/signals.py 和批量写入的代码调用，事务提交后才发送)
+# ---------------------------------------------------------
+
+def event_payload(event, hospital_ids):
+    return {
+        'event_id': event.pk,
+        'event_type': event.event_type,
+        'severity': event.severity,
+        'report_time': event.report_time,
+        'hospital_ids': sorted(hospital_ids),
+    }
+
+
+def _hospital_ids(event):
+    return HospitalEvent.objects.filter(event_id=event.pk).values_list('hospital_id', flat=True)
+
+
+# 没有订阅者时也发布：消息进入补发缓冲，刚好在重连间隙的客户端不会漏掉
+
+def publish_event_created(event):
+    def send():
+        # 参与记录和事件在同一个事务里写入 (bulk_create)，提交后再查参与医院
+        hub.publish('event.created', event_payload(event, _hospital_ids(event)))
+    transaction.on_commit(send)
+
+
+def publish_severity_changed(event, old_severity):
+    def send():
+        hub.publish('event.severity_changed', dict(event_payload(event, _hospital_ids(event)), old_severity=old_severity))
+    transaction.on_commit(send)
+
+
+def publish_participations(event, participations):
+    """participations: [{'hospital_id':, 'role':, ...}]，event 需要带 severity (按风险等级过滤)"""
+    def send():
+        for participation in participations:
+            hub.publish('participation.created', {
+                'event_id': event.pk,
+                'severity': event.severity,
+                'hospital_ids': [participation['hospital_id']],
+                'hospital_id': participation['hospital_id'],
+                'role': participation.get('role'),
+                'affected_patient_count': participation.get('affected_patient_count'),
+            })
+    if participations:
+        transaction.on_commit(send)
+
+
+# ---------------------------------------------------------
+# SSE 视图
+# ---------------------------------------------------------
+
+def format_sse(message):
+    data = json.dumps(message, ensure_ascii=False, cls=DjangoJSONEncoder)
+    return f"id: {message['id']}\nevent: {message['type']}\ndata: {data}\n\n"
+
+
+async def _stream(hospital_ids, severities, last_event_id):
+    # 在生成器里订阅：响应开始发送后才占用名额，断开时 finally 一定会退订
+    subscription = hub.subscribe(hospital_ids, severities)
+    if subscription is None:
+        yield 'event: busy\ndata: {}\n\n'
+        return
+    try:
+        yield f"retry: {get_feed_setting('RETRY_MS')}\n\n"
+        for message in hub.replay(last_event_id, subscription) if last_event_id is not None else ():
+            yield format_sse(message)
+        heartbeat = get_feed_setting('HEARTBEAT')
+        while True:
+            try:
+                message = await asyncio.wait_for(subscription.queue.get(), timeout=heartbeat)
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            if message is None:
+                yield 'event: lagged\ndata: {}\n\n'
+                return
+            yield format_sse(message)
+    finally:
+        # 客户端断开时 Django 会取消这个生成器
+        hub.unsubscribe(subscription)
+
+
+async def event_stream(request):
+    if request.method != 'GET':
+        return JsonResponse({"code": 405, "message": "只支持 GET"}, status=405)
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({"code": 400, "message": "事件推送需要 ASGI 部署 (backend.asgi)"}, status=400)
+
+    try:
+        hospital_ids = [int(value) for value in request.GET.getlist('hospital_id')]
+        last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return JsonResponse({"code": 400, "message": "hospital_id / Last-Event-ID 必须是整数"}, status=400)
+
+    if hub.subscriber_count() >= get_feed_setting('MAX_SUBSCRIBERS'):
+        return JsonResponse({"code": 503, "message": "订阅连接数已满，请稍后重试"}, status=503)
+
+    stream = _stream(hospital_ids, request.GET.getlist('severity'), last_event_id)
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # 关闭 nginx 的响应缓冲，消息立即下发
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,242 @@
+# api/fieldsets.py
+"""
+稀疏字段集和展开控制：?fields= / ?omit= / ?expand=
+
+    GET /api/hospitals/?fields=hospital_id,name          地图点位、下拉框只要 id + 名称
+    GET /api/events/?omit=participating_hospitals        不要嵌套的参与医院 (也不再预取)
+    GET /api/hospital_events/?expand=hospital            hospital 从 id 展开成 {hospital_id, name}
+    GET /api/events/?fields=event_id,participating_hospitals.hospital_name
+                                                         点号选择嵌套序列化器里的字段
+
+- 输出用的序列化器继承 FieldsetMixin，按请求参数裁剪 self.fields (嵌套序列化器一并裁剪)；
+  只影响输出，带 data= 的反序列化 (写入) 不裁剪。不认识的字段名忽略
+- 可展开的外键在 Meta.expandable_fields 里声明：{'hospital': 'HospitalInfoSerializer'}
+  (类或类名；类名在序列化器所在模块里查找，可以引用后面才定义的类)
+- 查询集按保留下来的字段准备 (prune_queryset)：
+    序列化器的 setup_queryset(queryset, fields) 收到保留的字段名，跳过用不到的注解和预取；
+    点号 source (level.level_name)、嵌套/展开的外键自动 select_related，嵌套的反向关系自动预取；
+    裁剪过字段时再用 only() 只取用到的列 (主键、外键列、排序键总是保留)
+- 路由注册的视图由 FieldsetFilterBackend 在 list/retrieve/update 时自动处理
+  (settings.REST_FRAMEWORK['DEFAULT_FILTER_BACKENDS'])；自定义 action 自己调用 prune_queryset，
+  并把 request 放进序列化器的 context
+"""
+import sys
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from django.utils.module_loading import import_string
+from rest_framework import serializers
+
+
+def _parse(values):
+    """['a,b.c', 'b.d'] -> {'a': {}, 'b': {'c': {}, 'd': {}}}"""
+    tree = {}
+    for value in values:
+        for item in value.split(','):
+            path = [part for part in item.strip().split('.') if part]
+            node = tree
+            for part in path:
+                node = node.setdefault(part, {})
+    return tree
+
+
+class Fieldset:
+    """一层序列化器的字段选择；fields 为 None 表示全部保留"""
+    __slots__ = ('fields', 'omit', 'expand')
+
+    def __init__(self, fields=None, omit=None, expand=None):
+        self.fields = fields
+        self.omit = omit or {}
+        self.expand = expand or {}
+
+    @classmethod
+    def from_request(cls, request):
+        """DRF Request 用 query_params，Django HttpRequest (异步视图) 用 GET"""
+        query = getattr(request, 'query_params', None)
+        if query is None:
+            query = request.GET
+        fields = query.getlist('fields')
+        return cls(
+            fields=_parse(fields) if fields else None,
+            omit=_parse(query.getlist('omit')),
+            expand=_parse(query.getlist('expand')),
+        )
+
+    def __bool__(self):
+        return self.fields is not None or bool(self.omit) or bool(self.expand)
+
+    def child(self, name):
+        fields = self.fields.get(name) if self.fields is not None else None
+        return Fieldset(fields=fields or None, omit=self.omit.get(name), expand=self.expand.get(name))
+
+
+class FieldsetMixin:
+    """
+    放在 serializers.ModelSerializer 前面；字段选择来自 context['fieldset'] 或 context['request'] 的查询参数
+    """
+    fieldset_applied = False
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if hasattr(self, 'initial_data'):
+            return
+        fieldset = self.context.get('fieldset')
+        if fieldset is None and self.context.get('request') is not None:
+            fieldset = Fieldset.from_request(self.context['request'])
+        if fieldset:
+            self.apply_fieldset(fieldset)
+
+    def apply_fieldset(self, fieldset):
+        fields = self.fields
+        expandable = getattr(self.Meta, 'expandable_fields', {})
+        for name in fieldset.expand:
+            if name in expandable and name in fields:
+                fields[name] = self._expanded_serializer(expandable[name])(read_only=True)
+        for name in list(fields):
+            if fieldset.fields is not None and name not in fieldset.fields:
+                del fields[name]
+            elif name in fieldset.omit and not fieldset.omit[name]:
+                del fields[name]
+        for name, field in fields.items():
+            nested = field.child if isinstance(field, serializers.ListSerializer) else field
+            if isinstance(nested, FieldsetMixin):
+                child = fieldset.child(name)
+                if child:
+                    nested.apply_fieldset(child)
+        self.fieldset_applied = True
+
+    def _expanded_serializer(self, serializer_class):
+        # 可以写成字符串：同模块里后定义的类名，或完整的导入路径
+        if isinstance(serializer_class, str):
+            if '.' in serializer_class:
+                return import_string(serializer_class)
+            return getattr(sys.modules[type(self).__module__], serializer_class)
+        return serializer_class
+
+
+# ---------------------------------------------------------
+# 查询集裁剪
+# ---------------------------------------------------------
+
+class _QueryPlan:
+    def __init__(self):
+        self.columns = set()
+        self.related = set()
+        self.prefetches = []    # [(路径, 嵌套序列化器)]
+        self.opaque = False     # 有 source='*' 或模型属性等看不出用到哪些列的字段，不能用 only()
+
+
+def _model_field(model, name):
+    try:
+        return model._meta.get_field(name)
+    except FieldDoesNotExist:
+        # 反向关系的 source 写的是访问器名 (hospitalstaff_set)
+        return next((rel for rel in model._meta.related_objects if rel.get_accessor_name() == name), None)
+
+
+def _plan(serializer, prefix, plan):
+    model = serializer.Meta.model
+    opts = model._meta
+    plan.columns.add(prefix + opts.pk.name)
+    # 外键列很小，权限判断 (obj.hospital_id)、预取回填都要用，总是保留
+    plan.columns.update(prefix + field.name for field in opts.concrete_fields if field.is_relation)
+
+    for field in serializer.fields.values():
+        if field.write_only or isinstance(field, serializers.SerializerMethodField):
+            # 方法字段的数据由 setup_queryset 的注解/预取提供
+            continue
+        if field.source == '*':
+            plan.opaque = True
+            continue
+        nested = field.child if isinstance(field, serializers.ListSerializer) else field
+        current, path = model, prefix
+        parts = field.source.split('.')
+        for index, part in enumerate(parts):
+            last = index == len(parts) - 1
+            model_field = _model_field(current, part)
+            if model_field is None:
+                # get_role_display 之类：只依赖 role 列
+                choice = part.startswith('get_') and part.endswith('_display') and _model_field(current, part[4:-8])
+                if last and choice:
+                    plan.columns.add(path + choice.name)
+                else:
+                    plan.opaque = True
+                break
+            if model_field.one_to_many or model_field.many_to_many:
+                if last:
+                    plan.prefetches.append((path + part, nested if isinstance(nested, FieldsetMixin) else None))
+                else:
+                    plan.opaque = True
+                break
+            if model_field.is_relation:
+                if model_field.concrete:
+                    plan.columns.add(path + part)
+                if last and not isinstance(nested, serializers.BaseSerializer):
+                    break
+                plan.related.add(path + part)
+                if last:
+                    _plan(nested, path + part + '__', plan)
+                    break
+                current, path = model_field.related_model, path + part + '__'
+                continue
+            if last:
+                plan.columns.add(path + part)
+            else:
+                plan.opaque = True
+
+
+def _ordering_columns(queryset):
+    names = list(queryset.query.order_by) or list(queryset.model._meta.ordering)
+    return {name.lstrip('-') for name in names if isinstance(name, str) and '__' not in name and name != '?'}
+
+
+def prune_queryset(queryset, serializer, extra_columns=()):
+    """
+    按序列化器 (已裁剪字段的实例) 准备查询集；extra_columns 为视图额外要读的列 (分页键、搜索打分用的字段)
+    """
+    fields = set(serializer.fields) if serializer.fieldset_applied else None
+    setup = getattr(serializer, 'setup_queryset', None)
+    if setup is not None:
+        queryset = setup(queryset, fields=fields)
+
+    plan = _QueryPlan()
+    _plan(serializer, '', plan)
+    if plan.related:
+        queryset = queryset.select_related(*plan.related)
+    seen = {getattr(lookup, 'prefetch_to', lookup) for lookup in queryset._prefetch_related_lookups}
+    for path, nested in plan.prefetches:
+        if path in seen:
+            continue
+        if nested is None:
+            queryset = queryset.prefetch_related(path)
+        else:
+            related_queryset = nested.Meta.model._default_manager.all()
+            if not related_queryset.ordered:
+                # 嵌套列表的顺序要稳定
+                related_queryset = related_queryset.order_by('pk')
+            related_queryset = prune_queryset(related_queryset, nested)
+            queryset = queryset.prefetch_related(Prefetch(path, queryset=related_queryset))
+
+    if fields is not None and not plan.opaque:
+        queryset = queryset.only(*plan.columns, *extra_columns, *_ordering_columns(queryset))
+    return queryset
+
+
+class FieldsetFilterBackend:
+    """
+    路由注册的 GenericAPIView：list / retrieve / update 时按序列化器准备查询集
+    (原来各视图 get_queryset 里调用的 setup_queryset 也在这里统一调用)
+    """
+    actions = ('list', 'retrieve', 'update', 'partial_update')
+
+    def filter_queryset(self, request, queryset, view):
+        if getattr(view, 'action', None) not in self.actions:
+            return queryset
+        serializer = view.get_serializer()
+        if not isinstance(serializer, FieldsetMixin):
+            return queryset
+        if request.method not in ('GET', 'HEAD'):
+            # 写入后返回完整的对象，不裁剪
+            serializer = view.get_serializer_class()(context={**view.get_serializer_context(), 'fieldset': Fieldset()})
+        keyset = [name.lstrip('-') for name in getattr(view, 'keyset_ordering', ())]
+        return prune_queryset(queryset, serializer, extra_columns=keyset)
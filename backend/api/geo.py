@@ -0,0 +1,126 @@
+# api/geo.py
+"""
+医院空间索引：进程内网格索引 + haversine 距离，用于"离我最近的医院"
+
+- 把有经纬度的医院按 CELL_DEG 度一格放进网格，查询时从用户所在格子一圈圈向外扩，
+  找够 k 家且下一圈不可能更近时就停，不用和每一家医院算距离
+- Hospital 保存/删除时 (api/signals.py) 调用 invalidate()，下次查询时重建；
+  其他进程的写入靠 MAX_AGE 秒的过期时间兜底
+"""
+import math
+import threading
+import time
+from collections import defaultdict, namedtuple
+
+from api.models import Hospital
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEG_LAT = math.pi * EARTH_RADIUS_KM / 180
+
+HospitalPoint = namedtuple('HospitalPoint', ['hospital_id', 'lat', 'lng', 'level_id'])
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class HospitalSpatialIndex:
+    CELL_DEG = 0.05     # 约 5km 一格
+    MAX_AGE = 300       # 秒，兜底过期时间
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._built_at = 0.0
+
+    def invalidate(self):
+        self._snapshot = None
+
+    def _cell(self, lat, lng):
+        return math.floor(lat / self.CELL_DEG), math.floor(lng / self.CELL_DEG)
+
+    def _fresh(self):
+        return self._snapshot is not None and time.monotonic() - self._built_at < self.MAX_AGE
+
+    def _ensure_built(self):
+        """返回 (cells, bounds, max_abs_lat) 快照，查询过程中被 invalidate() 也不受影响"""
+        snapshot = self._snapshot
+        if self._fresh():
+            return snapshot
+        with self._lock:
+            if self._fresh():
+                return self._snapshot
+            cells = defaultdict(list)
+            max_abs_lat = 0.0
+            rows = Hospital.objects.filter(latitude__isnull=False, longitude__isnull=False).values_list(
+                'hospital_id', 'latitude', 'longitude', 'level_id')
+            for hospital_id, lat, lng, level_id in rows:
+                point = HospitalPoint(hospital_id, float(lat), float(lng), level_id)
+                cells[self._cell(point.lat, point.lng)].append(point)
+                max_abs_lat = max(max_abs_lat, abs(point.lat))
+            bounds = None
+            if cells:
+                rows_, cols_ = zip(*cells)
+                bounds = (min(rows_), max(rows_), min(cols_), max(cols_))
+            self._snapshot = (dict(cells), bounds, max_abs_lat)
+            self._built_at = time.monotonic()
+            return self._snapshot
+
+    @staticmethod
+    def _ring(center, r, bounds):
+        """第 r 圈 (切比雪夫距离为 r) 上、落在索引范围内的格子"""
+        ci, cj = center
+        min_i, max_i, min_j, max_j = bounds
+        for i in range(max(ci - r, min_i), min(ci + r, max_i) + 1):
+            if abs(i - ci) == r:
+                for j in range(max(cj - r, min_j), min(cj + r, max_j) + 1):
+                    yield i, j
+            else:
+                for j in (cj - r, cj + r):
+                    if min_j <= j <= max_j:
+                        yield i, j
+
+    def nearest(self, lat, lng, k=10, radius_km=None, hospital_ids=None, level_id=None):
+        """
+        返回 [(距离km, HospitalPoint), ...]，按距离升序
+        hospital_ids: 只在这些医院里找 (如开设了某科室的医院)；level_id: 按等级过滤
+        """
+        cells, bounds, max_abs_lat = self._ensure_built()
+        if not cells or k <= 0:
+            return []
+
+        center = self._cell(lat, lng)
+        # 一格对应的最短地面距离 (经度方向随纬度收缩，取最高纬度做保守估计)
+        max_lat = min(max(max_abs_lat, abs(lat)), 89.0)
+        cell_km = self.CELL_DEG * KM_PER_DEG_LAT * max(math.cos(math.radians(max_lat)), 0.01)
+        min_i, max_i, min_j, max_j = bounds
+        # 查询点在索引范围外时，前面几圈都是空的，直接从第一圈有数据的地方开始
+        first_ring = max(0, min_i - center[0], center[0] - max_i, min_j - center[1], center[1] - max_j)
+        last_ring = max(abs(center[0] - min_i), abs(center[0] - max_i),
+                        abs(center[1] - min_j), abs(center[1] - max_j))
+
+        found = []
+        for r in range(first_ring, last_ring + 1):
+            # 还没扫描的点都在第 r 圈及以外，查询点和目标点都可能在格子边缘，所以至少相隔 r-1 格
+            lower_bound = max(r - 1, 0) * cell_km
+            if radius_km is not None and lower_bound > radius_km:
+                break
+            if len(found) >= k and found[k - 1][0] <= lower_bound:
+                break
+            for cell in self._ring(center, r, bounds):
+                for point in cells.get(cell, ()):
+                    if hospital_ids is not None and point.hospital_id not in hospital_ids:
+                        continue
+                    if level_id is not None and point.level_id != level_id:
+                        continue
+                    distance = haversine_km(lat, lng, point.lat, point.lng)
+                    if radius_km is None or distance <= radius_km:
+                        found.append((distance, point))
+            found.sort(key=lambda item: (item[0], item[1].hospital_id))
+        return found[:k]
+
+
+hospital_index = HospitalSpatialIndex()
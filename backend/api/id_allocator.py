@@ -0,0 +1,71 @@
+# api/id_allocator.py
+"""
+主键号段分配 (staff_id 等手工指定的 IntegerField 主键)
+
+- IdSequence 表每个序列一行，next_value 为下一个未分配的值；
+  取号段时 select_for_update 锁住这一行，一次拿 BLOCK_SIZE 个，事务很短
+- 号段缓存在进程内，同一进程后续的分配不访问数据库；并发的管理员/进程拿到的号段互不重叠，
+  不会撞主键，也不用重试
+- 序列行由迁移创建 (0008_idsequence 按业务表当前最大值 + 1 初始化)，新增序列时同样在迁移里插入；
+  每次取号段也会和最大值比较，其他途径 (SQL 导入、旧代码) 写入的更大 id 不会被重复分配
+- 和数据库自增序列一样不保证连续：进程退出或事务回滚时没用完的号会跳过
+
+在事务里调用且进程缓存不够时，只在调用方的事务里分配刚好需要的数量、不缓存——
+调用方回滚时号段也随之回滚，缓存里不会留下可能被别的进程重新分配的号。
+高并发的入口 (新增员工、批量导入) 应在进入事务之前分配
+"""
+import threading
+
+from django.db import transaction
+from django.db.models import Max
+
+from api.models import IdSequence, Staff
+
+
+class IdBlockAllocator:
+    def __init__(self, name, model, field, block_size=100):
+        self.name = name
+        self.model = model
+        self.field = field
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._next = 0
+        self._limit = 0     # 缓存号段 [_next, _limit)
+
+    def _current_max(self):
+        return self.model.objects.aggregate(max_id=Max(self.field))['max_id'] or 0
+
+    def _reserve(self, count):
+        """从序列表取 [start, start + count)，返回 start"""
+        with transaction.atomic():
+            row = IdSequence.objects.select_for_update().get(pk=self.name)
+            start = max(row.next_value, self._current_max() + 1)
+            IdSequence.objects.filter(pk=self.name).update(next_value=start + count)
+            return start
+
+    def allocate(self, count=1):
+        """分配 count 个 id，返回升序列表 (跨号段时不连续)"""
+        if count <= 0:
+            return []
+        with self._lock:
+            take = min(count, self._limit - self._next)
+            ids = list(range(self._next, self._next + take))
+            self._next += take
+            needed = count - take
+            if needed:
+                if transaction.get_connection().in_atomic_block:
+                    start = self._reserve(needed)
+                else:
+                    size = max(self.block_size, needed)
+                    start = self._reserve(size)
+                    self._next, self._limit = start + needed, start + size
+                ids.extend(range(start, start + needed))
+            return ids
+
+    def reset(self):
+        """丢弃进程内缓存的号段 (测试用)"""
+        with self._lock:
+            self._next = self._limit = 0
+
+
+staff_id_allocator = IdBlockAllocator('Staff.staff_id', Staff, 'staff_id')
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max, Min
+
+from api.models import Staff, staff_category_expression
+
+
+class Command(BaseCommand):
+    help = "Recompute Staff.category from title (after bulk loads or raw SQL imports that bypass Staff.save())"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help="Rows per UPDATE (by staff_id range)")
+        parser.add_argument(
+            '--check', action='store_true',
+            help="Only count rows whose category is out of date; exit non-zero if there are any",
+        )
+
+    def handle(self, *args, **options):
+        expression = staff_category_expression()
+        stale = Staff.objects.exclude(category=expression)
+
+        if options['check']:
+            count = stale.count()
+            if count:
+                raise CommandError(f"{count} staff row(s) have an out-of-date category")
+            self.stdout.write(self.style.SUCCESS("Staff categories are up to date"))
+            return
+
+        batch_size = options['batch_size']
+        if batch_size <= 0:
+            raise CommandError("--batch-size must be positive")
+
+        bounds = Staff.objects.aggregate(low=Min('staff_id'), high=Max('staff_id'))
+        if bounds['low'] is None:
+            self.stdout.write("No staff rows.")
+            return
+
+        updated = 0
+        for start in range(bounds['low'], bounds['high'] + 1, batch_size):
+            # 只更新类别不一致的行；每批一个短事务，不长时间锁表
+            with transaction.atomic():
+                updated += stale.filter(staff_id__gte=start, staff_id__lt=start + batch_size).update(
+                    category=expression)
+        self.stdout.write(self.style.SUCCESS(f"Updated category for {updated} staff row(s)"))
@@ -0,0 +1,93 @@
+import gzip
+import json
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from api.authentication import tokens_for_user
+from api.models import Hospital, UserProfile
+from api.renderers import FastJSONRenderer, MessagePackRenderer, msgpack, orjson
+
+# (名称, 方法, URL, 请求体, 是否需要市政管理员)；{page_size} 由 --page-size 填充
+ENDPOINTS = [
+    ('hospitals.list', 'get', '/api/hospitals/?page_size={page_size}', None, False),
+    ('staffs.list', 'get', '/api/staffs/?page_size={page_size}', None, True),
+    ('hospital_staffs.list', 'get', '/api/hospital_staffs/?page_size={page_size}', None, True),
+    ('department_resources.list', 'get', '/api/department_resources/?page_size={page_size}', None, True),
+    ('events.list', 'get', '/api/events/?page_size={page_size}', None, False),
+    ('hospital_events.list', 'get', '/api/hospital_events/?page_size={page_size}', None, True),
+    ('public.search_hospital', 'post', '/api/public/search_hospital/', {'name': '医院'}, False),
+]
+
+
+def timed(func, repeat):
+    """运行 repeat 次，返回 (最后一次的结果, 耗时中位数 ms)"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return result, statistics.median(timings)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare response encoding on the list endpoints: DRF's stdlib JSON renderer, the orjson renderer "
+        "and MessagePack (when installed), plus gzip size and time (api/renderers.py)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=500, help="Rows per list response")
+        parser.add_argument('--repeat', type=int, default=20, help="Encodings per renderer (median is reported)")
+        parser.add_argument('--json', action='store_true', help="Print results as JSON")
+
+    def handle(self, *args, **options):
+        if not Hospital.objects.exists():
+            raise CommandError("No hospitals; run python manage.py seed --scale N first")
+        renderers = {'json': JSONRenderer()}
+        if orjson is not None:
+            renderers['orjson'] = FastJSONRenderer()
+        if msgpack is not None:
+            renderers['msgpack'] = MessagePackRenderer()
+
+        results = []
+        # 临时的市政管理员在事务里创建，结束时回滚；响应缓存关掉，拿到的都是刚序列化的数据
+        with transaction.atomic(), override_settings(API_RESPONSE_CACHE={'ENABLED': False}):
+            user = User.objects.create_user('benchmark_renderers', password=None)
+            UserProfile.objects.create(user=user, role='city_admin')
+            token = str(tokens_for_user(user).access_token)
+            for name, method, url, body, admin in ENDPOINTS:
+                client = APIClient(SERVER_NAME='localhost')  # ALLOWED_HOSTS 为空时只接受 localhost
+                if admin:
+                    client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+                url = url.format(page_size=options['page_size'])
+                response = getattr(client, method)(url, body, format='json') if body else getattr(client, method)(url)
+                if response.status_code != 200:
+                    raise CommandError(f"{name}: {response.status_code} {url}")
+                data = response.data
+                rows = data.get('results', data.get('data')) if isinstance(data, dict) else data
+                for renderer_name, renderer in renderers.items():
+                    content, encode_ms = timed(lambda: renderer.render(data, renderer.media_type, {}),
+                                               options['repeat'])
+                    compressed, gzip_ms = timed(lambda: gzip.compress(content, 6), options['repeat'])
+                    results.append({
+                        'endpoint': name, 'renderer': renderer_name, 'rows': len(rows),
+                        'encode_ms': encode_ms, 'bytes': len(content),
+                        'gzip_bytes': len(compressed), 'gzip_ms': gzip_ms,
+                    })
+            transaction.set_rollback(True)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(f"{'endpoint':26} {'renderer':8} {'rows':>5} {'encode ms':>10} {'bytes':>9} "
+                          f"{'gzip bytes':>10} {'gzip ms':>8}")
+        for r in results:
+            self.stdout.write(f"{r['endpoint']:26} {r['renderer']:8} {r['rows']:>5} {r['encode_ms']:>10.3f} "
+                              f"{r['bytes']:>9} {r['gzip_bytes']:>10} {r['gzip_ms']:>8.3f}")
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import Hospital
+from api.staff_import import FORMATS, guess_format, import_staff
+
+
+class Command(BaseCommand):
+    help = "Bulk import a staff roster (CSV or NDJSON) into a hospital"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Roster file (.csv / .ndjson)")
+        parser.add_argument('--hospital', type=int, required=True, help="Target hospital_id")
+        parser.add_argument('--format', dest='file_format', choices=FORMATS,
+                            help="File format; guessed from the extension when omitted")
+
+    def handle(self, *args, **options):
+        try:
+            hospital = Hospital.objects.get(pk=options['hospital'])
+        except Hospital.DoesNotExist:
+            raise CommandError(f"Hospital {options['hospital']} does not exist")
+
+        file_format = options['file_format'] or guess_format(options['path'])
+        try:
+            with open(options['path'], 'rb') as fileobj:
+                report = import_staff(hospital, fileobj, file_format)
+        except OSError as exc:
+            raise CommandError(str(exc))
+
+        for error in report.errors:
+            self.stderr.write(f"line {error['line']}: {error['errors']}")
+        if report.failed > len(report.errors):
+            self.stderr.write(f"... {report.failed - len(report.errors)} more error(s) not shown")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported roster: {report.created} created, {report.linked} linked, {report.failed} failed"
+        ))
@@ -0,0 +1,154 @@
+import asyncio
+import json
+import statistics
+import threading
+import time
+
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from api.models import Hospital
+
+MODES = ('sync', 'async')
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))]
+
+
+def build_workload(hospital_ids, total):
+    """公众接口的混合请求：详情 / 科室 / 评分 / 事件 / 搜索 轮流"""
+    templates = [
+        ('GET', '/api/hospitals/{}/', None),
+        ('GET', '/api/hospitals/{}/departments/', None),
+        ('GET', '/api/hospitals/{}/scores/', None),
+        ('GET', '/api/hospitals/{}/events/', None),
+        ('POST', '/api/public/search_hospital/', {'name': '医院'}),
+    ]
+    workload = []
+    for i in range(total):
+        method, path, body = templates[i % len(templates)]
+        hospital_id = hospital_ids[(i // len(templates)) % len(hospital_ids)]
+        workload.append((method, path.format(hospital_id), json.dumps(body).encode() if body else b''))
+    return workload
+
+
+async def call(app, method, path, body):
+    """直接调用 ASGI 应用 (不经过网络)，返回状态码"""
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': method, 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+        'query_string': b'', 'root_path': '',
+        'headers': [(b'host', b'localhost'), (b'content-type', b'application/json'),
+                    (b'accept', b'application/json')],
+        'client': ('127.0.0.1', 50000), 'server': ('localhost', 80),
+    }
+    pending = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    finished = asyncio.Event()
+    status = []
+
+    async def receive():
+        if pending:
+            return pending.pop()
+        # 客户端不断开：等到响应发完，处理器会取消这个等待
+        await finished.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+        elif message['type'] == 'http.response.body' and not message.get('more_body'):
+            finished.set()
+
+    await app(scope, receive, send)
+    return status[0] if status else None
+
+
+async def run(app, workload, concurrency):
+    latencies = []
+    errors = 0
+    peak_threads = threading.active_count()
+    queue = iter(workload)
+    done = asyncio.Event()
+
+    async def sample_threads():
+        nonlocal peak_threads
+        while not done.is_set():
+            peak_threads = max(peak_threads, threading.active_count())
+            await asyncio.sleep(0.005)
+
+    async def worker():
+        nonlocal errors
+        for method, path, body in queue:
+            started = time.perf_counter()
+            status = await call(app, method, path, body)
+            latencies.append(time.perf_counter() - started)
+            if status != 200:
+                errors += 1
+
+    sampler = asyncio.create_task(sample_threads())
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await sampler
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': len(latencies) / elapsed,
+        'mean_ms': statistics.fmean(latencies) * 1000,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'peak_threads': peak_threads,
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test the anonymous public endpoints through the ASGI application in this process, "
+        "comparing the sync DRF views with the async views (api/views/public_async.py)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000, help="Requests per run")
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 10, 50],
+                            help="Concurrent clients (several values run several rounds)")
+        parser.add_argument('--mode', choices=MODES + ('both',), default='both')
+        parser.add_argument('--hospitals', type=int, default=20, help="Spread requests over the first N hospitals")
+        parser.add_argument('--cache', action='store_true',
+                            help="Keep the response cache on (default off, so every request hits the database)")
+        parser.add_argument('--json', action='store_true', help="Print results as JSON")
+
+    def handle(self, *args, **options):
+        from backend.asgi import AsyncRoutesRequest
+
+        hospital_ids = list(Hospital.objects.order_by('pk').values_list('pk', flat=True)[:options['hospitals']])
+        if not hospital_ids:
+            raise CommandError("No hospitals; run python manage.py seed --scale N first")
+        workload = build_workload(hospital_ids, options['requests'])
+
+        apps = {'sync': ASGIHandler(), 'async': ASGIHandler()}
+        apps['async'].request_class = AsyncRoutesRequest
+        modes = MODES if options['mode'] == 'both' else (options['mode'],)
+
+        results = []
+        with override_settings(API_RESPONSE_CACHE={'ENABLED': options['cache']}):
+            for concurrency in options['concurrency']:
+                for mode in modes:
+                    # 预热：加载 URL 配置、建立连接
+                    asyncio.run(run(apps[mode], workload[:20], 1))
+                    result = asyncio.run(run(apps[mode], workload, concurrency))
+                    results.append(dict(result, mode=mode, concurrency=concurrency))
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(f"{'mode':6} {'conc':>5} {'reqs':>6} {'errors':>6} {'req/s':>8} "
+                          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'threads':>7}")
+        for r in results:
+            self.stdout.write(f"{r['mode']:6} {r['concurrency']:>5} {r['requests']:>6} {r['errors']:>6} "
+                              f"{r['rps']:>8.1f} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f} "
+                              f"{r['peak_threads']:>7}")
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.summary import check_city_summary, rebuild_city_summary, SUMMARY_FIELDS
+
+
+class Command(BaseCommand):
+    help = "Rebuild the CitySummary dashboard table from scratch, or check it against live aggregates"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help="Only compare the stored summary with live aggregates; exit non-zero on mismatch",
+        )
+
+    def handle(self, *args, **options):
+        if options['check']:
+            diff = check_city_summary()
+            if diff is None:
+                raise CommandError("CitySummary has not been built yet, run without --check first")
+            if diff:
+                for name, (stored, actual) in diff.items():
+                    self.stderr.write(f"{name}: stored={stored} actual={actual}")
+                raise CommandError(f"CitySummary is inconsistent ({len(diff)} field(s))")
+            self.stdout.write(self.style.SUCCESS("CitySummary is consistent"))
+            return
+
+        summary = rebuild_city_summary()
+        for name in SUMMARY_FIELDS:
+            self.stdout.write(f"{name}: {getattr(summary, name)}")
+        self.stdout.write(self.style.SUCCESS("CitySummary rebuilt successfully!"))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from api.search import SEARCH_TARGETS, rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the bigram search index (SearchToken) for hospitals, departments and staff"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--kind', action='append', choices=sorted(SEARCH_TARGETS),
+            help="Only rebuild the given kind (can be repeated); defaults to all",
+        )
+
+    def handle(self, *args, **options):
+        result = rebuild_index(options['kind'])
+        for kind, written in result.items():
+            self.stdout.write(f"{kind}: {written} tokens")
+        self.stdout.write(self.style.SUCCESS("Search index rebuilt successfully!"))
@@ -6,12 +6,44 @@ from api.models import (
     EmergencyEvent, HospitalDepartment, HospitalStaff,
     DepartmentStaff, HospitalEvent
 )
+from api.synthetic import SyntheticDataGenerator, refresh_derived_data
 
 
 class Command(BaseCommand):
-    help = "Inject initial test data into database"
-
-    def handle(self, *args, **kwargs):
+    help = "Inject initial test data into database (--scale N generates a large synthetic dataset)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=int, default=0,
+                            help="Generate synthetic data for N hospitals instead of the fixed sample rows")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed; same seed, same data")
+        parser.add_argument('--staff-per-hospital', type=int, default=200, help="Average staff per hospital")
+        parser.add_argument('--events', type=int, default=None, help="Number of emergency events (default 2*N)")
+        parser.add_argument('--batch-size', type=int, default=5000, help="Rows per bulk_create batch")
+        parser.add_argument('--skip-search-index', action='store_true',
+                            help="Do not rebuild the search index afterwards (run rebuild_search_index later)")
+
+    def handle(self, *args, **options):
+        if options['scale']:
+            return self.generate(options)
+        self.seed_fixed()
+
+    def generate(self, options):
+        generator = SyntheticDataGenerator(
+            hospitals=options['scale'],
+            seed=options['seed'],
+            staff_per_hospital=options['staff_per_hospital'],
+            events=options['events'],
+            batch_size=options['batch_size'],
+            log=self.stdout.write,
+        )
+        written, elapsed = generator.generate()
+        for model, count in written.items():
+            self.stdout.write(f"{model}: {count}")
+        self.stdout.write(f"Inserted {sum(written.values())} rows in {elapsed:.1f}s, refreshing derived data...")
+        refresh_derived_data(search_index=not options['skip_search_index'], log=self.stdout.write)
+        self.stdout.write(self.style.SUCCESS("Synthetic data generated successfully!"))
+
+    def seed_fixed(self):
         # -----------------------------
         # 1. District
         # -----------------------------
@@ -0,0 +1,313 @@
+# api/metrics.py
+"""
+接口级性能指标：按路由 (视图类.action) 统计请求耗时、SQL 次数/耗时、响应大小
+
+- MetricsMiddleware 负责采集；settings.API_METRICS['ENABLED'] = False 时中间件直接卸载 (MiddlewareNotUsed)，
+  请求路径上没有任何额外开销
+- 路由标签取 DRF 视图类名 + action (如 HospitalViewSet.list)，不用原始 URL，避免 /hospitals/<id>/ 把标签撑爆
+- SQL 统计用 connection.execute_wrapper，只计数和计时，不记录 SQL 文本；
+  当前请求的计数器放在 ContextVar 里，ASGI 下同步视图在线程池里执行 SQL 也能计到对应请求上
+- 数据存在进程内 (和响应缓存命中计数一样)，多进程部署时由 Prometheus 分别抓取各进程再聚合
+- GET /api/metrics  Prometheus 文本格式，仅管理员可访问 (见 MetricsView)
+"""
+import bisect
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.signals import request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse
+from rest_framework.permissions import IsAdminUser
+from rest_framework.views import APIView
+
+from api.permission import IsCityAdmin
+from api.response_cache import get_cache_stats
+
+DEFAULTS = {
+    'ENABLED': True,
+    # 秒
+    'LATENCY_BUCKETS': (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+    'QUERY_BUCKETS': (0, 1, 2, 5, 10, 20, 50, 100, 200, 500),
+    # 字节
+    'SIZE_BUCKETS': (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304),
+}
+
+
+def get_metrics_setting(name):
+    return getattr(settings, 'API_METRICS', {}).get(name, DEFAULTS[name])
+
+
+class Histogram:
+    """累计直方图 (Prometheus 语义：le 桶 + sum + count)"""
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)    # 最后一个是 +Inf
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            yield bound, total
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = defaultdict(int)                # (route, method, status) -> 次数
+            self.latency = {}                               # (route, method) -> Histogram
+            self.queries = {}                               # (route, method) -> Histogram
+            self.db_seconds = defaultdict(float)            # (route, method) -> SQL 总耗时
+            self.response_size = {}                         # (route, method) -> Histogram
+
+    def observe(self, route, method, status, seconds, query_count, db_seconds, size):
+        key = (route, method)
+        status_class = f'{status // 100}xx'
+        with self._lock:
+            self.requests[(route, method, status_class)] += 1
+            if key not in self.latency:
+                self.latency[key] = Histogram(get_metrics_setting('LATENCY_BUCKETS'))
+                self.queries[key] = Histogram(get_metrics_setting('QUERY_BUCKETS'))
+                self.response_size[key] = Histogram(get_metrics_setting('SIZE_BUCKETS'))
+            self.latency[key].observe(seconds)
+            self.queries[key].observe(query_count)
+            self.db_seconds[key] += db_seconds
+            if size is not None:
+                self.response_size[key].observe(size)
+
+    def render(self):
+        """Prometheus 文本格式 (version 0.0.4)"""
+        lines = []
+        with self._lock:
+            lines += [
+                '# HELP api_requests_total Requests handled, by route, method and status class.',
+                '# TYPE api_requests_total counter',
+            ]
+            for (route, method, status_class), count in sorted(self.requests.items()):
+                lines.append(f'api_requests_total{_labels(route=route, method=method, status=status_class)} {count}')
+
+            _render_histogram(lines, 'api_request_duration_seconds',
+                              'Request latency in seconds, measured in the middleware.', self.latency)
+            _render_histogram(lines, 'api_request_db_queries',
+                              'SQL queries executed per request.', self.queries)
+
+            lines += [
+                '# HELP api_request_db_seconds_total Time spent in SQL queries.',
+                '# TYPE api_request_db_seconds_total counter',
+            ]
+            for (route, method), seconds in sorted(self.db_seconds.items()):
+                lines.append(f'api_request_db_seconds_total{_labels(route=route, method=method)} {seconds:.6f}')
+
+            _render_histogram(lines, 'api_response_size_bytes',
+                              'Response body size in bytes.', self.response_size)
+
+        lines += [
+            '# HELP api_response_cache_total Response cache lookups (api/response_cache.py).',
+            '# TYPE api_response_cache_total counter',
+        ]
+        for endpoint, counts in sorted(get_cache_stats().items()):
+            for result in ('hit', 'miss'):
+                lines.append(f'api_response_cache_total{_labels(endpoint=endpoint, result=result)} {counts[result]}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _format_value(value):
+    return f'{value:.6f}' if isinstance(value, float) else str(value)
+
+
+def _format_bound(bound):
+    return '+Inf' if bound == float('inf') else str(bound)
+
+
+def _render_histogram(lines, name, help_text, histograms):
+    lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+    for (route, method), histogram in sorted(histograms.items()):
+        if not histogram.count:
+            continue
+        for bound, total in histogram.cumulative():
+            lines.append(f'{name}_bucket{_labels(route=route, method=method, le=_format_bound(bound))} {total}')
+        lines.append(f'{name}_sum{_labels(route=route, method=method)} {_format_value(histogram.sum)}')
+        lines.append(f'{name}_count{_labels(route=route, method=method)} {histogram.count}')
+
+
+registry = MetricsRegistry()
+
+
+class _QueryRecorder:
+    """当前请求的 SQL 计数和耗时"""
+    __slots__ = ('count', 'seconds')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+
+_active_recorder = ContextVar('api_metrics_recorder', default=None)
+
+
+def _record_query(execute, sql, params, many, context):
+    """常驻在每个连接的 execute_wrappers 里，不在请求内 (管理命令等) 时直接执行"""
+    recorder = _active_recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        recorder.seconds += time.perf_counter() - started
+        recorder.count += 1
+
+
+def _install_recorder(sender=None, connection=None, **kwargs):
+    # 连接对象按线程创建：request_started 在处理请求的线程里执行 (ASGI 下和同步视图同一个线程)，
+    # 给这个线程的所有连接装上；connection_created 兜底请求之外新建的连接。已装过的不重复添加
+    for target in [connection] if connection is not None else connections.all():
+        if _record_query not in target.execute_wrappers:
+            target.execute_wrappers.append(_record_query)
+
+
+def resolve_route(request):
+    """DRF 视图 -> 视图类.action；其他 Django 视图 -> URL 名称；未匹配 -> unmatched"""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    view_class = getattr(match.func, 'cls', None)
+    if view_class is not None:
+        actions = getattr(match.func, 'actions', None) or {}
+        action = actions.get(request.method.lower())
+        return f'{view_class.__name__}.{action}' if action else view_class.__name__
+    return match.view_name or match.func.__name__
+
+
+class MetricsMiddleware:
+    """
+    放在 MIDDLEWARE 最前面，耗时覆盖整个中间件链。
+    流式响应 (导出、事件推送) 的耗时、SQL 和大小在响应体发送完之后才记录。
+    同时支持 WSGI 和 ASGI，ASGI 下不会把整个中间件链切到线程里执行
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not get_metrics_setting('ENABLED'):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        request_started.connect(_install_recorder, dispatch_uid='api_metrics_recorder')
+        connection_created.connect(_install_recorder, dispatch_uid='api_metrics_recorder_connection')
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder = _QueryRecorder()
+        started = time.perf_counter()
+        token = _active_recorder.set(recorder)
+        try:
+            response = self.get_response(request)
+        finally:
+            _active_recorder.reset(token)
+        return self._observe(request, response, recorder, started)
+
+    async def __acall__(self, request):
+        recorder = _QueryRecorder()
+        started = time.perf_counter()
+        # sync_to_async 会复制当前 context，线程里执行的 SQL 也计到这个 recorder 上
+        token = _active_recorder.set(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _active_recorder.reset(token)
+        return self._observe(request, response, recorder, started)
+
+    def _observe(self, request, response, recorder, started):
+        route = resolve_route(request)
+        if response.streaming:
+            observe = self._observe_async_stream if response.is_async else self._observe_stream
+            response.streaming_content = observe(
+                response.streaming_content, recorder, started, route, request.method, response.status_code)
+        else:
+            registry.observe(route, request.method, response.status_code, time.perf_counter() - started,
+                             recorder.count, recorder.seconds, len(response.content))
+        return response
+
+    # 流式响应体在中间件返回之后才被服务器迭代，每取一块都重新挂上 recorder
+
+    @staticmethod
+    def _observe_stream(content, recorder, started, route, method, status):
+        size = 0
+        iterator = iter(content)
+        try:
+            while True:
+                token = _active_recorder.set(recorder)
+                try:
+                    chunk = next(iterator)
+                except StopIteration:
+                    break
+                finally:
+                    _active_recorder.reset(token)
+                size += len(chunk)
+                yield chunk
+        finally:
+            if hasattr(iterator, 'close'):
+                iterator.close()
+            registry.observe(route, method, status, time.perf_counter() - started,
+                             recorder.count, recorder.seconds, size)
+
+    @staticmethod
+    async def _observe_async_stream(content, recorder, started, route, method, status):
+        size = 0
+        iterator = aiter(content)
+        try:
+            while True:
+                token = _active_recorder.set(recorder)
+                try:
+                    chunk = await anext(iterator)
+                except StopAsyncIteration:
+                    break
+                finally:
+                    _active_recorder.reset(token)
+                size += len(chunk)
+                yield chunk
+        finally:
+            # 客户端断开时把关闭传给里面的生成器 (事件推送在那里退订)
+            if hasattr(iterator, 'aclose'):
+                await iterator.aclose()
+            registry.observe(route, method, status, time.perf_counter() - started,
+                             recorder.count, recorder.seconds, size)
+
+
+class MetricsView(APIView):
+    """
+    GET /api/metrics  Prometheus 抓取入口 (仅市政管理员 / Django 超级管理员，带 JWT 访问)
+    """
+    permission_classes = [IsCityAdmin | IsAdminUser]
+
+    def get(self, request):
+        return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_departmentresource_hospital_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CitySummary',
+            fields=[
+                ('id', models.PositiveSmallIntegerField(default=1, primary_key=True, serialize=False)),
+                ('total_hospitals', models.BigIntegerField(default=0)),
+                ('total_dept_types', models.BigIntegerField(default=0)),
+                ('total_beds', models.BigIntegerField(default=0)),
+                ('total_rooms', models.BigIntegerField(default=0)),
+                ('total_devices', models.BigIntegerField(default=0)),
+                ('icu_beds', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'CitySummary',
+            },
+        ),
+        migrations.AddField(
+            model_name='hospital',
+            name='introduction',
+            field=models.TextField(blank=True, null=True, verbose_name='医院简介'),
+        ),
+        migrations.AddField(
+            model_name='hospital',
+            name='phone',
+            field=models.CharField(blank=True, max_length=50, null=True),
+        ),
+        migrations.AlterField(
+            model_name='emergencyevent',
+            name='event_id',
+            field=models.AutoField(primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='emergencyevent',
+            name='severity',
+            field=models.CharField(blank=True, choices=[('一般', '一般 (IV级)'), ('较大', '较大 (III级)'), ('重大', '重大 (II级)'), ('特别重大', '特别重大 (I级)')], default='一般', max_length=50, null=True),
+        ),
+        migrations.AlterField(
+            model_name='hospital',
+            name='hospital_id',
+            field=models.AutoField(primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='hospitalevent',
+            name='event',
+            field=models.ForeignKey(db_column='event_id', on_delete=django.db.models.deletion.CASCADE, related_name='hospital_participations', to='api.emergencyevent'),
+        ),
+        migrations.AlterField(
+            model_name='hospitalevent',
+            name='role',
+            field=models.CharField(choices=[('primary', '主责医院'), ('support', '支援医院'), ('reporting', '报告医院'), ('transfer', '转诊医院'), ('screening', '排查医院')], default='reporting', max_length=20),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:09
+
+from collections import Counter
+
+from django.db import migrations, models
+
+# 和 api.search.SEARCH_TARGETS 相同；迁移里固定下来，不引用以后会变的应用代码
+SEARCH_TARGETS = {
+    'hospital': ('Hospital', ('name', 'address')),
+    'department': ('Department', ('dept_name',)),
+    'staff': ('Staff', ('name',)),
+}
+BATCH_SIZE = 1000
+
+
+def tokenize(text):
+    # 同 api.search.tokenize：相邻两字 + 末字
+    text = (text or '').strip().lower()
+    if not text:
+        return Counter()
+    tokens = Counter(text[i:i + 2] for i in range(len(text) - 1))
+    tokens[text[-1]] += 1
+    return tokens
+
+
+def build_search_index(apps, schema_editor):
+    # 给已有的医院/科室/员工建索引，升级后 ?keyword= / mode=index 立即可用；之后由 api/signals.py 维护
+    SearchToken = apps.get_model('api', 'SearchToken')
+    for kind, (model_name, fields) in SEARCH_TARGETS.items():
+        model = apps.get_model('api', model_name)
+        batch = []
+        for obj in model.objects.only('pk', *fields).iterator(chunk_size=BATCH_SIZE):
+            batch.extend(
+                SearchToken(kind=kind, object_id=obj.pk, field=field, token=token, occurrences=n)
+                for field in fields
+                for token, n in tokenize(getattr(obj, field)).items()
+            )
+            if len(batch) >= BATCH_SIZE:
+                SearchToken.objects.bulk_create(batch)
+                batch = []
+        SearchToken.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_citysummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('hospital', '医院'), ('department', '科室'), ('staff', '医护人员')], max_length=20)),
+                ('token', models.CharField(max_length=2)),
+                ('object_id', models.IntegerField()),
+                ('field', models.CharField(max_length=50)),
+                ('occurrences', models.PositiveIntegerField(default=1)),
+            ],
+            options={
+                'db_table': 'SearchToken',
+                'indexes': [models.Index(fields=['kind', 'token', 'object_id'], name='searchtoken_lookup_idx')],
+                'unique_together': {('kind', 'object_id', 'field', 'token')},
+            },
+        ),
+        migrations.RunPython(build_search_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:21
+
+from django.db import migrations, models
+
+
+def backfill_category(apps, schema_editor):
+    # 和 api.models.staff_category 规则一致；迁移里不引用模型模块的代码
+    Staff = apps.get_model('api', 'Staff')
+    Staff.objects.update(category=models.Case(
+        models.When(title__contains='医', then=models.Value('doctor')),
+        models.When(title__contains='护', then=models.Value('nurse')),
+        default=models.Value('other'),
+        output_field=models.CharField(),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_tableversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='staff',
+            name='category',
+            field=models.CharField(choices=[('doctor', '医生'), ('nurse', '护士'), ('other', '其他')], db_index=True, default='other', editable=False, max_length=10),
+        ),
+        migrations.RunPython(backfill_category, migrations.RunPython.noop),
+    ]
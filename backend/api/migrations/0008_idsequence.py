@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:23
+
+from django.db import migrations, models
+
+
+def seed_sequences(apps, schema_editor):
+    # 和 api.id_allocator.staff_id_allocator 的序列名一致；从现有员工的最大 staff_id 之后开始分配
+    Staff = apps.get_model('api', 'Staff')
+    IdSequence = apps.get_model('api', 'IdSequence')
+    max_id = Staff.objects.aggregate(max_id=models.Max('staff_id'))['max_id'] or 0
+    IdSequence.objects.update_or_create(name='Staff.staff_id', defaults={'next_value': max_id + 1})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_staff_category'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdSequence',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('next_value', models.BigIntegerField()),
+            ],
+            options={
+                'db_table': 'IdSequence',
+            },
+        ),
+        migrations.RunPython(seed_sequences, migrations.RunPython.noop),
+    ]
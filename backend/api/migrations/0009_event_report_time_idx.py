@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_idsequence'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='emergencyevent',
+            index=models.Index(fields=['report_time'], name='event_report_time_idx'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:56
+
+import logging
+
+from django.db import migrations, models
+
+
+RESOURCE_FIELDS = ('bed_count', 'device_count', 'daily_capacity')
+
+logger = logging.getLogger(__name__)
+
+
+def merge_duplicate_resources(apps, schema_editor):
+    """
+    历史数据里同一 (hospital, dept) 可能有多条：合并到最早的一条 (原批量 upsert 更新的也是它)，
+    每个字段取最后写入 (主键最大) 的非空值，其余行删除；合并前后的值写到日志里
+    """
+    DepartmentResource = apps.get_model('api', 'DepartmentResource')
+    duplicates = (DepartmentResource.objects.values('hospital_id', 'dept_id')
+                  .annotate(count=models.Count('dept_res_id'))
+                  .filter(count__gt=1))
+    merged = False
+    for group in duplicates:
+        rows = list(DepartmentResource.objects.filter(
+            hospital_id=group['hospital_id'], dept_id=group['dept_id']).order_by('dept_res_id'))
+        keep, extra = rows[0], rows[1:]
+        for field in RESOURCE_FIELDS:
+            values = [getattr(row, field) for row in rows if getattr(row, field) is not None]
+            setattr(keep, field, values[-1] if values else None)
+        logger.warning(
+            'DepartmentResource hospital=%s dept=%s: merged rows %s into %s -> %s',
+            group['hospital_id'], group['dept_id'],
+            [(row.pk, *(getattr(row, field) for field in RESOURCE_FIELDS)) for row in rows],
+            keep.pk, {field: getattr(keep, field) for field in RESOURCE_FIELDS})
+        DepartmentResource.objects.filter(pk__in=[row.pk for row in extra]).delete()
+        keep.save(update_fields=RESOURCE_FIELDS)
+        merged = True
+    if merged:
+        # 迁移里不发信号：删掉全市汇总行，首次读取时全量重建
+        apps.get_model('api', 'CitySummary').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_event_report_time_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_resources, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='departmentresource',
+            constraint=models.UniqueConstraint(fields=('hospital', 'dept'), name='dept_resource_hospital_dept_uniq'),
+        ),
+    ]
@@ -1,7 +1,7 @@
 from django.db import models
 
 # Create your models here.
-from django.db import models
+from django.db import models, router, transaction
 from django.contrib.auth.models import User
 
 
@@ -24,6 +24,20 @@ class UserProfile(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.get_role_display()}"
 
+class SummarySourceModel(models.Model):
+    """
+    参与全市汇总 (CitySummary) 的表：save() 包在事务里，pre_save 用 select_for_update 读旧值
+    (见 api/signals.py)，并发修改同一行时排队执行，增量按真实的旧值计算
+    """
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            super().save(*args, **kwargs)
+
+
 # 1. District（行政区）
 class District(models.Model):
     district_id = models.IntegerField(primary_key=True)
@@ -44,7 +58,7 @@ class HospitalLevel(models.Model):
 
 
 # 3. Hospital（医院）
-class Hospital(models.Model):
+class Hospital(SummarySourceModel):
     hospital_id = models.AutoField(primary_key=True)
     name = models.CharField(max_length=200)
     address = models.CharField(max_length=300, null=True, blank=True)
@@ -63,7 +77,7 @@ class Hospital(models.Model):
 
 
 # 4. Department（科室）
-class Department(models.Model):
+class Department(SummarySourceModel):
     dept_id = models.IntegerField(primary_key=True)
     dept_name = models.CharField(max_length=200)
     standard_code = models.CharField(max_length=50, null=True, blank=True)
@@ -73,7 +87,7 @@ class Department(models.Model):
 
 
 # 5. DepartmentResource（科室资源）
-class DepartmentResource(models.Model):
+class DepartmentResource(SummarySourceModel):
     dept_res_id = models.AutoField(primary_key=True)
 
     # ✅✅✅ 必须补上下面这一行！否则没法区分这是哪家医院的资源
@@ -86,9 +100,40 @@ class DepartmentResource(models.Model):
 
     class Meta:
         db_table = 'DepartmentResource'
+        # 每家医院的每个科室只有一条资源记录 (批量 upsert 按它做 ON DUPLICATE KEY UPDATE)
+        constraints = [
+            models.UniqueConstraint(fields=['hospital', 'dept'], name='dept_resource_hospital_dept_uniq'),
+        ]
 
 
 # 6. Staff（医护人员）
+# 人员类别：由职称推导 (职称含"医"为医生，否则含"护"为护士，其余为其他)，
+# 存成带索引的列，统计时按类别分组，不再对 title 做 LIKE '%医%' 全表扫描
+STAFF_CATEGORY_CHOICES = (
+    ('doctor', '医生'),
+    ('nurse', '护士'),
+    ('other', '其他'),
+)
+STAFF_CATEGORY_RULES = (('doctor', '医'), ('nurse', '护'))
+
+
+def staff_category(title):
+    for category, keyword in STAFF_CATEGORY_RULES:
+        if title and keyword in title:
+            return category
+    return 'other'
+
+
+def staff_category_expression():
+    """和 staff_category() 等价的 SQL 表达式，用于批量回填 (QuerySet.update)"""
+    return models.Case(
+        *[models.When(title__contains=keyword, then=models.Value(category))
+          for category, keyword in STAFF_CATEGORY_RULES],
+        default=models.Value('other'),
+        output_field=models.CharField(),
+    )
+
+
 class Staff(models.Model):
     staff_id = models.IntegerField(primary_key=True)
     name = models.CharField(max_length=200)
@@ -96,10 +141,21 @@ class Staff(models.Model):
     title = models.CharField(max_length=100, null=True, blank=True)
     phone = models.CharField(max_length=50, null=True, blank=True)
     hire_date = models.DateField(null=True, blank=True)
+    # 保存时由 title 推导，不接受接口直接写入；bulk_create / update 绕过 save()，
+    # 需要自己赋值或事后执行 backfill_staff_category
+    category = models.CharField(max_length=10, choices=STAFF_CATEGORY_CHOICES, default='other',
+                                db_index=True, editable=False)
 
     class Meta:
         db_table = 'Staff'
 
+    def save(self, *args, **kwargs):
+        self.category = staff_category(self.title)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'title' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'category'}
+        super().save(*args, **kwargs)
+
 
 # 7. HospitalServiceScore（医院评分）
 class HospitalServiceScore(models.Model):
@@ -138,6 +194,10 @@ class EmergencyEvent(models.Model):
 
     class Meta:
         db_table = 'EmergencyEvent'
+        indexes = [
+            # 列表按时间倒序翻页、analytics 按时间范围统计
+            models.Index(fields=['report_time'], name='event_report_time_idx'),
+        ]
 
 
 
@@ -146,7 +206,7 @@ class EmergencyEvent(models.Model):
 # ========================================================
 
 # 9. HospitalDepartment（医院开设科室）
-class HospitalDepartment(models.Model):
+class HospitalDepartment(SummarySourceModel):
     hospital = models.ForeignKey(Hospital, on_delete=models.CASCADE, db_column='hospital_id')
     dept = models.ForeignKey(Department, on_delete=models.CASCADE, db_column='dept_id')
     floor = models.CharField(max_length=50, null=True, blank=True)
@@ -198,4 +258,67 @@ class HospitalEvent(models.Model):
 
     class Meta:
         db_table = 'HospitalEvent'
-        unique_together = (('hospital', 'event'),)
\ No newline at end of file
+        unique_together = (('hospital', 'event'),)
+
+# ========================================================
+#   汇总 / 物化表
+# ========================================================
+
+# 13. CitySummary（全市资源汇总，只有一行，由 api/signals.py 增量维护）
+class CitySummary(models.Model):
+    SINGLETON_ID = 1
+
+    id = models.PositiveSmallIntegerField(primary_key=True, default=SINGLETON_ID)
+    total_hospitals = models.BigIntegerField(default=0)
+    total_dept_types = models.BigIntegerField(default=0)
+    total_beds = models.BigIntegerField(default=0)
+    total_rooms = models.BigIntegerField(default=0)
+    total_devices = models.BigIntegerField(default=0)
+    icu_beds = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'CitySummary'
+
+
+# 14. SearchToken（中文二元组倒排索引，由 api/signals.py 在写入时维护，见 api/search.py）
+class SearchToken(models.Model):
+    KIND_CHOICES = (
+        ('hospital', '医院'),
+        ('department', '科室'),
+        ('staff', '医护人员'),
+    )
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    token = models.CharField(max_length=2)
+    object_id = models.IntegerField()
+    field = models.CharField(max_length=50)
+    # token 在该字段中出现的次数
+    occurrences = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        db_table = 'SearchToken'
+        unique_together = (('kind', 'object_id', 'field', 'token'),)
+        indexes = [
+            models.Index(fields=['kind', 'token', 'object_id'], name='searchtoken_lookup_idx'),
+        ]
+
+
+# 15. TableVersion（每张表的写入版本号，用于 ETag / Last-Modified，见 api/versioning.py）
+class TableVersion(models.Model):
+    table = models.CharField(max_length=100, primary_key=True)
+    version = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'TableVersion'
+
+
+# 16. IdSequence（主键号段分配，见 api/id_allocator.py）
+class IdSequence(models.Model):
+    name = models.CharField(max_length=50, primary_key=True)
+    # 下一个未分配的值
+    next_value = models.BigIntegerField()
+
+    class Meta:
+        db_table = 'IdSequence'
@@ -0,0 +1,245 @@
+# api/pagination.py
+"""
+全局 keyset (游标) 分页
+
+和 OFFSET 分页不同，这里记住的是"上一页最后一行的排序键"，下一页直接
+WHERE (sort_key, pk) > (last_sort_key, last_pk)，命中索引，翻到第几万页耗时也不变。
+
+- 排序键：默认主键；视图可以声明 keyset_ordering = ('-report_time',) 之类的稳定排序键，
+  主键会自动追加在最后作为唯一的决胜字段。
+- 游标：base64 编码的 JSON，对前端不透明，原样回传即可。
+- 页大小：?page_size=，上限由 settings.API_PAGINATION['MAX_PAGE_SIZE'] 控制。
+- 总数：默认不算 (COUNT(*) 在大表上很贵)，传 ?with_count=1 才返回 count。
+
+为了不影响现有前端，默认只有请求里带了 cursor 或 page_size 才分页，
+settings.API_PAGINATION['ALWAYS'] = True 可以强制所有列表接口分页。
+"""
+import base64
+import binascii
+import json
+from collections import OrderedDict
+from datetime import date, datetime, time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+DEFAULTS = {
+    'ALWAYS': False,        # True: 不带参数的列表请求也分页
+    'PAGE_SIZE': 50,        # 默认页大小
+    'MAX_PAGE_SIZE': 500,   # 客户端能请求的最大页大小
+}
+
+
+def get_pagination_setting(name):
+    return getattr(settings, 'API_PAGINATION', {}).get(name, DEFAULTS[name])
+
+
+def _encode_value(value):
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+class KeysetPagination(BasePagination):
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    count_query_param = 'with_count'
+    invalid_cursor_message = '无效的分页游标'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.is_enabled(request):
+            return None
+
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.fields = self.get_ordering(queryset, view)
+
+        self.count = None
+        if self.wants_count(request):
+            self.count = queryset.count()
+
+        cursor = self.decode_cursor(request)
+        reverse = bool(cursor and cursor['r'])
+        qs = queryset.order_by(*self.get_order_by(reverse))
+        if cursor is not None:
+            qs = qs.filter(self.build_keyset_filter(cursor['v'], reverse))
+
+        # 多取一条，用来判断这个方向上还有没有下一页
+        rows = list(qs[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+        self.page = rows
+
+        if reverse:
+            self.has_next = cursor is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = cursor is not None
+        return self.page
+
+    def get_paginated_response(self, data):
+        payload = OrderedDict()
+        if self.count is not None:
+            payload['count'] = self.count
+        payload['next'] = self.get_next_link()
+        payload['previous'] = self.get_previous_link()
+        payload['results'] = data
+        return Response(payload)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'count': {'type': 'integer', 'description': 'with_count=1 时返回'},
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {'name': self.cursor_query_param, 'required': False, 'in': 'query',
+             'description': '分页游标', 'schema': {'type': 'string'}},
+            {'name': self.page_size_query_param, 'required': False, 'in': 'query',
+             'description': '每页条数', 'schema': {'type': 'integer'}},
+            {'name': self.count_query_param, 'required': False, 'in': 'query',
+             'description': '是否返回总数', 'schema': {'type': 'boolean'}},
+        ]
+
+    # --- 参数解析 ---
+
+    def is_enabled(self, request):
+        if get_pagination_setting('ALWAYS'):
+            return True
+        params = request.query_params
+        return self.cursor_query_param in params or self.page_size_query_param in params
+
+    def get_page_size(self, request):
+        max_page_size = get_pagination_setting('MAX_PAGE_SIZE')
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            size = get_pagination_setting('PAGE_SIZE')
+        return max(1, min(size, max_page_size))
+
+    def wants_count(self, request):
+        return request.query_params.get(self.count_query_param, '').lower() in ('1', 'true', 'yes')
+
+    def get_ordering(self, queryset, view):
+        """
+        返回 [(model_field, descending), ...]，最后一项一定是主键
+        """
+        model = queryset.model
+        pk = model._meta.pk
+        ordering = getattr(view, 'keyset_ordering', None) or ()
+        fields = []
+        for item in ordering:
+            descending = item.startswith('-')
+            name = item.lstrip('-')
+            assert '__' not in name, 'keyset_ordering 只能使用本表字段'
+            field = pk if name == 'pk' else model._meta.get_field(name)
+            fields.append((field, descending))
+        if not any(field is pk for field, _ in fields):
+            # 主键方向跟随第一个排序键，这样 (report_time DESC, event_id DESC) 可以用同一个索引倒序扫描
+            fields.append((pk, fields[0][1] if fields else False))
+        return fields
+
+    def get_order_by(self, reverse):
+        # NULL 统一视为最小值，保证 MySQL / SQLite / PostgreSQL 上顺序一致
+        order_by = []
+        for field, descending in self.fields:
+            if descending != reverse:
+                order_by.append(F(field.attname).desc(nulls_last=True))
+            else:
+                order_by.append(F(field.attname).asc(nulls_first=True))
+        return order_by
+
+    # --- keyset 条件 ---
+
+    def build_keyset_filter(self, values, reverse):
+        """
+        (a, b, pk) > (va, vb, vpk) 展开为
+        a > va OR (a = va AND (b > vb OR (b = vb AND pk > vpk)))
+        """
+        condition = None
+        for (field, descending), value in reversed(list(zip(self.fields, values))):
+            after = self._after(field, value, descending != reverse)
+            if condition is None:
+                condition = after
+            else:
+                condition = after | (self._equal(field, value) & condition)
+        return condition
+
+    @staticmethod
+    def _equal(field, value):
+        if value is None:
+            return Q(**{field.attname + '__isnull': True})
+        return Q(**{field.attname: value})
+
+    @staticmethod
+    def _after(field, value, descending):
+        name = field.attname
+        if descending:
+            if value is None:
+                return Q(pk__in=[])
+            q = Q(**{name + '__lt': value})
+            if field.null:
+                q |= Q(**{name + '__isnull': True})
+            return q
+        if value is None:
+            return Q(**{name + '__isnull': False})
+        return Q(**{name + '__gt': value})
+
+    # --- 游标编解码 ---
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            padded = encoded + '=' * (-len(encoded) % 4)
+            data = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+            raw_values = data['v']
+            if len(raw_values) != len(self.fields):
+                raise ValueError
+            values = [
+                None if raw is None else field.to_python(raw)
+                for (field, _), raw in zip(self.fields, raw_values)
+            ]
+            return {'v': values, 'r': bool(data.get('r'))}
+        except (TypeError, ValueError, KeyError, UnicodeEncodeError,
+                binascii.Error, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, instance, reverse):
+        values = [_encode_value(getattr(instance, field.attname)) for field, _ in self.fields]
+        payload = json.dumps({'v': values, 'r': int(reverse)}, separators=(',', ':'))
+        encoded = base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
@@ -1,43 +1,70 @@
 # api/permissions.py
 from rest_framework import permissions
+from rest_framework.exceptions import PermissionDenied
+
+from api.models import Hospital, Staff
+
+
+def get_role(user):
+    """
+    当前用户的角色。JWT 认证的 TokenPrincipal 直接读 token 声明 (不查库)，
+    旧 token 认证出来的 User 读 profile；没有档案 / 未登录返回 None
+    """
+    if user is None or not user.is_authenticated:
+        return None
+    profile = getattr(user, 'profile', None)
+    return profile.role if profile is not None else None
+
+
+def get_hospital_id(user):
+    """医院管理员所属医院的 id (只读 id，不加载 Hospital)"""
+    if user is None or not user.is_authenticated:
+        return None
+    profile = getattr(user, 'profile', None)
+    return profile.hospital_id if profile is not None else None
+
+
+def get_admin_hospital(user):
+    """
+    医院管理员所属的医院 (写入时用，查一次库)。
+    token 里的 hospital_id 在医院被删除后仍然存在，没有关联医院或医院已不存在时返回 403
+    """
+    profile = getattr(user, 'profile', None)
+    hospital = profile.hospital if profile is not None else None
+    if hospital is None:
+        raise PermissionDenied("当前账号未关联医院或所属医院已不存在")
+    return hospital
+
 
 class IsCityAdmin(permissions.BasePermission):
     """只允许市政管理员写入，其他人(包括未登录)拒绝"""
     def has_permission(self, request, view):
-        return (request.user.is_authenticated and
-                hasattr(request.user, 'profile') and
-                request.user.profile.role == 'city_admin')
+        return get_role(request.user) == 'city_admin'
 
 class IsHospitalAdmin(permissions.BasePermission):
     """只允许医院管理员操作"""
     def has_permission(self, request, view):
-        return (request.user.is_authenticated and
-                hasattr(request.user, 'profile') and
-                request.user.profile.role == 'hospital_admin')
+        return get_role(request.user) == 'hospital_admin'
 
     def has_object_permission(self, request, view, obj):
-        # 修改/删除时，检查对象是否属于该管理员的医院
-        user_hospital = request.user.profile.hospital
-        # 检查 obj 是否有 hospital 字段，或者 obj 本身就是 Hospital
-        if isinstance(obj, type(user_hospital)):
-            return obj == user_hospital
-        if hasattr(obj, 'hospital'):
-            return obj.hospital == user_hospital
-        # 3. ✅【新增】特殊处理 Staff (医护人员)
+        # 修改/删除时，检查对象是否属于该管理员的医院 (按 id 比较，不加载医院对象)
+        hospital_id = get_hospital_id(request.user)
+        if hospital_id is None:
+            return False
+        if isinstance(obj, Hospital):
+            return obj.pk == hospital_id
+        if hasattr(obj, 'hospital_id'):
+            return obj.hospital_id == hospital_id
         # Staff 与 Hospital 是多对多关系，通过 HospitalStaff 关联
-        #检查该 Staff 是否在当前管理员的医院有任职记录
-        if obj.__class__.__name__ == 'Staff':
-            # 使用反向查询 hospitalstaff_set 检查是否存在关联
-            return obj.hospitalstaff_set.filter(hospital=user_hospital).exists()
+        # 检查该 Staff 是否在当前管理员的医院有任职记录
+        if isinstance(obj, Staff):
+            return obj.hospitalstaff_set.filter(hospital_id=hospital_id).exists()
         return False
 
 class IsCityOrHospitalAdmin(permissions.BasePermission):
     """市政或医院管理员均可（用于某些共有操作，如上报事件）"""
     def has_permission(self, request, view):
-        if not request.user.is_authenticated:
-            return False
-        role = request.user.profile.role
-        return role in ['city_admin', 'hospital_admin']
+        return get_role(request.user) in ['city_admin', 'hospital_admin']
 
 
 class ReadOnly(permissions.BasePermission):
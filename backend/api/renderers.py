@@ -0,0 +1,134 @@
+# api/renderers.py
+"""
+响应编码：更快的 JSON、可选的 MessagePack、大响应 gzip 压缩
+
+- FastJSONRenderer：装了 orjson 时用 orjson 编码，大列表 (医院、员工、带参与医院的事件) 快几倍；
+  输出和 DRF JSONRenderer 逐字节相同 (紧凑分隔符、中文不转义、日期时间/Decimal 交给 DRF 的编码器)，
+  ETag、响应缓存不受影响。两者只在浮点数上有差别：orjson 把 1e16 / 1e-7 写成 1e16 / 1e-7
+  (标准库是 1e+16 / 1e-07)，NaN / Infinity 写成 null (DRF 严格模式下报错)；编码前先检查一遍，
+  有这类浮点数时交给标准库。没装 orjson、要求缩进 (Accept: application/json; indent=4、可视化 API)
+  或 orjson 编码不了的数据时同样回到标准库 json
+- MessagePackRenderer：Accept: application/msgpack 或 ?format=msgpack 时返回 MessagePack，
+  体积更小、客户端解码更快；需要安装 msgpack，没装或 API_RENDERING['MSGPACK'] = False 时
+  不参与内容协商 (ContentNegotiation)
+- CompressionMiddleware：响应体不小于 GZIP_MIN_LENGTH 字节、客户端带 Accept-Encoding: gzip 时压缩
+  (Django GZipMiddleware，带随机填充缓解 BREACH)；SSE 推送不压缩。GZIP_MIN_LENGTH = None 时中间件不加载
+- python manage.py benchmark_renderers 对比各列表接口的编码耗时和体积
+"""
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.middleware.gzip import GZipMiddleware
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # 可选依赖，没装时用标准库 json
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # 可选依赖，没装时不提供 MessagePack
+    msgpack = None
+
+DEFAULTS = {
+    'ORJSON': True,             # 装了 orjson 时使用
+    'MSGPACK': True,            # 装了 msgpack 时参与内容协商
+    'GZIP_MIN_LENGTH': 1024,    # 字节；小响应压缩不划算。None 关闭压缩
+}
+
+
+def get_rendering_setting(name):
+    return getattr(settings, 'API_RENDERING', {}).get(name, DEFAULTS[name])
+
+
+def _orjson_float_differs(data):
+    """
+    data 里有 orjson 和标准库写法不同的浮点数：NaN、Infinity、绝对值 >= 1e16 或 < 1e-4 (标准库用指数形式)。
+    区间内的浮点数两者都输出最短的 repr。大部分值是字符串和整数，先按类型跳过
+    """
+    values = data.values() if isinstance(data, dict) else data
+    for value in values:
+        kind = type(value)
+        if kind is str or kind is int or value is None:
+            continue
+        if kind is float:
+            # NaN 和任何数比较都是 False
+            if value and not 1e-4 <= abs(value) < 1e16:
+                return True
+        elif isinstance(value, (dict, list, tuple)) and _orjson_float_differs(value):
+            return True
+    return False
+
+
+class FastJSONRenderer(JSONRenderer):
+    """settings.REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'] 里替换 DRF 的 JSONRenderer"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if (not self.uses_orjson() or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+                or _orjson_float_differs([data])):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            # 日期时间交给 DRF 的编码器 (毫秒精度、UTC 写成 Z)，和标准库输出一致
+            ret = orjson.dumps(data, default=self.encoder_class().default,
+                               option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # orjson 处理不了的数据 (超过 64 位的整数等)
+            return super().render(data, accepted_media_type, renderer_context)
+        # 和 DRF 一样转义 U+2028 / U+2029
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+    def uses_orjson(self):
+        # 项目改了 UNICODE_JSON / COMPACT_JSON 时输出格式不同，交给标准库
+        return orjson is not None and get_rendering_setting('ORJSON') and not self.ensure_ascii and self.compact
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    @classmethod
+    def is_available(cls):
+        return msgpack is not None and get_rendering_setting('MSGPACK')
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        # 日期时间、Decimal 等按 JSON 接口的格式转成字符串/数字，两种格式内容一致
+        return msgpack.packb(data, default=JSONRenderer.encoder_class().default, use_bin_type=True)
+
+
+class ContentNegotiation(DefaultContentNegotiation):
+    """
+    不可用的渲染器不参与协商：没装 msgpack 时 Accept 里的 application/msgpack 被忽略
+    (同时接受 JSON 的请求返回 JSON，只接受 msgpack 的返回 406，?format=msgpack 返回 404)
+    """
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        renderers = [renderer for renderer in renderers
+                     if getattr(renderer, 'is_available', lambda: True)()]
+        return super().select_renderer(request, renderers, format_suffix)
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    放在 MetricsMiddleware 后面 (指标里的响应大小是压缩后的)；
+    ETag 按 RFC 9110 改成弱 ETag，条件请求的比较忽略 W/ 前缀 (见 api/versioning.py)
+    """
+
+    def __init__(self, get_response):
+        if get_rendering_setting('GZIP_MIN_LENGTH') is None:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    def process_response(self, request, response):
+        if response.get('Content-Type', '').startswith('text/event-stream'):
+            # SSE 要逐条送达，不能压缩缓冲
+            return response
+        if not response.streaming and len(response.content) < get_rendering_setting('GZIP_MIN_LENGTH'):
+            return response
+        return super().process_response(request, response)
@@ -0,0 +1,182 @@
+# api/response_cache.py
+"""
+公共/基础数据接口的响应缓存
+
+- 缓存后端用 Django cache 框架 (settings.CACHES，默认本地内存，不依赖外部服务)
+- 缓存键 = 接口 (视图类.action) + 路径 + 规范化后的 query 参数 / 请求体 + 相关数据范围的"代数"
+- 数据范围 (scope) 是表名 ('Hospital') 或某家医院 ('hospital:3')；
+  模型保存/删除时由 api/signals.py 调用 invalidate() 把对应范围的代数 +1，
+  旧的缓存条目自然失效，不需要遍历删除
+- 命中/未命中按接口计数，get_cache_stats() 读取；响应头带 X-Cache: HIT / MISS
+- 异步视图 (api/views/public_async.py) 用 acache_lookup / acache_store，
+  接口名和同步视图相同，两边共用缓存条目
+- 配置了只读副本时，未命中的请求改读主库 (api.db_router.use_primary)：
+  副本有延迟，用副本上的旧数据生成的响应会在失效之后又被缓存起来
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import defaultdict
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.response import Response
+
+from api.db_router import use_primary
+
+DEFAULTS = {
+    'ENABLED': True,
+    'ALIAS': 'default',     # settings.CACHES 中的别名
+    'TIMEOUT': 300,         # 秒，兜底过期时间 (信号覆盖不到的批量写入)
+}
+
+_stats = defaultdict(lambda: {'hit': 0, 'miss': 0})
+_stats_lock = threading.Lock()
+
+
+def get_cache_setting(name):
+    return getattr(settings, 'API_RESPONSE_CACHE', {}).get(name, DEFAULTS[name])
+
+
+def get_cache():
+    return caches[get_cache_setting('ALIAS')]
+
+
+def _generation_key(scope):
+    return f'api:gen:{scope}'
+
+
+def _bump(scopes):
+    cache = get_cache()
+    for scope in scopes:
+        try:
+            cache.incr(_generation_key(scope))
+        except ValueError:
+            # 代数不存在 (从未缓存过或被淘汰)，用当前时间初始化，避免和旧条目的代数撞上
+            cache.set(_generation_key(scope), time.time_ns(), None)
+
+
+def invalidate(*scopes):
+    """使这些范围相关的缓存失效 (事务提交后生效，避免并发请求把旧数据重新写回缓存)"""
+    scopes = [scope for scope in scopes if scope]
+    if scopes and get_cache_setting('ENABLED'):
+        transaction.on_commit(lambda: _bump(scopes))
+
+
+def _generations(cache, scopes):
+    keys = [_generation_key(scope) for scope in scopes]
+    generations = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in generations}
+    if missing:
+        cache.set_many(missing, None)
+        generations.update(missing)
+    return [generations[key] for key in keys]
+
+
+def _request_fingerprint(request, query, body):
+    """query: QueryDict (DRF 的 query_params 或 Django 的 GET)；body: 解析后的 POST 请求体"""
+    params = sorted((key, sorted(query.getlist(key))) for key in query)
+    body = body if request.method == 'POST' else None
+    raw = json.dumps([request.get_host(), request.path, params, body], sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def _response_key(endpoint, fingerprint, generations):
+    raw = json.dumps([endpoint, fingerprint, generations])
+    return 'api:resp:' + hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def _record(endpoint, outcome):
+    with _stats_lock:
+        _stats[endpoint][outcome] += 1
+
+
+def get_cache_stats():
+    """{接口: {'hit': n, 'miss': n}}，本进程内的计数"""
+    with _stats_lock:
+        return {endpoint: dict(counts) for endpoint, counts in _stats.items()}
+
+
+def reset_cache_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+def cache_response(*scopes):
+    """
+    视图方法装饰器：
+        @cache_response('hospital:{pk}', 'Department')
+        def departments(self, request, pk=None): ...
+    scope 里的 {pk} 等占位符用 URL 参数填充；只缓存 GET (以及只读的 POST 搜索) 的 200 响应
+    """
+    def decorator(view_method):
+        @wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            if not get_cache_setting('ENABLED') or request.method not in ('GET', 'POST'):
+                return view_method(self, request, *args, **kwargs)
+
+            endpoint = f'{self.__class__.__name__}.{view_method.__name__}'
+            try:
+                resolved = [scope.format(**kwargs) for scope in scopes]
+            except KeyError:
+                return view_method(self, request, *args, **kwargs)
+
+            cache = get_cache()
+            fingerprint = _request_fingerprint(request, request.query_params, request.data)
+            key = _response_key(endpoint, fingerprint, _generations(cache, resolved))
+
+            cached = cache.get(key)
+            if cached is not None:
+                _record(endpoint, 'hit')
+                response = Response(cached)
+                response['X-Cache'] = 'HIT'
+                return response
+
+            _record(endpoint, 'miss')
+            use_primary()
+            response = view_method(self, request, *args, **kwargs)
+            if response.status_code == 200 and isinstance(response, Response):
+                cache.set(key, response.data, get_cache_setting('TIMEOUT'))
+            response['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
+
+
+# ---------------------------------------------------------
+# 异步视图用 (Django cache 的 a* 方法)
+# ---------------------------------------------------------
+
+async def _agenerations(cache, scopes):
+    keys = [_generation_key(scope) for scope in scopes]
+    generations = await cache.aget_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in generations}
+    if missing:
+        await cache.aset_many(missing, None)
+        generations.update(missing)
+    return [generations[key] for key in keys]
+
+
+async def acache_lookup(endpoint, scopes, request, query, body=None):
+    """
+    返回 (缓存键, 缓存的响应数据)；未命中时数据为 None，缓存关闭时返回 (None, None)
+    scopes 已经填好占位符 (如 'hospital:3')
+    """
+    if not get_cache_setting('ENABLED'):
+        return None, None
+    cache = get_cache()
+    fingerprint = _request_fingerprint(request, query, body)
+    key = _response_key(endpoint, fingerprint, await _agenerations(cache, scopes))
+    cached = await cache.aget(key)
+    _record(endpoint, 'miss' if cached is None else 'hit')
+    if cached is None:
+        use_primary()
+    return key, cached
+
+
+async def acache_store(key, data):
+    if key is not None:
+        await get_cache().aset(key, data, get_cache_setting('TIMEOUT'))
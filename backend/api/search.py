@@ -0,0 +1,166 @@
+# api/search.py
+"""
+中文子串搜索：二元组 (bigram) 倒排索引
+
+LIKE '%关键字%' 没法走索引，表越大越慢。这里把医院名称/地址、科室名、员工姓名
+切成相邻两个字的 token 存到 SearchToken 表，搜索时先用 token 在索引里取出候选，
+再在候选集上核对真实子串并打分，耗时只和命中数量有关。
+
+- "深圳医院" -> 深圳 / 圳医 / 医院，外加末字单独一个 token "院"，
+  这样单字关键字可以用 token 前缀 (LIKE '院%'，可走索引) 查到
+- 所有文本先转小写，英文关键字不区分大小写
+- 写入时由 api/signals.py 自动维护；批量写入或上线前用
+  python manage.py rebuild_search_index 全量重建
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, Q
+
+from api.models import Department, Hospital, SearchToken, Staff
+
+# kind -> (模型, 参与索引的字段, 各字段打分权重)
+SEARCH_TARGETS = {
+    'hospital': (Hospital, {'name': 10, 'address': 3}),
+    'department': (Department, {'dept_name': 10}),
+    'staff': (Staff, {'name': 10}),
+}
+
+BATCH_SIZE = 1000
+
+
+def normalize(text):
+    return (text or '').strip().lower()
+
+
+def tokenize(text):
+    """返回 {token: 出现次数}"""
+    text = normalize(text)
+    if not text:
+        return Counter()
+    tokens = Counter(text[i:i + 2] for i in range(len(text) - 1))
+    tokens[text[-1]] += 1
+    return tokens
+
+
+def query_tokens(keyword):
+    keyword = normalize(keyword)
+    if len(keyword) < 2:
+        return []
+    return sorted({keyword[i:i + 2] for i in range(len(keyword) - 1)})
+
+
+def build_tokens(kind, obj):
+    _, fields = SEARCH_TARGETS[kind]
+    return [
+        SearchToken(kind=kind, object_id=obj.pk, field=field, token=token, occurrences=n)
+        for field in fields
+        for token, n in tokenize(getattr(obj, field)).items()
+    ]
+
+
+def index_object(kind, obj):
+    with transaction.atomic():
+        SearchToken.objects.filter(kind=kind, object_id=obj.pk).delete()
+        SearchToken.objects.bulk_create(build_tokens(kind, obj), batch_size=BATCH_SIZE)
+
+
+def index_new_objects(kind, objs):
+    """给 bulk_create 刚插入的对象建索引 (bulk_create 不触发信号)"""
+    tokens = [token for obj in objs for token in build_tokens(kind, obj)]
+    SearchToken.objects.bulk_create(tokens, batch_size=BATCH_SIZE)
+
+
+def remove_object(kind, pk):
+    SearchToken.objects.filter(kind=kind, object_id=pk).delete()
+
+
+def rebuild_index(kinds=None):
+    """全量重建索引，返回 {kind: 写入的 token 数}"""
+    result = {}
+    for kind in kinds or SEARCH_TARGETS:
+        model, fields = SEARCH_TARGETS[kind]
+        written = 0
+        with transaction.atomic():
+            SearchToken.objects.filter(kind=kind).delete()
+            batch = []
+            for obj in model.objects.only('pk', *fields).iterator(chunk_size=BATCH_SIZE):
+                batch.extend(build_tokens(kind, obj))
+                if len(batch) >= BATCH_SIZE:
+                    SearchToken.objects.bulk_create(batch, batch_size=BATCH_SIZE)
+                    written += len(batch)
+                    batch = []
+            SearchToken.objects.bulk_create(batch, batch_size=BATCH_SIZE)
+            written += len(batch)
+        result[kind] = written
+    return result
+
+
+def candidate_ids(kind, keyword):
+    """
+    返回包含关键字全部 token 的对象 id (values 查询集，可直接用于 pk__in 子查询)；
+    候选里可能有 token 都在但并不连续的对象，需要再用 matches()/contains 过滤
+    """
+    keyword = normalize(keyword)
+    tokens = SearchToken.objects.filter(kind=kind)
+    grams = query_tokens(keyword)
+    if not grams:
+        return tokens.filter(token__startswith=keyword).values('object_id').distinct()
+    return tokens.filter(token__in=grams).values('object_id').annotate(
+        n=Count('token', distinct=True)
+    ).filter(n=len(grams)).values('object_id')
+
+
+def contains_q(kind, keyword):
+    """候选集上的子串核对条件 (任一索引字段包含关键字)"""
+    _, fields = SEARCH_TARGETS[kind]
+    q = Q()
+    for field in fields:
+        q |= Q(**{field + '__icontains': keyword})
+    return q
+
+
+def _rank(kind, keyword, objs):
+    _, fields = SEARCH_TARGETS[kind]
+    scored = []
+    for obj in objs:
+        score = 0
+        for field, weight in fields.items():
+            value = normalize(getattr(obj, field))
+            if value == keyword:
+                score += weight * 3
+            elif value.startswith(keyword):
+                score += weight * 2
+            elif keyword in value:
+                score += weight
+        if score:
+            first_field = next(iter(fields))
+            scored.append((-score, len(getattr(obj, first_field) or ''), obj.pk, obj))
+    scored.sort(key=lambda item: item[:3])
+    return [item[3] for item in scored]
+
+
+def search(kind, keyword, queryset=None):
+    """
+    在索引上搜索并按相关度排序，返回对象列表
+    相关度：字段权重 × (完全相同 3 / 开头匹配 2 / 包含 1)，同分时名称越短越靠前
+    """
+    model, _ = SEARCH_TARGETS[kind]
+    keyword = normalize(keyword)
+    if queryset is None:
+        queryset = model.objects.all()
+    if not keyword:
+        return list(queryset)
+    return _rank(kind, keyword, queryset.filter(pk__in=candidate_ids(kind, keyword)))
+
+
+async def asearch(kind, keyword, queryset=None):
+    """search() 的异步版本 (异步 ORM)，结果相同"""
+    model, _ = SEARCH_TARGETS[kind]
+    keyword = normalize(keyword)
+    if queryset is None:
+        queryset = model.objects.all()
+    if keyword:
+        queryset = queryset.filter(pk__in=candidate_ids(kind, keyword))
+    objs = [obj async for obj in queryset]
+    return _rank(kind, keyword, objs) if keyword else objs
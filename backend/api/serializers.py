@@ -1,3 +1,8 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, OuterRef, Prefetch, Subquery
+from django.db.models.functions import Coalesce
 from rest_framework import serializers
 from api.models import (
     District, HospitalLevel, Hospital, Department,
@@ -5,29 +10,32 @@ from api.models import (
     EmergencyEvent, HospitalDepartment, HospitalStaff,
     DepartmentStaff, HospitalEvent
 )
+from api.event_feed import publish_participations
+from api.fieldsets import FieldsetMixin
+from api.response_cache import invalidate
 
 
 # 1. 基础信息序列化器 (用于下拉框选择等)
-class DistrictSerializer(serializers.ModelSerializer):
+class DistrictSerializer(FieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = District
         fields = '__all__'
 
 
-class HospitalLevelSerializer(serializers.ModelSerializer):
+class HospitalLevelSerializer(FieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = HospitalLevel
         fields = '__all__'
 
 
-class DepartmentSerializer(serializers.ModelSerializer):
+class DepartmentSerializer(FieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Department
         fields = '__all__'
 
 
 # 2. 医院相关序列化器
-class HospitalSerializer(serializers.ModelSerializer):
+class HospitalSerializer(FieldsetMixin, serializers.ModelSerializer):
     # 如果想在返回医院信息时，直接看到等级的名字，而不是 level_id，可以用这个技巧：
     level_name = serializers.CharField(source='level.level_name', read_only=True)
     district_name = serializers.CharField(source='district.district_name', read_only=True)
@@ -35,80 +43,186 @@ class HospitalSerializer(serializers.ModelSerializer):
     class Meta:
         model = Hospital
         fields = '__all__'
+        expandable_fields = {'level': HospitalLevelSerializer, 'district': DistrictSerializer}
+
+    @staticmethod
+    def setup_queryset(queryset, fields=None):
+        """
+        列表/搜索用：用子查询算好员工数，避免每行医院再查一次 (N+1)；
+        等级名、行政区名的 JOIN 由 prune_queryset 按 source 加上。
+        fields 为保留的字段名 (?fields=/?omit= 裁剪后)，不要 staff_count 时不算子查询
+        """
+        if fields is not None and 'staff_count' not in fields:
+            return queryset
+        staff_count = HospitalStaff.objects.filter(hospital=OuterRef('pk')).values('hospital').annotate(
+            c=Count('*')
+        ).values('c')
+        return queryset.annotate(staff_count=Coalesce(Subquery(staff_count), 0))
+
     def get_staff_count(self, obj):
-        # 统计关联到该医院的员工数量
+        # 统计关联到该医院的员工数量 (优先使用 setup_queryset 注解好的值)
+        staff_count = getattr(obj, 'staff_count', None)
+        if staff_count is not None:
+            return staff_count
         return obj.hospitalstaff_set.count()
-class HospitalServiceScoreSerializer(serializers.ModelSerializer):
+class HospitalServiceScoreSerializer(FieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = HospitalServiceScore
         fields = '__all__'
+        expandable_fields = {'hospital': 'HospitalInfoSerializer'}
 
 
 # 3. 资源相关序列化器
-class DepartmentResourceSerializer(serializers.ModelSerializer):
+class DepartmentResourceSerializer(FieldsetMixin, serializers.ModelSerializer):
     dept_name = serializers.CharField(source='dept.dept_name', read_only=True)
     hospital_name = serializers.CharField(source='hospital.name', read_only=True)
 
     class Meta:
         model = DepartmentResource
         fields = '__all__'
+        expandable_fields = {'hospital': 'HospitalInfoSerializer', 'dept': 'DepartmentInfoSerializer'}
+
+
+class DepartmentResourceBulkItemSerializer(serializers.Serializer):
+    """
+    批量 upsert 的单行：按 (hospital, dept) 定位资源记录
+    hospital/dept 只校验类型，是否存在由视图一次性批量检查，避免每行一次查询
+    """
+    hospital = serializers.IntegerField(required=False)  # 医院管理员可不传，自动绑定本院
+    dept = serializers.IntegerField()
+    bed_count = serializers.IntegerField(required=False, allow_null=True, min_value=0)
+    device_count = serializers.IntegerField(required=False, allow_null=True, min_value=0)
+    daily_capacity = serializers.IntegerField(required=False, allow_null=True, min_value=0)
 
 
 # 4. 人员相关序列化器
-class StaffSerializer(serializers.ModelSerializer):
+class StaffSerializer(FieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Staff
         fields = '__all__'
 
 
-class HospitalEventSerializer(serializers.ModelSerializer):
+class HospitalEventSerializer(FieldsetMixin, serializers.ModelSerializer):
     hospital_name = serializers.CharField(source='hospital.name', read_only=True)
     role_display = serializers.CharField(source='get_role_display', read_only=True)
 
     class Meta:
         model = HospitalEvent
         fields = ['id', 'hospital', 'hospital_name', 'role', 'role_display', 'response_time', 'affected_patient_count']
+        expandable_fields = {'hospital': 'HospitalInfoSerializer'}
+
+    @staticmethod
+    def setup_queryset(queryset, fields=None):
+        # hospital_name 需要医院，JOIN 进来避免每行再查一次
+        if fields is not None and 'hospital_name' not in fields:
+            return queryset
+        return queryset.select_related('hospital')
+
+class HospitalEventParticipantSerializer(serializers.Serializer):
+    """新建事件 / 追加参与医院时的一条参与记录"""
+    hospital_id = serializers.IntegerField()
+    role = serializers.ChoiceField(choices=HospitalEvent.Role.choices, default=HospitalEvent.Role.REPORTING)
+    response_time = serializers.DateTimeField(required=False, allow_null=True)
+    affected_patient_count = serializers.IntegerField(required=False, allow_null=True, min_value=0)
+
+
+MAX_EVENT_PARTICIPANTS = 1000
+
+
+def validate_participants(participants, event=None, lock=False):
+    """
+    一次查询校验所有医院 id 都存在 (追加到已有事件时再查一次已参与的医院)，
+    有问题时整批拒绝，不会写一半。
+    lock=True 时在调用方的事务里锁住这些医院 (写入参与记录之前再校验一次，校验后医院不会被并发删除)
+    """
+    if len(participants) > MAX_EVENT_PARTICIPANTS:
+        raise serializers.ValidationError(f'单次最多 {MAX_EVENT_PARTICIPANTS} 家参与医院')
+    hospital_ids = [p['hospital_id'] for p in participants]
+    duplicated = sorted(i for i, count in Counter(hospital_ids).items() if count > 1)
+    if duplicated:
+        raise serializers.ValidationError(f'参与医院重复: {duplicated}')
+    hospitals = Hospital.objects.filter(pk__in=hospital_ids)
+    if lock:
+        hospitals = hospitals.select_for_update().order_by('pk')
+    existing = set(hospitals.values_list('pk', flat=True))
+    missing = sorted(set(hospital_ids) - existing)
+    if missing:
+        raise serializers.ValidationError(f'医院不存在: {missing}')
+    if event is not None:
+        joined = sorted(HospitalEvent.objects.filter(event=event, hospital_id__in=hospital_ids).values_list(
+            'hospital_id', flat=True))
+        if joined:
+            raise serializers.ValidationError(f'医院已参与该事件: {joined}')
+    return participants
+
+
+def create_participants(event, participants, announce=True):
+    """
+    一条 bulk_create 写入参与记录；bulk_create 不触发信号，手动失效相关医院的响应缓存，
+    并推送 participation.created (新建事件时由 event.created 一并带上参与医院，announce=False)
+    """
+    HospitalEvent.objects.bulk_create([HospitalEvent(event=event, **p) for p in participants])
+    if participants:
+        invalidate('HospitalEvent', *[f"hospital:{p['hospital_id']}" for p in participants])
+        if announce:
+            publish_participations(event, participants)
+
 
 # 5. 事件相关序列化器
-class EmergencyEventSerializer(serializers.ModelSerializer):
+class EmergencyEventSerializer(FieldsetMixin, serializers.ModelSerializer):
     # 用于读取：嵌套显示参与的医院列表
     participating_hospitals = HospitalEventSerializer(source='hospital_participations', many=True, read_only=True)
 
     # 用于写入：接收前端传来的参与医院列表 [{'hospital_id': 1, 'role': 'primary'}, ...]
-    participants = serializers.ListField(
-        child=serializers.DictField(),
-        write_only=True,
-        required=False
-    )
+    participants = HospitalEventParticipantSerializer(many=True, write_only=True, required=False)
 
     class Meta:
         model = EmergencyEvent
         fields = '__all__'
 
+    @staticmethod
+    def setup_queryset(queryset, fields=None):
+        """
+        列表/详情用：参与记录连同医院一次预取，不管多少个事件都只多 1 条查询
+        (原来每个事件查一次参与记录、每条记录再查一次医院)；
+        裁剪了字段时由 prune_queryset 按保留的嵌套字段预取
+        """
+        if fields is not None:
+            return queryset
+        return queryset.prefetch_related(Prefetch(
+            'hospital_participations',
+            queryset=HospitalEventSerializer.setup_queryset(HospitalEvent.objects.order_by('pk')),
+        ))
+
+    def validate_participants(self, value):
+        return validate_participants(value)
+
     def create(self, validated_data):
-        # 提取 participants 数据
+        # 提取 participants 数据 (已在 validate_participants 里一次性校验过医院 id)
         participants_data = validated_data.pop('participants', [])
 
-        # 创建事件本身
-        event = EmergencyEvent.objects.create(**validated_data)
-
-        # 创建关联的医院记录
-        for p_data in participants_data:
-            hospital_id = p_data.get('hospital_id')
-            role = p_data.get('role', 'reporting')  # 默认为报告医院
-            if hospital_id:
-                HospitalEvent.objects.create(
-                    event=event,
-                    hospital_id=hospital_id,
-                    role=role
-                )
-
-        return event
+        # 事件和参与记录在同一个事务里，要么都写入要么都不写；
+        # 校验之后医院可能被删除，在事务里锁住医院再查一次，不存在时返回 400 而不是外键错误
+        with transaction.atomic():
+            if participants_data:
+                try:
+                    validate_participants(participants_data, lock=True)
+                except serializers.ValidationError as exc:
+                    raise serializers.ValidationError({'participants': exc.detail})
+            event = EmergencyEvent.objects.create(**validated_data)
+            create_participants(event, participants_data, announce=False)
+        # 响应里要带参与医院列表，按列表接口的方式预取 (否则每条参与记录再查一次医院)
+        return self.setup_queryset(EmergencyEvent.objects.filter(pk=event.pk)).get()
+
+    def update(self, instance, validated_data):
+        # 修改事件时不处理参与医院 (和原来一致)，追加参与医院用 POST /api/events/{id}/add_participants/
+        validated_data.pop('participants', None)
+        return super().update(instance, validated_data)
 
 
 # --- 关系表序列化器 (M:N) ---
 
-class HospitalDepartmentSerializer(serializers.ModelSerializer):
+class HospitalDepartmentSerializer(FieldsetMixin, serializers.ModelSerializer):
     # 可以在这里定义更详细的显示，比如同时显示医院名和科室名
     hospital_name = serializers.CharField(source='hospital.name', read_only=True)
     dept_name = serializers.CharField(source='dept.dept_name', read_only=True)
@@ -116,9 +230,10 @@ class HospitalDepartmentSerializer(serializers.ModelSerializer):
     class Meta:
         model = HospitalDepartment
         fields = '__all__'
+        expandable_fields = {'hospital': 'HospitalInfoSerializer', 'dept': 'DepartmentInfoSerializer'}
 
 
-class HospitalStaffSerializer(serializers.ModelSerializer):
+class HospitalStaffSerializer(FieldsetMixin, serializers.ModelSerializer):
     staff_name = serializers.CharField(source='staff.name', read_only=True)
     hospital_name = serializers.CharField(source='hospital.name', read_only=True)
     staff_gender = serializers.CharField(source='staff.gender', read_only=True)
@@ -126,18 +241,20 @@ class HospitalStaffSerializer(serializers.ModelSerializer):
     class Meta:
         model = HospitalStaff
         fields = '__all__'
+        expandable_fields = {'hospital': 'HospitalInfoSerializer', 'staff': StaffSerializer}
 
 
-class DepartmentStaffSerializer(serializers.ModelSerializer):
+class DepartmentStaffSerializer(FieldsetMixin, serializers.ModelSerializer):
     staff_name = serializers.CharField(source='staff.name', read_only=True)
     dept_name = serializers.CharField(source='dept.dept_name', read_only=True)
 
     class Meta:
         model = DepartmentStaff
         fields = '__all__'
+        expandable_fields = {'dept': 'DepartmentInfoSerializer', 'staff': StaffSerializer}
 
 
-class HospitalStaffReadSerializer(serializers.ModelSerializer):
+class HospitalStaffReadSerializer(FieldsetMixin, serializers.ModelSerializer):
     """
     用于读取：嵌套显示完整的 Staff 信息
     """
@@ -147,6 +264,7 @@ class HospitalStaffReadSerializer(serializers.ModelSerializer):
     class Meta:
         model = HospitalStaff
         fields = '__all__'
+        expandable_fields = {'hospital': 'HospitalInfoSerializer'}
 
 
 class HospitalStaffCreateCompositeSerializer(serializers.Serializer):
@@ -167,13 +285,13 @@ class HospitalStaffCreateCompositeSerializer(serializers.Serializer):
 
 
 # --- 辅助序列化器 ---
-class DepartmentInfoSerializer(serializers.ModelSerializer):
+class DepartmentInfoSerializer(FieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Department
         fields = ['dept_id', 'dept_name']
 
 
-class DepartmentStaffDetailSerializer(serializers.ModelSerializer):
+class DepartmentStaffDetailSerializer(FieldsetMixin, serializers.ModelSerializer):
     dept = DepartmentInfoSerializer(read_only=True)
 
     class Meta:
@@ -181,13 +299,13 @@ class DepartmentStaffDetailSerializer(serializers.ModelSerializer):
         fields = ['dept', 'role_in_dept']
 
 
-class HospitalInfoSerializer(serializers.ModelSerializer):
+class HospitalInfoSerializer(FieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Hospital
         fields = ['hospital_id', 'name']
 
 
-class HospitalStaffDetailSerializer(serializers.ModelSerializer):
+class HospitalStaffDetailSerializer(FieldsetMixin, serializers.ModelSerializer):
     hospital = HospitalInfoSerializer(read_only=True)
 
     class Meta:
@@ -196,7 +314,7 @@ class HospitalStaffDetailSerializer(serializers.ModelSerializer):
 
 
 # --- 主序列化器：员工全息档案 ---
-class StaffDetailSerializer(serializers.ModelSerializer):
+class StaffDetailSerializer(FieldsetMixin, serializers.ModelSerializer):
     # 反向查询：获取该员工所有的科室任职信息
     # 注意：需要在 models.py 的 ForeignKey 中加上 related_name='dept_assignments'
     # 或者使用默认的 departmentstaff_set
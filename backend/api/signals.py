@@ -0,0 +1,247 @@
+# api/signals.py
+"""
+模型写入后的联动维护，在 ApiConfig.ready() 中导入注册
+"""
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from api.event_feed import publish_event_created, publish_participations, publish_severity_changed
+from api.geo import hospital_index
+from api.models import (
+    Department, DepartmentResource, District, EmergencyEvent, Hospital, HospitalDepartment,
+    HospitalEvent, HospitalLevel, HospitalServiceScore, HospitalStaff, Staff,
+)
+from api.response_cache import invalidate
+from api.versioning import bump_table_version
+from api.search import SEARCH_TARGETS, index_object, remove_object
+from api.summary import apply_summary_delta, invalidate_icu_departments, is_icu_department, is_icu_name
+
+
+# =========================================================
+# 全市汇总 CitySummary 增量维护
+# pre_save 记下旧值，post_save / post_delete 按差值更新计数器。
+# 删除医院/科室时，级联删除的子表记录也会各自发出 post_delete，
+# 所以这里只处理本表自己的字段。
+# 这几张表的 save() 在事务里执行 (models.SummarySourceModel)，旧值加行锁读取：
+# 并发修改同一行时后一个请求等前一个提交，读到的是提交后的值，增量不会重复计算
+# =========================================================
+
+def _old_values(sender, instance, *fields, lock=False):
+    # 主键由调用方指定的表 (如 Department) 新建时 pk 也不为空，这里查不到就是新记录
+    if instance.pk is None:
+        return None
+    queryset = sender.objects.filter(pk=instance.pk)
+    if lock:
+        queryset = queryset.select_for_update()
+    return queryset.values(*fields).first()
+
+
+@receiver(pre_save, sender=Hospital)
+def remember_hospital(sender, instance, **kwargs):
+    instance._summary_old = _old_values(sender, instance, 'bed_total', lock=True)
+
+
+@receiver(post_save, sender=Hospital)
+def summary_hospital_saved(sender, instance, created, **kwargs):
+    old = getattr(instance, '_summary_old', None) or {}
+    apply_summary_delta(
+        total_hospitals=1 if created else 0,
+        total_beds=(instance.bed_total or 0) - (old.get('bed_total') or 0),
+    )
+
+
+@receiver(post_delete, sender=Hospital)
+def summary_hospital_deleted(sender, instance, **kwargs):
+    apply_summary_delta(total_hospitals=-1, total_beds=-(instance.bed_total or 0))
+
+
+@receiver(pre_save, sender=HospitalDepartment)
+def remember_hospital_department(sender, instance, **kwargs):
+    instance._summary_old = _old_values(sender, instance, 'room_count', lock=True)
+
+
+@receiver(post_save, sender=HospitalDepartment)
+def summary_hospital_department_saved(sender, instance, **kwargs):
+    old = getattr(instance, '_summary_old', None) or {}
+    apply_summary_delta(total_rooms=(instance.room_count or 0) - (old.get('room_count') or 0))
+
+
+@receiver(post_delete, sender=HospitalDepartment)
+def summary_hospital_department_deleted(sender, instance, **kwargs):
+    apply_summary_delta(total_rooms=-(instance.room_count or 0))
+
+
+def _icu_beds(dept_id, bed_count):
+    # 这条资源记录贡献给 ICU 床位的数量
+    if not bed_count or not is_icu_department(dept_id):
+        return 0
+    return bed_count
+
+
+@receiver(pre_save, sender=DepartmentResource)
+def remember_department_resource(sender, instance, **kwargs):
+    old = _old_values(sender, instance, 'device_count', 'bed_count', 'dept_id', lock=True)
+    if old is not None:
+        old['icu_beds'] = _icu_beds(old['dept_id'], old['bed_count'])
+    instance._summary_old = old
+
+
+@receiver(post_save, sender=DepartmentResource)
+def summary_department_resource_saved(sender, instance, **kwargs):
+    old = getattr(instance, '_summary_old', None) or {}
+    apply_summary_delta(
+        total_devices=(instance.device_count or 0) - (old.get('device_count') or 0),
+        icu_beds=_icu_beds(instance.dept_id, instance.bed_count) - old.get('icu_beds', 0),
+    )
+
+
+@receiver(post_delete, sender=DepartmentResource)
+def summary_department_resource_deleted(sender, instance, **kwargs):
+    # 级联删除时子表先于科室删除，此时科室记录仍在，可以判断是否 ICU
+    apply_summary_delta(
+        total_devices=-(instance.device_count or 0),
+        icu_beds=-_icu_beds(instance.dept_id, instance.bed_count),
+    )
+
+
+@receiver(pre_save, sender=Department)
+def remember_department(sender, instance, **kwargs):
+    instance._summary_old = _old_values(sender, instance, 'dept_name', lock=True)
+
+
+def _forget_icu_departments():
+    # 立即失效，提交后再失效一次：避免提交前其他请求又把旧的 ICU 集合写回缓存
+    invalidate_icu_departments()
+    transaction.on_commit(invalidate_icu_departments)
+
+
+@receiver(post_save, sender=Department)
+def summary_department_saved(sender, instance, created, **kwargs):
+    _forget_icu_departments()
+    old = getattr(instance, '_summary_old', None)
+    was_icu = old is not None and is_icu_name(old['dept_name'])
+    now_icu = is_icu_name(instance.dept_name)
+    icu_delta = 0
+    if was_icu != now_icu:
+        # 科室改名导致 ICU 归属变化，该科室下所有床位整体移入/移出 ICU 统计
+        beds = DepartmentResource.objects.filter(dept_id=instance.pk).aggregate(sum=Sum('bed_count'))['sum'] or 0
+        icu_delta = beds if now_icu else -beds
+    apply_summary_delta(total_dept_types=1 if created else 0, icu_beds=icu_delta)
+
+
+@receiver(post_delete, sender=Department)
+def summary_department_deleted(sender, instance, **kwargs):
+    _forget_icu_departments()
+    apply_summary_delta(total_dept_types=-1)
+
+
+# =========================================================
+# 搜索倒排索引 SearchToken 维护 (见 api/search.py)
+# =========================================================
+
+SEARCH_KINDS = {Hospital: 'hospital', Department: 'department', Staff: 'staff'}
+
+
+def search_object_saved(sender, instance, update_fields=None, **kwargs):
+    kind = SEARCH_KINDS[sender]
+    _, fields = SEARCH_TARGETS[kind]
+    # save(update_fields=[...]) 没动到索引字段时不用重建
+    if update_fields is not None and not set(update_fields) & set(fields):
+        return
+    index_object(kind, instance)
+
+
+def search_object_deleted(sender, instance, **kwargs):
+    remove_object(SEARCH_KINDS[sender], instance.pk)
+
+
+for _model in SEARCH_KINDS:
+    post_save.connect(search_object_saved, sender=_model, dispatch_uid=f'search_index_save_{_model.__name__}')
+    post_delete.connect(search_object_deleted, sender=_model, dispatch_uid=f'search_index_delete_{_model.__name__}')
+
+
+# =========================================================
+# 医院空间索引失效 (见 api/geo.py)
+# =========================================================
+
+@receiver(post_save, sender=Hospital)
+@receiver(post_delete, sender=Hospital)
+def invalidate_hospital_index(sender, **kwargs):
+    hospital_index.invalidate()
+
+
+# =========================================================
+# 响应缓存失效 (见 api/response_cache.py)
+# 每张表一个范围 (表名)，医院及其子表另外失效 'hospital:<id>'
+# =========================================================
+
+RESPONSE_CACHE_MODELS = (
+    District, HospitalLevel, Department, Hospital, HospitalDepartment,
+    HospitalStaff, HospitalServiceScore, HospitalEvent, EmergencyEvent,
+)
+
+
+def invalidate_response_cache(sender, instance, **kwargs):
+    scopes = [sender.__name__]
+    if sender is Hospital:
+        scopes.append(f'hospital:{instance.pk}')
+    elif sender is EmergencyEvent:
+        # 事件出现在所有参与医院的 /hospitals/{id}/events/ 里
+        hospital_ids = HospitalEvent.objects.filter(event_id=instance.pk).values_list('hospital_id', flat=True)
+        scopes.extend(f'hospital:{hospital_id}' for hospital_id in hospital_ids)
+    elif getattr(instance, 'hospital_id', None) is not None:
+        scopes.append(f'hospital:{instance.hospital_id}')
+    invalidate(*scopes)
+
+
+for _model in RESPONSE_CACHE_MODELS:
+    post_save.connect(invalidate_response_cache, sender=_model, dispatch_uid=f'response_cache_save_{_model.__name__}')
+    post_delete.connect(invalidate_response_cache, sender=_model, dispatch_uid=f'response_cache_delete_{_model.__name__}')
+
+
+# =========================================================
+# 表版本号 (ETag / Last-Modified，见 api/versioning.py)
+# 和数据写在同一个事务里，回滚时版本号一起回滚
+# =========================================================
+
+VERSIONED_MODELS = (District, HospitalLevel, Department, Hospital, HospitalStaff)
+
+
+def bump_version(sender, **kwargs):
+    bump_table_version(sender.__name__)
+
+
+for _model in VERSIONED_MODELS:
+    post_save.connect(bump_version, sender=_model, dispatch_uid=f'table_version_save_{_model.__name__}')
+    post_delete.connect(bump_version, sender=_model, dispatch_uid=f'table_version_delete_{_model.__name__}')
+
+
+# =========================================================
+# 突发事件实时推送 (见 api/event_feed.py，事务提交后发送)
+# =========================================================
+
+@receiver(pre_save, sender=EmergencyEvent)
+def remember_event_severity(sender, instance, **kwargs):
+    instance._feed_old = _old_values(sender, instance, 'severity')
+
+
+@receiver(post_save, sender=EmergencyEvent)
+def feed_event_saved(sender, instance, created, **kwargs):
+    if created:
+        publish_event_created(instance)
+        return
+    old = getattr(instance, '_feed_old', None) or {}
+    if old and old.get('severity') != instance.severity:
+        publish_severity_changed(instance, old.get('severity'))
+
+
+@receiver(post_save, sender=HospitalEvent)
+def feed_participation_saved(sender, instance, created, **kwargs):
+    if created:
+        publish_participations(instance.event, [{
+            'hospital_id': instance.hospital_id,
+            'role': instance.role,
+            'affected_patient_count': instance.affected_patient_count,
+        }])
@@ -0,0 +1,184 @@
+# api/staff_import.py
+"""
+医护人员花名册批量导入 (CSV / NDJSON)
+
+- 逐行流式解析，按 CHUNK_SIZE 分块校验和写入，内存占用和文件大小无关
+- 每行用 HospitalStaffCreateCompositeSerializer 校验，规则和单条新增接口一致
+- 每块一个事务：新员工的 staff_id 在进入事务前整块分配 (api/id_allocator.py)，Staff 和 HospitalStaff 都用 bulk_create 写入
+- 校验失败的行记录到错误报告里 (行号 + 错误)，不影响其他行
+- 默认按 UTF-8 解码 (可带 BOM)；Excel 导出的中文 CSV 一般是 GBK，需要传 encoding=gbk。
+  解码失败或 CSV 格式错误时在报告里记一条错误并停止，之前的块已经写入
+
+CSV 表头 / NDJSON 字段：name, gender, title, phone, hire_date, employment_type, existing_staff_id
+"""
+import codecs
+import csv
+import io
+import json
+
+from django.db import transaction
+from django.utils import timezone
+
+from api.id_allocator import staff_id_allocator
+from api.models import HospitalStaff, Staff, staff_category
+from api.response_cache import invalidate
+from api.search import index_new_objects
+from api.serializers import HospitalStaffCreateCompositeSerializer
+from api.versioning import bump_table_version
+
+CHUNK_SIZE = 500
+MAX_REPORTED_ERRORS = 1000
+FORMATS = ('csv', 'ndjson')
+
+
+def guess_format(filename, default='csv'):
+    name = (filename or '').lower()
+    if name.endswith(('.ndjson', '.jsonl', '.json')):
+        return 'ndjson'
+    if name.endswith('.csv'):
+        return 'csv'
+    return default
+
+
+def normalize_encoding(encoding):
+    """返回 Python 的编码名，不认识时抛 LookupError；UTF-8 按 utf-8-sig 读，去掉 Excel 加的 BOM"""
+    name = codecs.lookup(encoding or 'utf-8').name
+    return 'utf-8-sig' if name == 'utf-8' else name
+
+
+def _parse(text, file_format):
+    if file_format == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            # 空单元格视为未填写
+            yield reader.line_num, {key: value for key, value in row.items() if key and value not in ('', None)}, None
+        return
+    for line_no, line in enumerate(text, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as exc:
+            yield line_no, None, {'non_field_errors': [f'JSON 解析失败: {exc}']}
+            continue
+        if not isinstance(record, dict):
+            yield line_no, None, {'non_field_errors': ['每行必须是一个 JSON 对象']}
+            continue
+        yield line_no, record, None
+
+
+def iter_records(fileobj, file_format, encoding='utf-8'):
+    """逐行产出 (行号, 记录 dict 或 None, 解析错误 或 None)；fileobj 是二进制文件对象"""
+    encoding = normalize_encoding(encoding)
+    text = io.TextIOWrapper(fileobj, encoding=encoding, newline='')
+    line_no = 0
+    try:
+        for line_no, record, error in _parse(text, file_format):
+            yield line_no, record, error
+    except UnicodeDecodeError:
+        # 按块解码，出错的块里哪一行都没有产出，行号是最后一条成功的下一行
+        yield line_no + 1, None, {'non_field_errors': [
+            f'文件无法按 {encoding} 解码，从这一行起未导入 (Excel 导出的中文 CSV 一般是 GBK，请传 encoding=gbk)']}
+    except csv.Error as exc:
+        yield line_no + 1, None, {'non_field_errors': [f'CSV 格式错误: {exc}，从这一行起未导入']}
+
+
+class ImportReport:
+    def __init__(self):
+        self.created = 0   # 新建员工并关联
+        self.linked = 0    # 关联已有员工
+        self.failed = 0
+        self.errors = []
+
+    def add_error(self, line_no, errors):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line_no, 'errors': errors})
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'linked': self.linked,
+            'failed': self.failed,
+            'errors': self.errors,
+            'errors_truncated': self.failed > len(self.errors),
+        }
+
+
+def _write_chunk(hospital, chunk, report):
+    """chunk: [(行号, validated_data)]"""
+    today = timezone.now().date()
+    existing_ids = {data['existing_staff_id'] for _, data in chunk if data.get('existing_staff_id')}
+    # 在事务外分配号段，不在块事务里持有序列行锁
+    new_count = sum(1 for _, data in chunk if not data.get('existing_staff_id'))
+    staff_ids = iter(staff_id_allocator.allocate(new_count))
+
+    with transaction.atomic():
+        known_staff = set(Staff.objects.filter(pk__in=existing_ids).values_list('pk', flat=True))
+        employed = set(HospitalStaff.objects.filter(hospital=hospital, staff_id__in=existing_ids).values_list(
+            'staff_id', flat=True))
+
+        new_staff = []
+        links = []
+        for line_no, data in chunk:
+            existing_id = data.get('existing_staff_id')
+            if existing_id:
+                if existing_id not in known_staff:
+                    report.add_error(line_no, {'existing_staff_id': ['指定的员工ID不存在']})
+                    continue
+                if existing_id in employed:
+                    report.add_error(line_no, {'existing_staff_id': ['该员工已在本院任职']})
+                    continue
+                employed.add(existing_id)
+                links.append(HospitalStaff(hospital=hospital, staff_id=existing_id,
+                                           employment_type=data.get('employment_type')))
+                report.linked += 1
+                continue
+
+            staff = Staff(
+                staff_id=next(staff_ids),
+                name=data['name'],
+                gender=data.get('gender'),
+                title=data.get('title'),
+                # bulk_create 不走 Staff.save()，类别在这里推导
+                category=staff_category(data.get('title')),
+                phone=data.get('phone'),
+                hire_date=data.get('hire_date') or today,
+            )
+            new_staff.append(staff)
+            links.append(HospitalStaff(hospital=hospital, staff=staff, employment_type=data.get('employment_type')))
+            report.created += 1
+
+        Staff.objects.bulk_create(new_staff, batch_size=CHUNK_SIZE)
+        HospitalStaff.objects.bulk_create(links, batch_size=CHUNK_SIZE)
+
+        # bulk_create 不触发信号，手动维护搜索索引、缓存和表版本
+        index_new_objects('staff', new_staff)
+        if links:
+            invalidate('HospitalStaff', f'hospital:{hospital.pk}')
+            bump_table_version('HospitalStaff')
+
+
+def import_staff(hospital, fileobj, file_format='csv', encoding='utf-8'):
+    """把花名册导入到 hospital，返回 ImportReport；encoding 不认识时抛 LookupError"""
+    if file_format not in FORMATS:
+        raise ValueError(f'不支持的格式: {file_format}')
+
+    report = ImportReport()
+    chunk = []
+    for line_no, record, parse_error in iter_records(fileobj, file_format, encoding):
+        if parse_error:
+            report.add_error(line_no, parse_error)
+            continue
+        serializer = HospitalStaffCreateCompositeSerializer(data=record)
+        if not serializer.is_valid():
+            report.add_error(line_no, serializer.errors)
+            continue
+        chunk.append((line_no, serializer.validated_data))
+        if len(chunk) >= CHUNK_SIZE:
+            _write_chunk(hospital, chunk, report)
+            chunk = []
+    if chunk:
+        _write_chunk(hospital, chunk, report)
+    return report
@@ -0,0 +1,113 @@
+# api/summary.py
+"""
+全市资源汇总 (CitySummary) 的计算与增量维护
+
+- compute_city_summary(): 按原 dashboard 的口径全表聚合一次，用于重建和一致性校验
+- rebuild_city_summary(): 用全量结果覆盖汇总行
+- apply_summary_delta(): 信号处理器调用，按增量原子地修改计数器
+- check_city_summary(): 对比汇总行和实时聚合，返回不一致的字段
+
+注意：queryset.update() / bulk_create() 不触发信号，批量写入之后要调用 rebuild_city_summary()
+"""
+from django.core.cache import cache
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+from api.models import CitySummary, Department, DepartmentResource, Hospital, HospitalDepartment
+
+SUMMARY_FIELDS = (
+    'total_hospitals', 'total_dept_types', 'total_beds',
+    'total_rooms', 'total_devices', 'icu_beds',
+)
+
+# ICU 科室：科室名包含 "ICU" 或 "重症"
+ICU_KEYWORDS = ('icu', '重症')
+
+# ICU 科室 id 集合的缓存 (科室增删改时失效)；多进程部署时需要共享的缓存后端，
+# 否则其他进程改名后最多 ICU_CACHE_TIMEOUT 秒内仍按旧归属计算增量
+ICU_CACHE_KEY = 'api:icu-department-ids'
+ICU_CACHE_TIMEOUT = 300
+
+
+def icu_department_q(prefix=''):
+    return Q(**{prefix + 'dept_name__icontains': 'ICU'}) | Q(**{prefix + 'dept_name__icontains': '重症'})
+
+
+def is_icu_name(dept_name):
+    name = (dept_name or '').lower()
+    return any(keyword in name for keyword in ICU_KEYWORDS)
+
+
+def icu_department_ids():
+    ids = cache.get(ICU_CACHE_KEY)
+    if ids is None:
+        ids = frozenset(Department.objects.filter(icu_department_q()).values_list('pk', flat=True))
+        cache.set(ICU_CACHE_KEY, ids, ICU_CACHE_TIMEOUT)
+    return ids
+
+
+def invalidate_icu_departments():
+    cache.delete(ICU_CACHE_KEY)
+
+
+def is_icu_department(dept_id):
+    # 每次保存科室资源都要判断，用缓存的 id 集合，不再每次查库
+    return dept_id in icu_department_ids()
+
+
+def compute_city_summary():
+    """全表聚合 (原 dashboard 的实现)"""
+    hospital_totals = Hospital.objects.aggregate(count=Count('pk'), beds=Sum('bed_total'))
+    icu_departments = Department.objects.filter(icu_department_q())
+    return {
+        'total_hospitals': hospital_totals['count'],
+        'total_dept_types': Department.objects.count(),
+        'total_beds': hospital_totals['beds'] or 0,
+        'total_rooms': HospitalDepartment.objects.aggregate(sum=Sum('room_count'))['sum'] or 0,
+        'total_devices': DepartmentResource.objects.aggregate(sum=Sum('device_count'))['sum'] or 0,
+        'icu_beds': DepartmentResource.objects.filter(dept__in=icu_departments).aggregate(
+            sum=Sum('bed_count'))['sum'] or 0,
+    }
+
+
+def rebuild_city_summary():
+    values = compute_city_summary()
+    summary, _ = CitySummary.objects.update_or_create(pk=CitySummary.SINGLETON_ID, defaults=values)
+    return summary
+
+
+def get_city_summary():
+    """读取汇总行 (主键查询)，第一次访问时自动全量构建"""
+    summary = CitySummary.objects.filter(pk=CitySummary.SINGLETON_ID).first()
+    if summary is None:
+        summary = rebuild_city_summary()
+    return summary
+
+
+def apply_summary_delta(**deltas):
+    """
+    原子地累加计数器：apply_summary_delta(total_beds=+20, total_hospitals=1)
+    汇总行还不存在时不做任何事，首次读取时会全量构建
+    """
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    updates = {name: F(name) + delta for name, delta in deltas.items()}
+    CitySummary.objects.filter(pk=CitySummary.SINGLETON_ID).update(updated_at=timezone.now(), **updates)
+
+
+def check_city_summary():
+    """
+    返回 {字段: (汇总表里的值, 实时聚合值)}，只包含不一致的字段；
+    汇总行不存在时返回 None
+    """
+    summary = CitySummary.objects.filter(pk=CitySummary.SINGLETON_ID).first()
+    if summary is None:
+        return None
+    actual = compute_city_summary()
+    return {
+        name: (getattr(summary, name), actual[name])
+        for name in SUMMARY_FIELDS
+        if getattr(summary, name) != actual[name]
+    }
+
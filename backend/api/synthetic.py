@@ -0,0 +1,261 @@
+# api/synthetic.py
+"""
+大规模模拟数据生成 (python manage.py seed --scale N)
+
+- 以医院数量 N 为规模，按比例生成行政区、科室、科室资源、员工、执业/任职关系、评分、突发事件
+- 同一个 --seed 生成的数据完全一样，方便做可复现的性能测试
+- 所有主键在内存里顺序分配 (从现有最大值 +1 开始)，外键直接引用这些主键，
+  不依赖 bulk_create 回填主键 (MySQL 不支持)
+- 写入按依赖顺序分批 bulk_create：父表的批次总是先于子表落库，InnoDB 外键检查也能通过
+- bulk_create 不触发信号，结束后统一重建汇总表、搜索索引、表版本
+"""
+import random
+import time
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Max
+
+from api.id_allocator import staff_id_allocator
+from api.models import (
+    District, HospitalLevel, Hospital, Department,
+    DepartmentResource, Staff, HospitalServiceScore,
+    EmergencyEvent, HospitalDepartment, HospitalStaff,
+    DepartmentStaff, HospitalEvent, staff_category
+)
+
+DISTRICTS = ['南山区', '福田区', '罗湖区', '宝安区', '龙岗区', '龙华区', '盐田区', '坪山区', '光明区', '大鹏新区']
+LEVELS = [
+    ('三级甲等', '最高等级医院'), ('三级乙等', '大型综合医院'), ('二级甲等', '区域主要医院'),
+    ('二级乙等', '区域医院'), ('一级甲等', '社区医院'), ('一级乙等', '社区卫生服务中心'),
+]
+DEPARTMENTS = [
+    '内科', '外科', '急诊科', '儿科', '妇产科', '眼科', '耳鼻喉科', '口腔科', '皮肤科', '骨科',
+    '神经内科', '神经外科', '心血管内科', '心胸外科', '呼吸内科', '消化内科', '泌尿外科', '肾内科',
+    '内分泌科', '血液科', '肿瘤科', '感染科', '中医科', '康复医学科', '精神科', '麻醉科',
+    '放射科', '检验科', '病理科', '重症医学科', 'ICU', '新生儿科', '老年医学科', '全科医学科',
+]
+HOSPITAL_WORDS = ['人民', '中心', '中医', '妇幼保健', '儿童', '第一人民', '第二人民', '第三人民', '协和',
+                  '仁爱', '康宁', '华侨', '滨海', '大学附属', '港大', '中西医结合', '骨科', '眼科', '口腔', '肿瘤']
+HOSPITAL_SUFFIXES = ['医院', '医院', '医院', '社区健康服务中心', '专科医院']
+STREETS = ['深南大道', '滨海大道', '北环大道', '桃园路', '南海大道', '宝安大道', '龙岗大道', '布吉路', '梅林路', '华强北路']
+SURNAMES = list('王李张刘陈杨黄赵吴周徐孙马朱胡郭何林罗高郑梁谢宋唐许韩冯邓曹彭曾萧田董潘袁蔡蒋余于杜叶程魏苏吕丁任沈')
+GIVEN_CHARS = list('伟芳娜敏静丽强磊军洋勇艳杰娟涛明超秀霞平刚桂英华玉兰萍红建文辉力志鹏宇浩晨欣怡雨婷子涵俊杰')
+TITLES = [
+    ('主任医师', 4), ('副主任医师', 8), ('主治医师', 18), ('住院医师', 20),
+    ('护士长', 4), ('主管护师', 10), ('护师', 14), ('护士', 14),
+    ('药师', 3), ('技师', 3), ('行政', 2),
+]
+EMPLOYMENT_TYPES = [('全职', 85), ('兼职', 10), ('返聘', 5)]
+EVENT_TYPES = ['火灾事故', '交通事故', '食物中毒', '传染病疫情', '自然灾害', '群体性伤害', '化学品泄漏', '建筑坍塌']
+SEVERITIES = [
+    (EmergencyEvent.Severity.LEVEL_IV, 60), (EmergencyEvent.Severity.LEVEL_III, 25),
+    (EmergencyEvent.Severity.LEVEL_II, 12), (EmergencyEvent.Severity.LEVEL_I, 3),
+]
+ROLES = [choice for choice, _ in HospitalEvent.Role.choices]
+
+
+def _weighted(rng, pairs):
+    values, weights = zip(*pairs)
+    return rng.choices(values, weights=weights)[0]
+
+
+def _next_id(model, field):
+    return (model.objects.aggregate(max_id=Max(field))['max_id'] or 0) + 1
+
+
+class BatchWriter:
+    """按模型缓冲，总量超过 batch_size 时按注册顺序 (父表在前) 全部落库"""
+
+    def __init__(self, models, batch_size):
+        self.buffers = {model: [] for model in models}
+        self.batch_size = batch_size
+        self.written = {model: 0 for model in models}
+        self.pending = 0
+
+    def add(self, obj):
+        self.buffers[type(obj)].append(obj)
+        self.pending += 1
+        if self.pending >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        # 每次落库一个事务：SQLite 上快得多，MySQL 上也不会攒出超大事务
+        with transaction.atomic():
+            for model, objs in self.buffers.items():
+                if objs:
+                    model.objects.bulk_create(objs, batch_size=self.batch_size)
+                    self.written[model] += len(objs)
+                    objs.clear()
+        self.pending = 0
+
+
+class SyntheticDataGenerator:
+    def __init__(self, hospitals, seed=0, staff_per_hospital=200, events=None, batch_size=5000, log=None):
+        self.rng = random.Random(seed)
+        self.hospital_count = hospitals
+        self.staff_per_hospital = staff_per_hospital
+        self.event_count = hospitals * 2 if events is None else events
+        self.batch_size = batch_size
+        self.log = log or (lambda message: None)
+        # 固定的"当前时间"，保证同一个 seed 生成完全相同的数据
+        self.now = datetime(2025, 6, 30, 12, 0, tzinfo=dt_timezone.utc)
+
+    def _name(self):
+        rng = self.rng
+        return rng.choice(SURNAMES) + ''.join(rng.choice(GIVEN_CHARS) for _ in range(rng.choice((1, 2, 2))))
+
+    def _reference_data(self):
+        """行政区 / 等级 / 科室：已存在的沿用，缺的补上 (数量很少，逐条 get_or_create)"""
+        districts = []
+        for name in DISTRICTS:
+            district = District.objects.filter(district_name=name).first()
+            if district is None:
+                district = District.objects.create(district_id=_next_id(District, 'district_id'), district_name=name)
+            districts.append(district.pk)
+        levels = []
+        for name, description in LEVELS:
+            level = HospitalLevel.objects.filter(level_name=name).first()
+            if level is None:
+                level = HospitalLevel.objects.create(
+                    level_id=_next_id(HospitalLevel, 'level_id'), level_name=name, description=description)
+            levels.append(level.pk)
+        departments = []
+        for index, name in enumerate(DEPARTMENTS):
+            department = Department.objects.filter(dept_name=name).first()
+            if department is None:
+                department = Department.objects.create(
+                    dept_id=_next_id(Department, 'dept_id'), dept_name=name, standard_code=f'D{index + 1:03d}')
+            departments.append(department.pk)
+        return districts, levels, departments
+
+    def generate(self):
+        rng = self.rng
+        started = time.monotonic()
+        districts, levels, departments = self._reference_data()
+
+        writer = BatchWriter([
+            Hospital, HospitalDepartment, DepartmentResource, Staff,
+            HospitalStaff, DepartmentStaff, HospitalServiceScore,
+            EmergencyEvent, HospitalEvent,
+        ], self.batch_size)
+
+        hospital_id = _next_id(Hospital, 'hospital_id')
+        score_id = _next_id(HospitalServiceScore, 'score_id')
+        event_id = _next_id(EmergencyEvent, 'event_id')
+        hospital_ids = []
+
+        for n in range(self.hospital_count):
+            district = rng.choice(districts)
+            level_index = min(int(rng.expovariate(0.7)), len(levels) - 1)
+            beds = rng.randint(50, 3500) // (level_index + 1)
+            writer.add(Hospital(
+                hospital_id=hospital_id,
+                name=f'深圳市{rng.choice(HOSPITAL_WORDS)}{rng.choice(HOSPITAL_SUFFIXES)}{n + 1}',
+                address=f'{DISTRICTS[districts.index(district)]}{rng.choice(STREETS)}{rng.randint(1, 3000)}号',
+                district_id=district,
+                level_id=levels[level_index],
+                longitude=Decimal(f'{rng.uniform(113.75, 114.60):.7f}'),
+                latitude=Decimal(f'{rng.uniform(22.45, 22.85):.7f}'),
+                established_year=rng.randint(1950, 2022),
+                bed_total=beds,
+                outpatient_capacity=beds * rng.randint(1, 7),
+                phone=f'0755-{rng.randint(20000000, 89999999)}',
+            ))
+
+            # 科室及资源
+            hospital_depts = rng.sample(departments, rng.randint(6, min(25, len(departments))))
+            for dept_id in hospital_depts:
+                writer.add(HospitalDepartment(
+                    hospital_id=hospital_id, dept_id=dept_id,
+                    floor=f'{rng.randint(1, 20)}F', room_count=rng.randint(1, 30),
+                ))
+                writer.add(DepartmentResource(
+                    hospital_id=hospital_id, dept_id=dept_id,
+                    bed_count=rng.randint(0, 120), device_count=rng.randint(0, 60),
+                    daily_capacity=rng.randint(20, 600),
+                ))
+
+            # 员工及执业/任职关系
+            staff_count = max(1, int(rng.gauss(self.staff_per_hospital, self.staff_per_hospital / 4)))
+            # staff_id 走号段分配器，和在线新增 / 花名册导入共用同一个序列
+            for staff_id in staff_id_allocator.allocate(staff_count):
+                staff = Staff(
+                    staff_id=staff_id,
+                    name=self._name(),
+                    gender=rng.choice(('男', '女')),
+                    title=_weighted(rng, TITLES),
+                    phone=f'1{rng.choice((3, 5, 7, 8, 9))}{rng.randint(100000000, 999999999)}',
+                    hire_date=date(1990, 1, 1) + timedelta(days=rng.randint(0, 12600)),
+                )
+                # bulk_create 不走 Staff.save()，类别在这里推导
+                staff.category = staff_category(staff.title)
+                writer.add(staff)
+                writer.add(HospitalStaff(
+                    hospital_id=hospital_id, staff_id=staff_id,
+                    employment_type=_weighted(rng, EMPLOYMENT_TYPES),
+                ))
+                writer.add(DepartmentStaff(
+                    dept_id=rng.choice(hospital_depts), staff_id=staff_id,
+                    role_in_dept=rng.choice(('医生', '护士', '科主任', '负责人', '技术员')),
+                ))
+
+            # 评分
+            for _ in range(rng.randint(1, 3)):
+                writer.add(HospitalServiceScore(
+                    score_id=score_id, hospital_id=hospital_id,
+                    hygiene_score=Decimal(f'{rng.uniform(70, 100):.2f}'),
+                    satisfaction_score=Decimal(f'{rng.uniform(60, 100):.2f}'),
+                    last_inspection_date=self.now.date() - timedelta(days=rng.randint(0, 730)),
+                ))
+                score_id += 1
+
+            hospital_ids.append(hospital_id)
+            hospital_id += 1
+            if (n + 1) % 500 == 0:
+                self.log(f'  {n + 1}/{self.hospital_count} hospitals')
+
+        # 突发事件及参与医院 (医院已全部生成，外键都能命中)
+        for _ in range(self.event_count if hospital_ids else 0):
+            report_time = self.now - timedelta(minutes=rng.randint(0, 2 * 365 * 24 * 60))
+            writer.add(EmergencyEvent(
+                event_id=event_id,
+                event_type=rng.choice(EVENT_TYPES),
+                severity=_weighted(rng, SEVERITIES),
+                report_time=report_time,
+            ))
+            participants = rng.sample(hospital_ids, min(len(hospital_ids), rng.randint(1, 6)))
+            for index, participant in enumerate(participants):
+                writer.add(HospitalEvent(
+                    hospital_id=participant, event_id=event_id,
+                    role=HospitalEvent.Role.PRIMARY if index == 0 else rng.choice(ROLES),
+                    response_time=report_time + timedelta(minutes=rng.randint(5, 240)),
+                    affected_patient_count=rng.randint(0, 200),
+                ))
+            event_id += 1
+
+        writer.flush()
+
+        elapsed = time.monotonic() - started
+        return {model.__name__: count for model, count in writer.written.items()}, elapsed
+
+
+def refresh_derived_data(search_index=True, log=None):
+    """bulk_create 绕过了信号，批量灌数后统一重建派生数据"""
+    from api.geo import hospital_index
+    from api.response_cache import invalidate
+    from api.search import rebuild_index
+    from api.summary import rebuild_city_summary
+    from api.versioning import bump_table_version
+
+    log = log or (lambda message: None)
+    rebuild_city_summary()
+    log('  city summary rebuilt')
+    if search_index:
+        for kind, written in rebuild_index().items():
+            log(f'  search index: {kind} {written} tokens')
+    tables = ['District', 'HospitalLevel', 'Department', 'Hospital', 'HospitalStaff']
+    bump_table_version(*tables)
+    invalidate(*tables, 'HospitalDepartment', 'HospitalServiceScore', 'HospitalEvent', 'EmergencyEvent')
+    hospital_index.invalidate()
@@ -1,3 +1,1725 @@
-from django.test import TestCase
+"""
+接口性能基准 (查询次数预算 + 耗时分位数) 和各功能的行为测试
 
-# Create your tests here.
+    DJANGO_SQLITE=1 python manage.py test api
+
+- setUpTestData 用 seed --scale 的生成器灌入一份模拟数据 (BENCH_SCALE 家医院)
+- 对 api/urls.py 里的每个路由 (列表、详情、自定义 action、公共搜索、统计、导出) 请求 BENCH_REPEAT 次，
+  记录 SQL 查询次数和 p50/p95/max 耗时
+- 失败条件：
+  1. 查询次数超过 BENCHMARKS 里声明的预算
+  2. 查询次数比 benchmark_baseline.json 里记录的多 (回归)
+  3. BENCH_TIMING=1 时，p95 比本机的耗时基线 (BENCH_TIMING_FILE) 慢 BENCH_TOLERANCE 倍以上
+- BENCH_UPDATE_BASELINE=1 重写查询次数基线 (提交到仓库)，同时把耗时写到 BENCH_TIMING_FILE
+  (默认 api/benchmark_timing.json，和机器有关，不提交)；BENCH_REPORT=1 打印结果表
+
+EndpointBenchmarkTests 后面是按功能划分的 TestCase，用小规模的模拟数据检查接口的输出和边界情况
+"""
+import asyncio
+import codecs
+import csv
+import gzip
+import io
+import json
+import os
+import sqlite3
+import tempfile
+import statistics
+import time
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import skipIf
+from pathlib import Path
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import F
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils.http import http_date
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from api.authentication import tokens_for_user
+from api.db_router import _down_until, reset_replica_health
+from api.event_feed import hub
+from api.geo import haversine_km, hospital_index
+from api.metrics import registry as metrics_registry
+from api.renderers import FastJSONRenderer, msgpack, orjson
+from api.id_allocator import IdBlockAllocator, staff_id_allocator
+from api.models import (
+    Department, DepartmentResource, EmergencyEvent, Hospital, HospitalDepartment, HospitalEvent, HospitalLevel,
+    HospitalStaff, IdSequence, Staff, TableVersion, UserProfile, staff_category,
+)
+from api.search import contains_q, search
+from api.serializers import DepartmentResourceSerializer
+from api.summary import compute_city_summary, get_city_summary, icu_department_ids
+from api.synthetic import SyntheticDataGenerator, refresh_derived_data
+from api.views.department import DepartmentResourceViewSet
+from api.views.export import iter_rows
+
+BENCH_SCALE = int(os.environ.get('BENCH_SCALE', 20))
+BENCH_STAFF_PER_HOSPITAL = int(os.environ.get('BENCH_STAFF_PER_HOSPITAL', 30))
+BENCH_REPEAT = int(os.environ.get('BENCH_REPEAT', 5))
+BENCH_TOLERANCE = float(os.environ.get('BENCH_TOLERANCE', 2.0))
+BASELINE_PATH = Path(__file__).with_name('benchmark_baseline.json')
+TIMING_PATH = Path(os.environ.get('BENCH_TIMING_FILE') or Path(__file__).with_name('benchmark_timing.json'))
+
+# (名称, 方法, URL 模板, 身份, 查询次数预算)
+# URL 模板里的 {hospital} / {dept} / {staff} / {event} 由 setUpTestData 填充；
+# 身份：anon 匿名、city 市政管理员、hospital 医院管理员 (JWT 认证，预算里包含认证查询)
+BENCHMARKS = [
+    ('hospitals.list', 'get', '/api/hospitals/', 'anon', 2),
+    ('hospitals.list.page', 'get', '/api/hospitals/?page_size=20', 'anon', 2),
+    ('hospitals.list.sparse', 'get', '/api/hospitals/?page_size=20&fields=hospital_id,name', 'anon', 2),
+    ('hospitals.retrieve', 'get', '/api/hospitals/{hospital}/', 'anon', 2),
+    ('hospitals.departments', 'get', '/api/hospitals/{hospital}/departments/', 'anon', 2),
+    ('hospitals.scores', 'get', '/api/hospitals/{hospital}/scores/', 'anon', 2),
+    ('hospitals.events', 'get', '/api/hospitals/{hospital}/events/', 'anon', 3),
+    ('hospitals.department_detail', 'get', '/api/hospitals/{hospital}/department_detail/?dept_id={dept}', 'anon', 4),
+    ('hospital_levels.list', 'get', '/api/hospital_levels/', 'anon', 2),
+    ('hospital_levels.retrieve', 'get', '/api/hospital_levels/1/', 'anon', 2),
+    ('districts.list', 'get', '/api/districts/', 'anon', 2),
+    ('departments.list', 'get', '/api/departments/', 'anon', 2),
+    ('departments.search', 'get', '/api/departments/?keyword=内科', 'anon', 2),
+    ('hospital_departments.list', 'get', '/api/hospital_departments/?page_size=20', 'city', 1),
+    ('scores.list', 'get', '/api/scores/?page_size=20', 'anon', 1),
+    ('department_resources.list', 'get', '/api/department_resources/?page_size=20', 'city', 1),
+    ('department_staffs.list', 'get', '/api/department_staffs/?page_size=20', 'city', 1),
+    ('staffs.list', 'get', '/api/staffs/?page_size=50', 'city', 1),
+    ('staffs.retrieve', 'get', '/api/staffs/{staff}/', 'city', 3),
+    ('staffs.search', 'get', '/api/staffs/?keyword=王&page_size=20', 'city', 1),
+    ('staffs.statistics', 'get', '/api/staffs/statistics/', 'city', 1),
+    ('hospital_staffs.list', 'get', '/api/hospital_staffs/?page_size=20', 'hospital', 1),
+    ('events.list', 'get', '/api/events/?page_size=20', 'anon', 2),
+    ('events.list.sparse', 'get', '/api/events/?page_size=20&omit=participating_hospitals', 'anon', 1),
+    ('events.by_hospital', 'get', '/api/events/?hospital_id={hospital}&page_size=20', 'anon', 2),
+    ('events.analytics', 'get', '/api/events/analytics/?bucket=week&group_by=district&start=2024-07-01&end=2025-06-30', 'anon', 1),
+    ('hospital_events.list', 'get', '/api/hospital_events/?page_size=20', 'city', 1),
+    ('hospital_events.list.expand', 'get', '/api/hospital_events/?page_size=20&expand=hospital', 'city', 1),
+    ('public.search_hospital', 'post', '/api/public/search_hospital/', 'anon', 1),
+    ('public.search_hospital.index', 'post', '/api/public/search_hospital/?mode=index', 'anon', 1),
+    ('public.nearby', 'get', '/api/public/nearby/?lat=22.6&lng=114.1&k=10&department={dept}', 'anon', 2),
+    ('statistics.dashboard', 'get', '/api/statistics/dashboard/', 'city', 1),
+    ('statistics.staff_structure', 'get', '/api/statistics/staff_structure/', 'city', 1),
+    ('statistics.hospital_rank', 'get', '/api/statistics/hospital_rank/?ordering=-device_count&limit=50', 'city', 1),
+    ('exports.staff', 'get', '/api/exports/staff/?file_format=ndjson', 'city', 1),
+]
+
+POST_BODIES = {
+    'public.search_hospital': {'name': '医院'},
+    'public.search_hospital.index': {'name': '人民医院', 'mode': 'index'},
+}
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+@override_settings(API_RESPONSE_CACHE={'ENABLED': False})
+class EndpointBenchmarkTests(TestCase):
+    results = {}
+
+    @classmethod
+    def setUpTestData(cls):
+        SyntheticDataGenerator(hospitals=BENCH_SCALE, seed=42, staff_per_hospital=BENCH_STAFF_PER_HOSPITAL).generate()
+        refresh_derived_data()
+        hospital_index.invalidate()
+
+        hospital = Hospital.objects.order_by('pk').first()
+        cls.params = {
+            'hospital': hospital.pk,
+            'dept': HospitalDepartment.objects.filter(hospital=hospital).values_list('dept_id', flat=True).first(),
+            'staff': Staff.objects.order_by('pk').values_list('pk', flat=True).first(),
+            'event': EmergencyEvent.objects.order_by('pk').values_list('pk', flat=True).first(),
+        }
+        city = User.objects.create_user('bench_city', password='x')
+        UserProfile.objects.create(user=city, role='city_admin')
+        hospital_admin = User.objects.create_user('bench_hospital', password='x')
+        UserProfile.objects.create(user=hospital_admin, role='hospital_admin', hospital=hospital)
+        cls.tokens = {
+            'city': str(tokens_for_user(city).access_token),
+            'hospital': str(tokens_for_user(hospital_admin).access_token),
+        }
+        assert Department.objects.exists()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        if os.environ.get('BENCH_UPDATE_BASELINE') and cls.results:
+            queries = {name: result['queries'] for name, result in cls.results.items()}
+            timings = {name: {key: value for key, value in result.items() if key != 'queries'}
+                       for name, result in cls.results.items()}
+            BASELINE_PATH.write_text(json.dumps(queries, indent=2, sort_keys=True, ensure_ascii=False) + '\n')
+            TIMING_PATH.write_text(json.dumps(timings, indent=2, sort_keys=True, ensure_ascii=False) + '\n')
+        if os.environ.get('BENCH_REPORT') and cls.results:
+            print(f"\n{'endpoint':40} {'queries':>7} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}")
+            for name, result in cls.results.items():
+                print(f"{name:40} {result['queries']:>7} {result['p50_ms']:>8.2f} "
+                      f"{result['p95_ms']:>8.2f} {result['max_ms']:>8.2f}")
+
+    def client_for(self, identity):
+        client = APIClient()
+        if identity in self.tokens:
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.tokens[identity]}')
+        return client
+
+    def run_benchmark(self, name, method, url, identity):
+        client = self.client_for(identity)
+        url = url.format(**self.params)
+        body = POST_BODIES.get(name)
+        timings = []
+        queries = None
+        for _ in range(BENCH_REPEAT):
+            cache.clear()
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = getattr(client, method)(url, body, format='json') if body else getattr(client, method)(url)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                timings.append((time.perf_counter() - started) * 1000)
+            self.assertEqual(response.status_code, 200, f'{name}: {response.status_code} {url}')
+            # 取最后一次 (进程内索引等已预热) 的查询次数
+            queries = len(captured)
+        return {
+            'queries': queries,
+            'p50_ms': round(statistics.median(timings), 3),
+            'p95_ms': round(percentile(timings, 95), 3),
+            'max_ms': round(max(timings), 3),
+        }
+
+    def test_endpoint_budgets(self):
+        baseline = json.loads(BASELINE_PATH.read_text()) if BASELINE_PATH.exists() else {}
+        check_timing = bool(os.environ.get('BENCH_TIMING'))
+        timing_baseline = json.loads(TIMING_PATH.read_text()) if check_timing and TIMING_PATH.exists() else {}
+        for name, method, url, identity, budget in BENCHMARKS:
+            with self.subTest(endpoint=name):
+                result = self.run_benchmark(name, method, url, identity)
+                type(self).results[name] = result
+                self.assertLessEqual(
+                    result['queries'], budget,
+                    f"{name}: {result['queries']} queries, budget is {budget}")
+                if os.environ.get('BENCH_UPDATE_BASELINE'):
+                    continue
+                expected = baseline.get(name)
+                if expected is not None:
+                    self.assertLessEqual(
+                        result['queries'], expected,
+                        f"{name}: {result['queries']} queries, baseline was {expected}")
+                expected = timing_baseline.get(name)
+                if expected is not None:
+                    # 1ms 的绝对余量，避免亚毫秒级接口因为抖动误报
+                    limit = expected['p95_ms'] * BENCH_TOLERANCE + 1
+                    self.assertLessEqual(
+                        result['p95_ms'], limit,
+                        f"{name}: p95 {result['p95_ms']}ms, baseline {expected['p95_ms']}ms")
+
+    def test_every_route_is_benchmarked(self):
+        """新增路由时要同步加到 BENCHMARKS 里"""
+        from api.urls import router
+        covered = {url.split('?')[0].split('/')[2] for _, _, url, _, _ in BENCHMARKS}
+        registered = {prefix for prefix, _, _ in router.registry}
+        self.assertEqual(registered - covered, set())
+
+
+# =========================================================
+# 功能测试
+# =========================================================
+
+def make_admin(username, role, hospital=None):
+    user = User.objects.create_user(username, password='x')
+    UserProfile.objects.create(user=user, role=role, hospital=hospital)
+    return user
+
+
+def client_for_user(user=None):
+    """带 JWT 的客户端；user 为空时是匿名客户端"""
+    client = APIClient()
+    if user is not None:
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {tokens_for_user(user).access_token}')
+    return client
+
+
+class KeysetPaginationTests(TestCase):
+    """/api/events/ 按 (report_time DESC, event_id DESC) 翻页；NULL 视为最小值排在最后"""
+    url = '/api/events/'
+
+    @classmethod
+    def setUpTestData(cls):
+        noon = datetime(2025, 6, 1, 12, tzinfo=dt_timezone.utc)
+        # 同一时间的多条事件靠主键决胜，NULL 也有多条
+        for report_time in (noon, None, noon + timedelta(hours=1), noon, None, noon - timedelta(days=1), noon):
+            EmergencyEvent.objects.create(event_type='火灾', report_time=report_time)
+        events = EmergencyEvent.objects.all()
+        cls.expected = [event.pk for event in sorted(
+            events, key=lambda event: (event.report_time is not None, event.report_time or noon, event.pk),
+            reverse=True)]
+
+    def walk(self, url, link):
+        """从 url 开始沿 next / previous 走到头，返回每页的 id 列表"""
+        pages = []
+        while url:
+            response = APIClient().get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([row['event_id'] for row in response.data['results']])
+            url = response.data[link]
+        return pages
+
+    def test_forward_traversal(self):
+        for page_size in (1, 2, 3, 7, 50):
+            with self.subTest(page_size=page_size):
+                pages = self.walk(f'{self.url}?page_size={page_size}', 'next')
+                self.assertEqual([pk for page in pages for pk in page], self.expected)
+                self.assertTrue(all(len(page) == page_size for page in pages[:-1]))
+
+    def test_previous_links(self):
+        forward = self.walk(f'{self.url}?page_size=2', 'next')
+        response = APIClient().get(f'{self.url}?page_size=2')
+        while response.data['next']:
+            response = APIClient().get(response.data['next'])
+        # 从最后一页往回翻，得到除最后一页外的各页 (倒序)
+        self.assertEqual(self.walk(response.data['previous'], 'previous'), forward[-2::-1])
+
+    def test_count_and_invalid_cursor(self):
+        response = APIClient().get(f'{self.url}?page_size=3&with_count=1')
+        self.assertEqual(response.data['count'], len(self.expected))
+        self.assertIsNone(response.data['previous'])
+        self.assertNotIn('count', APIClient().get(f'{self.url}?page_size=3').data)
+        self.assertEqual(APIClient().get(f'{self.url}?cursor=not-a-cursor').status_code, 404)
+
+
+
+class HospitalRankTests(TestCase):
+    """资源排行：一条 SQL 算出的汇总、紧张度和排序要和逐家计算的结果一致"""
+    url = '/api/statistics/hospital_rank/'
+    STRESS_RANK = {'normal': 0, 'medium': 1, 'high': 2}
+
+    @classmethod
+    def setUpTestData(cls):
+        SyntheticDataGenerator(hospitals=6, seed=42, staff_per_hospital=1).generate()
+        pks = list(Hospital.objects.order_by('pk').values_list('pk', flat=True))
+        # 门诊量 / 床位：> 5 high，> 3 medium，正好 3 倍、床位为 0 或空都是 normal
+        for pk, (beds, outpatients) in zip(pks, [(100, 600), (100, 400), (100, 300), (0, 50), (None, 50)]):
+            Hospital.objects.filter(pk=pk).update(bed_total=beds, outpatient_capacity=outpatients)
+        cls.city = make_admin('rank_city', 'city_admin')
+
+    def get(self, **params):
+        return client_for_user(self.city).get(self.url, params)
+
+    def expected_rows(self, hospitals=None):
+        rows = []
+        for hospital in (hospitals or Hospital.objects.select_related('district', 'level')).order_by('pk'):
+            resources = DepartmentResource.objects.filter(hospital=hospital)
+            beds, outpatients = hospital.bed_total, hospital.outpatient_capacity or 0
+            stress = 'normal'
+            if beds and outpatients > beds * 5:
+                stress = 'high'
+            elif beds and outpatients > beds * 3:
+                stress = 'medium'
+            rows.append({
+                'hospital_id': hospital.pk, 'name': hospital.name,
+                'district': hospital.district.district_name, 'level': hospital.level.level_name,
+                'bed_total': beds,
+                'dept_bed_count': sum(resource.bed_count or 0 for resource in resources),
+                'room_count': sum(relation.room_count or 0
+                                  for relation in HospitalDepartment.objects.filter(hospital=hospital)),
+                'device_count': sum(resource.device_count or 0 for resource in resources),
+                'stress': stress,
+            })
+        return rows
+
+    def test_values_and_stress(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['data'], self.expected_rows())
+        self.assertEqual([row['stress'] for row in response.data['data'][:5]],
+                         ['high', 'medium', 'normal', 'normal', 'normal'])
+
+    def test_ordering(self):
+        expected = self.expected_rows()
+        for field in ('hospital_id', 'name', 'bed_total', 'dept_bed_count', 'room_count', 'device_count', 'stress'):
+            for descending in (False, True):
+                def key(row):
+                    value = self.STRESS_RANK[row['stress']] if field == 'stress' else row[field]
+                    # NULL 视为最小值；同值按 hospital_id 升序 (稳定排序保留主键顺序)
+                    return value is not None, value if value is not None else 0
+                ordering = ('-' if descending else '') + field
+                with self.subTest(ordering=ordering):
+                    rows = self.get(ordering=ordering).data['data']
+                    self.assertEqual([row['hospital_id'] for row in rows],
+                                     [row['hospital_id'] for row in sorted(expected, key=key, reverse=descending)])
+
+    def test_limit_and_filters(self):
+        top = self.get(ordering='-device_count').data['data']
+        self.assertEqual(self.get(ordering='-device_count', limit=2).data['data'], top[:2])
+        self.assertEqual(self.get(limit=0).data['data'], [])
+        self.assertEqual(self.get(limit=-3).data['data'], [])
+        hospital = Hospital.objects.order_by('pk').first()
+        rows = self.get(district=hospital.district_id, level=hospital.level_id).data['data']
+        self.assertEqual(rows, self.expected_rows(Hospital.objects.filter(
+            district_id=hospital.district_id, level_id=hospital.level_id).select_related('district', 'level')))
+
+    def test_invalid_parameters(self):
+        for params in ({'ordering': 'password'}, {'ordering': '-outpatient_capacity'}, {'limit': 'ten'}):
+            with self.subTest(params=params):
+                response = self.get(**params)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.data['code'], 400)
+
+    def test_city_admin_only(self):
+        self.assertEqual(client_for_user().get(self.url).status_code, 401)
+        hospital_admin = make_admin('rank_hospital', 'hospital_admin', Hospital.objects.order_by('pk').first())
+        self.assertEqual(client_for_user(hospital_admin).get(self.url).status_code, 403)
+
+
+def migrate(targets):
+    """把测试库迁移到 targets，返回该状态下的历史模型 (apps)"""
+    executor = MigrationExecutor(connection)
+    executor.loader.build_graph()
+    executor.migrate(targets)
+    return executor.loader.project_state(targets).apps
+
+class CitySummaryTests(TestCase):
+    """信号维护的增量 (api/signals.py) 要和全表重算的结果一致"""
+
+    @classmethod
+    def setUpTestData(cls):
+        SyntheticDataGenerator(hospitals=3, seed=42, staff_per_hospital=5).generate()
+        refresh_derived_data()
+
+    def setUp(self):
+        cache.clear()
+
+    def assertSummaryConsistent(self):
+        summary = get_city_summary()
+        summary.refresh_from_db()
+        actual = compute_city_summary()
+        self.assertEqual({name: getattr(summary, name) for name in actual}, actual)
+
+    def test_deltas_match_recompute(self):
+        get_city_summary()
+        hospital = Hospital.objects.order_by('pk').first()
+        hospital.bed_total = (hospital.bed_total or 0) + 37
+        hospital.save()
+        self.assertSummaryConsistent()
+
+        icu = Department.objects.create(dept_id=99001, dept_name='重症医学科')
+        resource = DepartmentResource.objects.create(hospital=hospital, dept=icu, bed_count=12, device_count=5)
+        HospitalDepartment.objects.create(hospital=hospital, dept=icu, room_count=4)
+        self.assertSummaryConsistent()
+
+        resource.bed_count = 20
+        resource.save()
+        self.assertSummaryConsistent()
+
+        # 改名后不再是 ICU 科室：缓存的 ICU id 集合要失效
+        self.assertIn(icu.pk, icu_department_ids())
+        icu.dept_name = '康复科'
+        icu.save()
+        self.assertNotIn(icu.pk, icu_department_ids())
+        self.assertSummaryConsistent()
+
+        other = Department.objects.exclude(pk=icu.pk).exclude(
+            pk__in=DepartmentResource.objects.filter(hospital=hospital).values('dept_id')).order_by('pk').first()
+        resource.dept = other
+        resource.save()
+        self.assertSummaryConsistent()
+
+        resource.delete()
+        icu.delete()
+        Hospital.objects.order_by('pk').last().delete()
+        self.assertSummaryConsistent()
+
+    def test_icu_lookup_is_cached(self):
+        resource = DepartmentResource.objects.order_by('pk').first()
+        icu_department_ids()
+        resource.bed_count = (resource.bed_count or 0) + 1
+        with CaptureQueriesContext(connection) as captured:
+            resource.save()
+        self.assertFalse([q for q in captured if 'dept_name' in q['sql']])
+
+
+class SearchTests(TestCase):
+    """二元组索引的搜索结果要和子串匹配一致，按相关度排序"""
+
+    @classmethod
+    def setUpTestData(cls):
+        SyntheticDataGenerator(hospitals=4, seed=42, staff_per_hospital=5).generate()
+        refresh_derived_data()
+        template = Hospital.objects.order_by('pk').first()
+
+        def hospital(name, address=None):
+            # 逐条 save，由信号写入索引
+            return Hospital.objects.create(name=name, address=address, district=template.district,
+                                           level=template.level)
+
+        cls.exact = hospital('杏林')
+        cls.prefix = hospital('杏林医院')
+        cls.longer_prefix = hospital('杏林社区医院')
+        cls.contains = hospital('北区杏林医院')
+        cls.address = hospital('北区第二医院', address='杏林路1号')
+        cls.city = make_admin('search_city', 'city_admin')
+
+    def test_ranking(self):
+        ranked = [hospital.pk for hospital in search('hospital', '杏林')]
+        self.assertEqual(ranked, [self.exact.pk, self.prefix.pk, self.longer_prefix.pk, self.contains.pk,
+                                  self.address.pk])
+
+    def test_matches_substring_filter(self):
+        for keyword in ('杏', '林', '医院', '杏林医', '北区', 'xyz'):
+            with self.subTest(keyword=keyword):
+                expected = set(Hospital.objects.filter(contains_q('hospital', keyword)).values_list('pk', flat=True))
+                self.assertEqual({hospital.pk for hospital in search('hospital', keyword)}, expected)
+
+    def test_index_follows_writes(self):
+        self.prefix.name = '仁和医院'
+        self.prefix.save()
+        self.contains.delete()
+        self.assertEqual([hospital.pk for hospital in search('hospital', '杏林')],
+                         [self.exact.pk, self.longer_prefix.pk, self.address.pk])
+        self.assertEqual([hospital.pk for hospital in search('hospital', '仁和')], [self.prefix.pk])
+
+    def test_public_search_modes(self):
+        url = '/api/public/search_hospital/'
+        response = APIClient().post(url, {'name': '杏林', 'mode': 'index'}, format='json')
+        self.assertEqual([row['hospital_id'] for row in response.data['data']],
+                         [self.exact.pk, self.prefix.pk, self.longer_prefix.pk, self.contains.pk, self.address.pk])
+        # 默认模式只按名称包含过滤
+        response = APIClient().post(url, {'name': '杏林'}, format='json')
+        self.assertEqual({row['hospital_id'] for row in response.data['data']},
+                         {self.exact.pk, self.prefix.pk, self.longer_prefix.pk, self.contains.pk})
+
+    def test_keyword_endpoints(self):
+        name = Staff.objects.order_by('pk').first().name
+        for keyword in (name[0], name[-2:], name):
+            with self.subTest(keyword=keyword):
+                response = client_for_user(self.city).get('/api/staffs/', {'keyword': keyword})
+                self.assertEqual({row['staff_id'] for row in response.data},
+                                 set(Staff.objects.filter(name__contains=keyword).values_list('pk', flat=True)))
+        for keyword in ('内科', '科', '外'):
+            with self.subTest(keyword=keyword):
+                response = APIClient().get('/api/departments/', {'keyword': keyword})
+                self.assertEqual({row['dept_id'] for row in response.data},
+                                 set(Department.objects.filter(dept_name__contains=keyword).values_list('pk', flat=True)))
+
+
+class SearchIndexMigrationTests(TransactionTestCase):
+    """0005 迁移给升级前已有的数据建索引：退回 0004 写入数据，再迁移到最新"""
+
+    def test_existing_rows_are_indexed(self):
+        latest = MigrationExecutor(connection).loader.graph.leaf_nodes('api')
+        old_apps = migrate([('api', '0004_citysummary')])
+        self.addCleanup(migrate, latest)
+        model = old_apps.get_model
+        hospital = model('api', 'Hospital').objects.create(
+            name='升级测试医院', address='杏林路8号',
+            district=model('api', 'District').objects.create(district_id=1, district_name='南山区'),
+            level=model('api', 'HospitalLevel').objects.create(level_id=1, level_name='三级甲等'))
+        department = model('api', 'Department').objects.create(dept_id=1, dept_name='升级测试科')
+        staff = model('api', 'Staff').objects.create(staff_id=1, name='升级测试员')
+
+        migrate(latest)
+        self.assertEqual([obj.pk for obj in search('hospital', '杏林路')], [hospital.pk])
+        self.assertEqual([obj.pk for obj in search('hospital', '升级')], [hospital.pk])
+        self.assertEqual([obj.pk for obj in search('department', '测试科')], [department.pk])
+        self.assertEqual([obj.pk for obj in search('staff', '员')], [staff.pk])
+
+
+class NearbyTests(TestCase):
+    url = '/api/public/nearby/'
+
+    @classmethod
+    def setUpTestData(cls):
+        SyntheticDataGenerator(hospitals=12, seed=42, staff_per_hospital=1).generate()
+        refresh_derived_data()
+        located = Hospital.objects.exclude(latitude=None).exclude(longitude=None)
+        cls.lat = float(sum(hospital.latitude for hospital in located) / len(located))
+        cls.lng = float(sum(hospital.longitude for hospital in located) / len(located))
+        cls.distances = sorted(
+            (haversine_km(cls.lat, cls.lng, float(hospital.latitude), float(hospital.longitude)), hospital.pk)
+            for hospital in located)
+
+    def setUp(self):
+        hospital_index.invalidate()
+
+    def nearby(self, **params):
+        response = APIClient().get(self.url, {'lat': self.lat, 'lng': self.lng, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data['data']
+
+    def test_nearest_first(self):
+        rows = self.nearby(k=5)
+        self.assertEqual([row['hospital_id'] for row in rows], [pk for _, pk in self.distances[:5]])
+        self.assertEqual([row['distance_km'] for row in rows], [round(distance, 3) for distance, _ in self.distances[:5]])
+
+    def test_radius(self):
+        radius = self.distances[len(self.distances) // 2][0] + 0.001
+        rows = self.nearby(k=100, radius=radius)
+        self.assertEqual([row['hospital_id'] for row in rows], [pk for distance, pk in self.distances if distance <= radius])
+        self.assertTrue(all(row['distance_km'] <= radius for row in rows))
+        self.assertEqual(self.nearby(radius=0.0001), [])
+
+    def test_department_and_level_filters(self):
+        relation = HospitalDepartment.objects.order_by('pk').first()
+        rows = self.nearby(k=100, department=relation.dept_id)
+        self.assertEqual({row['hospital_id'] for row in rows},
+                         set(HospitalDepartment.objects.filter(dept_id=relation.dept_id).exclude(
+                             hospital__latitude=None).values_list('hospital_id', flat=True)))
+        level_id = Hospital.objects.order_by('pk').first().level_id
+        rows = self.nearby(k=100, level=level_id)
+        self.assertTrue(rows)
+        self.assertEqual({row['level'] for row in rows}, {level_id})
+
+    def test_follows_hospital_moves(self):
+        far = Hospital.objects.get(pk=self.distances[-1][1])
+        far.latitude, far.longitude = Decimal(str(self.lat)), Decimal(str(self.lng))
+        far.save()
+        self.assertEqual(self.nearby(k=1)[0]['hospital_id'], far.pk)
+
+    def test_invalid_parameters(self):
+        for params in ({'lat': 22.5}, {'lat': 'abc', 'lng': 114}, {'lat': 22.5, 'lng': 114, 'k': 'x'},
+                       {'lat': 95, 'lng': 114}, {'lat': 22.5, 'lng': 114, 'radius': 'far'}):
+            with self.subTest(params=params):
+                response = APIClient().get(self.url, params)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.data['code'], 400)
+
+
+class ResponseCacheTests(TestCase):
+    """写入提交后相关范围的缓存失效，其他医院的缓存不受影响"""
+
+    @classmethod
+    def setUpTestData(cls):
+        SyntheticDataGenerator(hospitals=2, seed=42, staff_per_hospital=2).generate()
+        refresh_derived_data()
+        cls.first, cls.second = Hospital.objects.order_by('pk')[:2]
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, hospital):
+        return APIClient().get(f'/api/hospitals/{hospital.pk}/departments/')
+
+    def test_hit_after_miss(self):
+        miss, hit = self.get(self.first), self.get(self.first)
+        self.assertEqual((miss['X-Cache'], hit['X-Cache']), ('MISS', 'HIT'))
+        self.assertEqual(hit.content, miss.content)
+        self.assertEqual(self.get(self.second)['X-Cache'], 'MISS')
+
+    def test_write_invalidates_after_commit(self):
+        self.get(self.first)
+        self.get(self.second)
+        relation = HospitalDepartment.objects.filter(hospital=self.first).order_by('pk').first()
+        with self.captureOnCommitCallbacks(execute=True):
+            relation.room_count = (relation.room_count or 0) + 7
+            relation.save()
+            # 提交前其他请求仍然读到缓存
+            self.assertEqual(self.get(self.first)['X-Cache'], 'HIT')
+        response = self.get(self.first)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        row = next(row for row in response.data['data'] if row['id'] == relation.pk)
+        self.assertEqual(row['room_count'], relation.room_count)
+        self.assertEqual(self.get(self.second)['X-Cache'], 'HIT')
+
+    def test_table_scope(self):
+        self.get(self.first)
+        department = Department.objects.order_by('pk').first()
+        with self.captureOnCommitCallbacks(execute=True):
+            department.dept_name += '(新)'
+            department.save()
+        self.assertEqual(self.get(self.first)['X-Cache'], 'MISS')
+
+    @override_settings(API_RESPONSE_CACHE={'ENABLED': False})
+    def test_disabled(self):
+        self.get(self.first)
+        self.assertNotIn('X-Cache', self.get(self.first))
+
+
+class ConditionalRequestTests(TestCase):
+    """ETag / Last-Modified 按依赖表的版本号计算，未变化时返回 304"""
+
+    @classmethod
+    def setUpTestData(cls):
+        SyntheticDataGenerator(hospitals=2, seed=42, staff_per_hospital=2).generate()
+        refresh_derived_data()
+        cls.hospital = Hospital.objects.order_by('pk').first()
+        cls.url = f'/api/hospitals/{cls.hospital.pk}/'
+
+    def get(self, **headers):
+        return APIClient().get(self.url, **headers)
+
+    def test_if_none_match(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        for header in (etag, f'W/{etag}', f'"other", {etag}', '*'):
+            with self.subTest(header=header):
+                response = self.get(HTTP_IF_NONE_MATCH=header)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.content, b'')
+                self.assertEqual(response['ETag'], etag)
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+        # 不同的查询参数是不同的表示
+        self.assertNotEqual(APIClient().get(self.url + '?fields=name')['ETag'], etag)
+
+    def age_versions(self, seconds=5):
+        TableVersion.objects.update(updated_at=F('updated_at') - timedelta(seconds=seconds))
+
+    def test_if_modified_since(self):
+        self.age_versions()
+        last_modified = self.get()['Last-Modified']
+        self.assertEqual(self.get(HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        self.assertEqual(self.get(HTTP_IF_MODIFIED_SINCE=http_date(0)).status_code, 200)
+        # 同时带 If-None-Match 时只看 ETag
+        self.assertEqual(self.get(HTTP_IF_MODIFIED_SINCE=last_modified, HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    def test_same_second_write_is_not_hidden(self):
+        # 最后写入还在当前这一秒：不给 Last-Modified，带 If-Modified-Since 也不返回 304
+        self.age_versions()
+        last_modified = self.get()['Last-Modified']
+        self.hospital.phone = '0755-11111111'
+        self.hospital.save()
+        self.assertNotIn('Last-Modified', self.get())
+        future = http_date(time.time() + 3600)
+        for since in (last_modified, future):
+            response = self.get(HTTP_IF_MODIFIED_SINCE=since)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['phone'], '0755-11111111')
+
+    def test_write_changes_etag(self):
+        etag = self.get()['ETag']
+        # 不相关的表
+        department = Department.objects.order_by('pk').first()
+        department.dept_name += '(新)'
+        department.save()
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.hospital.phone = '0755-00000000'
+        self.hospital.save()
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data['phone'], '0755-00000000')
+
+
+class BulkUpsertTests(TestCase):
+    url = '/api/department_resources/bulk_upsert/'
+
+    @classmethod
+    def setUpTestData(cls):
+        SyntheticDataGenerator(hospitals=2, seed=42, staff_per_hospital=2).generate()
+        refresh_derived_data()
+        cls.hospital = Hospital.objects.order_by('pk').first()
+        cls.existing = DepartmentResource.objects.filter(hospital=cls.hospital).order_by('pk').first()
+        cls.new_dept = Department.objects.exclude(
+            pk__in=DepartmentResource.objects.filter(hospital=cls.hospital).values('dept_id')).order_by('pk').first()
+        cls.city = make_admin('upsert_city', 'city_admin')
+        cls.hospital_admin = make_admin('upsert_hospital', 'hospital_admin', hospital=cls.hospital)
+
+    def test_create_and_update(self):
+        get_city_summary()
+        response = client_for_user(self.city).post(self.url, [
+            {'hospital': self.hospital.pk, 'dept': self.existing.dept_id, 'device_count': 999},
+            {'hospital': self.hospital.pk, 'dept': self.new_dept.pk, 'bed_count': 7, 'device_count': 3},
+        ], format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        updated, created = response.data['data']
+        self.assertEqual((updated['status'], updated['dept_res_id']), ('updated', self.existing.pk))
+        self.assertEqual(created['status'], 'created')
+
+        self.existing.refresh_from_db()
+        self.assertEqual(self.existing.device_count, 999)
+        resource = DepartmentResource.objects.get(pk=created['dept_res_id'])
+        self.assertEqual((resource.hospital_id, resource.dept_id, resource.bed_count), (self.hospital.pk, self.new_dept.pk, 7))
+        self.assertIsNone(resource.daily_capacity)
+        self.assertEqual(DepartmentResource.objects.filter(hospital=self.hospital, dept=self.new_dept).count(), 1)
+        summary = get_city_summary()
+        summary.refresh_from_db()
+        self.assertEqual(summary.total_devices, compute_city_summary()['total_devices'])
+
+    def test_partial_update_keeps_other_fields(self):
+        before = (self.existing.bed_count, self.existing.daily_capacity)
+        response = client_for_user(self.city).post(self.url, {'records': [
+            {'hospital': self.hospital.pk, 'dept': self.existing.dept_id, 'device_count': 1},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.existing.refresh_from_db()
+        self.assertEqual((self.existing.bed_count, self.existing.daily_capacity), before)
+
+    def test_hospital_admin_is_bound_to_own_hospital(self):
+        other = Hospital.objects.exclude(pk=self.hospital.pk).first()
+        response = client_for_user(self.hospital_admin).post(self.url, [
+            {'hospital': other.pk, 'dept': self.new_dept.pk, 'bed_count': 1},
+        ], format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        resource = DepartmentResource.objects.get(pk=response.data['data'][0]['dept_res_id'])
+        self.assertEqual(resource.hospital_id, self.hospital.pk)
+
+    def test_create_checks_uniqueness_in_own_hospital(self):
+        # 请求里写别的医院、本院已有的科室：按本院校验，返回 400 而不是插入时撞唯一约束
+        other = Hospital.objects.exclude(pk=self.hospital.pk).first()
+        client = client_for_user(self.hospital_admin)
+        response = client.post('/api/department_resources/', {
+            'hospital': other.pk, 'dept': self.existing.dept_id, 'bed_count': 1}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('non_field_errors', response.data)
+        response = client.post('/api/department_resources/', {
+            'hospital': other.pk, 'dept': self.new_dept.pk, 'bed_count': 1}, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data['hospital'], self.hospital.pk)
+        # 也不能把本院的记录改到别的医院
+        response = client.patch(f'/api/department_resources/{self.existing.pk}/', {'hospital': other.pk},
+                                format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.existing.refresh_from_db()
+        self.assertEqual(self.existing.hospital_id, self.hospital.pk)
+
+    def test_integrity_error_is_400(self):
+        serializer = DepartmentResourceSerializer(data={
+            'hospital': self.hospital.pk, 'dept': self.existing.dept_id, 'bed_count': 1})
+        # 模拟校验之后、写入之前另一个请求插入了同一 (hospital, dept)：跳过唯一性校验
+        serializer.validators = []
+        serializer.is_valid(raise_exception=True)
+        with self.assertRaises(ValidationError):
+            DepartmentResourceViewSet._save(serializer)
+
+    def test_any_invalid_row_writes_nothing(self):
+        count = DepartmentResource.objects.count()
+        response = client_for_user(self.city).post(self.url, [
+            {'hospital': self.hospital.pk, 'dept': self.new_dept.pk, 'bed_count': 1},
+            {'hospital': self.hospital.pk, 'dept': 987654, 'bed_count': 1},
+            {'hospital': self.hospital.pk, 'dept': self.new_dept.pk, 'bed_count': 2},
+            {'hospital': self.hospital.pk, 'dept': self.existing.dept_id, 'bed_count': -1},
+        ], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['code'], 400)
+        errors = {row['index']: row['errors'] for row in response.data['data']}
+        self.assertEqual(set(errors), {1, 2, 3})
+        self.assertIn('dept', errors[1])
+        self.assertIn('non_field_errors', errors[2])
+        self.assertIn('bed_count', errors[3])
+        self.assertEqual(DepartmentResource.objects.count(), count)
+
+    def test_rejects_non_list_body(self):
+        response = client_for_user(self.city).post(self.url, {'hospital': 1}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['code'], 400)
+
+
+class ResourceMergeMigrationTests(TransactionTestCase):
+    """0010 迁移合并重复的 (hospital, dept) 资源行：退回 0009 造出重复数据，再执行迁移"""
+    before = [('api', '0009_event_report_time_idx')]
+    after = [('api', '0010_departmentresource_unique')]
+
+    def test_duplicates_are_merged(self):
+        old_apps = migrate(self.before)
+        self.addCleanup(migrate, self.after)
+        # 历史模型不发信号，也不依赖其他测试留下的数据
+        model = old_apps.get_model
+        hospital = model('api', 'Hospital').objects.create(
+            name='合并测试医院', district=model('api', 'District').objects.create(district_id=1, district_name='南山区'),
+            level=model('api', 'HospitalLevel').objects.create(level_id=1, level_name='三级甲等'))
+        first, second = (model('api', 'Department').objects.create(dept_id=dept_id, dept_name=name)
+                         for dept_id, name in ((1, '内科'), (2, '外科')))
+        Resource = model('api', 'DepartmentResource')
+        Resource.objects.bulk_create([
+            Resource(hospital=hospital, dept=first, bed_count=10, device_count=None, daily_capacity=5),
+            Resource(hospital=hospital, dept=first, bed_count=12, device_count=3, daily_capacity=None),
+            Resource(hospital=hospital, dept=second, bed_count=1, device_count=1, daily_capacity=1),
+        ])
+        keep = Resource.objects.filter(dept_id=first.pk).order_by('pk').first().pk
+
+        with self.assertLogs('api.migrations.0010_departmentresource_unique', 'WARNING'):
+            migrate(self.after)
+
+        merged = DepartmentResource.objects.get(hospital_id=hospital.pk, dept_id=first.pk)
+        self.assertEqual((merged.pk, merged.bed_count, merged.device_count, merged.daily_capacity), (keep, 12, 3, 5))
+        self.assertEqual(DepartmentResource.objects.get(hospital_id=hospital.pk, dept_id=second.pk).bed_count, 1)
+
+
+class RosterImportTests(TestCase):
+    url = '/api/hospital_staffs/import_roster/'
+    header = 'name,gender,title,phone,hire_date,employment_type,existing_staff_id\n'
+
+    @classmethod
+    def setUpTestData(cls):
+        SyntheticDataGenerator(hospitals=2, seed=42, staff_per_hospital=3).generate()
+        cls.hospital, other = Hospital.objects.order_by('pk')[:2]
+        cls.admin = make_admin('roster_admin', 'hospital_admin', cls.hospital)
+        own = set(HospitalStaff.objects.filter(hospital=cls.hospital).values_list('staff_id', flat=True))
+        cls.employed = min(own)
+        cls.elsewhere = HospitalStaff.objects.filter(hospital=other).exclude(staff_id__in=own).order_by(
+            'staff_id').first().staff_id
+
+    def upload(self, content, name='roster.csv', user=None, **data):
+        upload = SimpleUploadedFile(name, content.encode('utf-8') if isinstance(content, str) else content)
+        return client_for_user(user or self.admin).post(self.url, {'file': upload, **data}, format='multipart')
+
+    def test_csv_row_errors(self):
+        response = self.upload(self.header + '\n'.join([
+            '导入测试甲,男,主任医师,13800000000,2024-01-02,全职,',          # 2 新建
+            ',女,护士,,,,',                                               # 3 缺姓名
+            '导入测试乙,,,,2024-13-40,,',                                 # 4 日期不对
+            f'导入测试丙,,,,,兼职,{self.elsewhere}',                       # 5 关联已有员工
+            f'导入测试丁,,,,,,{self.employed}',                           # 6 已在本院任职
+            '导入测试戊,,,,,,987654321',                                  # 7 员工不存在
+            f'导入测试己,,,,,,{self.elsewhere}',                          # 8 同一文件里重复关联
+        ]) + '\n')
+        self.assertEqual(response.status_code, 200)
+        report = response.data['data']
+        self.assertEqual((report['created'], report['linked'], report['failed']), (1, 1, 5))
+        self.assertFalse(report['errors_truncated'])
+        self.assertEqual([(error['line'], sorted(error['errors'])) for error in report['errors']], [
+            (3, ['name']), (4, ['hire_date']), (6, ['existing_staff_id']), (7, ['existing_staff_id']),
+            (8, ['existing_staff_id']),
+        ])
+
+        staff = Staff.objects.get(name='导入测试甲')
+        self.assertEqual((staff.title, staff.category, staff.hire_date), ('主任医师', staff_category('主任医师'),
+                                                                         date(2024, 1, 2)))
+        self.assertTrue(HospitalStaff.objects.filter(hospital=self.hospital, staff=staff,
+                                                     employment_type='全职').exists())
+        self.assertEqual(HospitalStaff.objects.get(hospital=self.hospital, staff_id=self.elsewhere).employment_type,
+                         '兼职')
+        self.assertFalse(Staff.objects.filter(name__in=['导入测试乙', '导入测试戊']).exists())
+
+    def test_ndjson(self):
+        response = self.upload('\n'.join([
+            json.dumps({'name': '导入测试庚', 'title': '护士'}, ensure_ascii=False),
+            '{not json',
+            '',
+            '["a list"]',
+        ]), name='roster.ndjson')
+        report = response.data['data']
+        self.assertEqual((report['created'], report['failed']), (1, 2))
+        self.assertEqual([error['line'] for error in report['errors']], [2, 4])
+        self.assertTrue(Staff.objects.filter(name='导入测试庚', category=staff_category('护士')).exists())
+
+    def test_encodings(self):
+        roster = self.header + '导入测试辛,女,护士,,,,\n'
+        # Excel 导出的 GBK 文件按默认的 UTF-8 读：报告里记一条错误，不是 500
+        response = self.upload(roster.encode('gbk'))
+        self.assertEqual(response.status_code, 200)
+        report = response.data['data']
+        self.assertEqual((report['created'], report['failed']), (0, 1))
+        self.assertIn('gbk', report['errors'][0]['errors']['non_field_errors'][0])
+
+        response = self.upload(roster.encode('gbk'), encoding='gbk')
+        self.assertEqual(response.data['data']['created'], 1)
+        # UTF-8 带 BOM
+        response = self.upload(codecs.BOM_UTF8 + roster.replace('辛', '壬').encode('utf-8'))
+        self.assertEqual(response.data['data']['created'], 1)
+        self.assertEqual(Staff.objects.filter(name__in=['导入测试辛', '导入测试壬']).count(), 2)
+        self.assertEqual(self.upload(roster, encoding='no-such-codec').status_code, 400)
+
+    def test_malformed_csv_stops_with_error(self):
+        # 超过 csv.field_size_limit 的字段让 csv 模块抛错
+        response = self.upload(self.header + '导入测试癸,,,,,,\n' + 'x' * 200000 + ',,,,,,\n导入测试子,,,,,,\n')
+        report = response.data['data']
+        self.assertEqual((report['created'], report['failed']), (1, 1))
+        self.assertEqual(report['errors'][0]['line'], 3)
+        self.assertIn('CSV', report['errors'][0]['errors']['non_field_errors'][0])
+
+    def test_rejected_requests(self):
+        city = make_admin('roster_city', 'city_admin')
+        self.assertEqual(self.upload(self.header, user=city).status_code, 403)
+        self.assertEqual(client_for_user(self.admin).post(self.url, {}, format='multipart').status_code, 400)
+        self.assertEqual(self.upload(self.header, name='roster.txt', file_format='xlsx').status_code, 400)
+
+
+class ExportTests(TestCase):
+    """流式导出：CSV 带 BOM 和表头，NDJSON 每行一个对象，医院管理员只导出本院"""
+
+    @classmethod
+    def setUpTestData(cls):
+        SyntheticDataGenerator(hospitals=3, seed=42, staff_per_hospital=4).generate()
+        cls.hospital = Hospital.objects.order_by('pk').first()
+        cls.city = make_admin('export_city', 'city_admin')
+        cls.hospital_admin = make_admin('export_hospital', 'hospital_admin', cls.hospital)
+
+    def export(self, name, user=None, **params):
+        response = client_for_user(user or self.city).get(f'/api/exports/{name}/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode('utf-8')
+
+    def test_csv(self):
+        response, content = self.export('staff')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertRegex(response['Content-Disposition'], r'^attachment; filename="staff_\d{14}\.csv"$')
+        self.assertTrue(content.startswith('﻿'))
+        rows = list(csv.reader(io.StringIO(content[1:])))
+        self.assertEqual(rows[0], ['hospital_id', 'hospital_name', 'staff_id', 'name', 'gender', 'title', 'phone',
+                                   'hire_date', 'employment_type'])
+        self.assertEqual(len(rows) - 1, HospitalStaff.objects.count())
+        link = HospitalStaff.objects.select_related('hospital', 'staff').order_by('pk').first()
+        self.assertEqual(rows[1][:4], [str(link.hospital_id), link.hospital.name, str(link.staff_id), link.staff.name])
+
+    def test_ndjson(self):
+        response, content = self.export('resources', file_format='ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(len(rows), DepartmentResource.objects.count())
+        resources = {resource.pk: resource for resource in DepartmentResource.objects.select_related('hospital', 'dept')}
+        for row in rows:
+            resource = resources[row['dept_res_id']]
+            self.assertEqual(row, {
+                'dept_res_id': resource.pk, 'hospital_id': resource.hospital_id, 'hospital_name': resource.hospital.name,
+                'dept_id': resource.dept_id, 'dept_name': resource.dept.dept_name, 'bed_count': resource.bed_count,
+                'device_count': resource.device_count, 'daily_capacity': resource.daily_capacity,
+            })
+
+    def test_hospital_admin_sees_own_hospital_only(self):
+        for name, model in (('staff', HospitalStaff), ('resources', DepartmentResource),
+                            ('event_participation', HospitalEvent)):
+            with self.subTest(name=name):
+                _, content = self.export(name, user=self.hospital_admin, file_format='ndjson')
+                rows = [json.loads(line) for line in content.splitlines()]
+                self.assertEqual({row['hospital_id'] for row in rows} - {self.hospital.pk}, set())
+                self.assertEqual(len(rows), model.objects.filter(hospital=self.hospital).count())
+
+    def test_batches_cover_every_row(self):
+        pks = [row['id'] for row in iter_rows(HospitalStaff.objects.all(), ['staff_id'], batch_size=5)]
+        self.assertEqual(pks, list(HospitalStaff.objects.order_by('pk').values_list('pk', flat=True)))
+
+    def test_rejected_requests(self):
+        response = client_for_user(self.city).get('/api/exports/staff/', {'file_format': 'xlsx'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['code'], 400)
+        self.assertEqual(client_for_user().get('/api/exports/staff/').status_code, 401)
+
+
+class MetricsTests(TestCase):
+    """按路由统计耗时、SQL 次数和响应大小；/api/metrics 只对市政管理员开放"""
+
+    @classmethod
+    def setUpTestData(cls):
+        SyntheticDataGenerator(hospitals=3, seed=42, staff_per_hospital=4).generate()
+        cls.hospital = Hospital.objects.order_by('pk').first()
+        cls.city = make_admin('metrics_city', 'city_admin')
+        cls.hospital_admin = make_admin('metrics_hospital', 'hospital_admin', cls.hospital)
+
+    def setUp(self):
+        cache.clear()
+        metrics_registry.reset()
+
+    def test_latency_and_queries_accumulate_per_route(self):
+        client = client_for_user(self.city)
+        sizes = []
+        with CaptureQueriesContext(connection) as queries:
+            for _ in range(3):
+                response = client.get('/api/hospitals/')
+                self.assertEqual(response.status_code, 200)
+                sizes.append(len(response.content))
+        key = ('HospitalViewSet.list', 'GET')
+        self.assertEqual(metrics_registry.requests[key + ('2xx',)], 3)
+        self.assertEqual(metrics_registry.latency[key].count, 3)
+        self.assertGreater(metrics_registry.latency[key].sum, 0)
+        self.assertEqual(metrics_registry.queries[key].count, 3)
+        self.assertGreater(len(queries), 0)
+        self.assertEqual(metrics_registry.queries[key].sum, len(queries))
+        self.assertEqual(metrics_registry.response_size[key].sum, sum(sizes))
+
+        client.get(f'/api/hospitals/{self.hospital.pk}/')
+        self.assertEqual(metrics_registry.requests[('HospitalViewSet.retrieve', 'GET', '2xx')], 1)
+        self.assertEqual(metrics_registry.latency[key].count, 3)
+
+    def test_unmatched_route(self):
+        response = client_for_user(self.city).get('/api/no-such-endpoint/')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(metrics_registry.requests[('unmatched', 'GET', '4xx')], 1)
+        self.assertEqual(set(metrics_registry.latency), {('unmatched', 'GET')})
+
+    def test_streaming_response_is_recorded_after_body(self):
+        response = client_for_user(self.city).get('/api/exports/staff/')
+        key = ('ExportViewSet.staff', 'GET')
+        self.assertNotIn(key, metrics_registry.latency)
+        content = b''.join(response.streaming_content)
+        self.assertEqual(metrics_registry.requests[key + ('2xx',)], 1)
+        self.assertEqual(metrics_registry.response_size[key].sum, len(content))
+        self.assertGreater(metrics_registry.queries[key].sum, 0)
+
+    def test_endpoint_permissions(self):
+        self.assertEqual(client_for_user().get('/api/metrics').status_code, 401)
+        self.assertEqual(client_for_user(self.hospital_admin).get('/api/metrics').status_code, 403)
+
+        client = client_for_user(self.city)
+        client.get('/api/hospitals/')
+        response = client.get('/api/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        text = response.content.decode()
+        self.assertIn('api_requests_total{route="HospitalViewSet.list",method="GET",status="2xx"} 1', text)
+        self.assertIn('api_request_duration_seconds_count{route="HospitalViewSet.list",method="GET"} 1', text)
+        self.assertIn('api_requests_total{route="MetricsView",method="GET",status="4xx"} 2', text)
+
+    @override_settings(API_METRICS={'ENABLED': False})
+    def test_disabled(self):
+        # 中间件在客户端第一次请求时加载，新建的客户端才会读到关闭后的设置
+        self.assertEqual(client_for_user(self.city).get('/api/hospitals/').status_code, 200)
+        self.assertEqual(dict(metrics_registry.requests), {})
+
+
+class TokenClaimsTests(TestCase):
+    """JWT 声明认证 (api/authentication.py)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        SyntheticDataGenerator(hospitals=2, seed=42, staff_per_hospital=2).generate()
+        cls.hospital = Hospital.objects.order_by('pk').first()
+        cls.user = make_admin('claims_hospital', 'hospital_admin', hospital=cls.hospital)
+
+    def test_login_returns_role_and_claims(self):
+        response = APIClient().post('/api/token/', {'username': 'claims_hospital', 'password': 'x'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['role'], response.data['hospital_id']), ('hospital_admin', self.hospital.pk))
+        token = AccessToken(response.data['access'])
+        self.assertEqual((token['role'], token['hospital_id'], token['username']),
+                         ('hospital_admin', self.hospital.pk, 'claims_hospital'))
+
+    def test_claims_token_skips_user_lookup(self):
+        client = client_for_user(self.user)
+        with CaptureQueriesContext(connection) as captured:
+            response = client.get('/api/hospital_staffs/')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([q for q in captured if 'auth_user' in q['sql'] or 'api_userprofile' in q['sql']])
+        self.assertTrue(response.data)
+        self.assertTrue(all(row['hospital'] == self.hospital.pk for row in response.data))
+
+    def test_role_change_applies_to_new_tokens(self):
+        client = client_for_user(self.user)
+        UserProfile.objects.filter(user=self.user).update(role='public', hospital=None)
+        # 已签发的 token 沿用旧声明，直到过期
+        self.assertEqual(client.get('/api/hospital_staffs/').status_code, 200)
+        self.assertEqual(client_for_user(self.user).get('/api/hospital_staffs/').status_code, 403)
+
+    def test_legacy_token_reads_profile(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        self.assertEqual(client.get('/api/hospital_staffs/').status_code, 200)
+        UserProfile.objects.filter(user=self.user).update(role='public')
+        self.assertEqual(client.get('/api/hospital_staffs/').status_code, 403)
+
+    def test_deleted_hospital_cannot_write(self):
+        client = client_for_user(self.user)
+        Hospital.objects.filter(pk=self.hospital.pk).delete()
+        response = client.post('/api/hospital_staffs/', {'name': '张三', 'title': '主治医师'}, format='json')
+        self.assertEqual(response.status_code, 403)
+        roster = SimpleUploadedFile('roster.csv', 'name,title\n李四,护士\n'.encode())
+        response = client.post('/api/hospital_staffs/import_roster/', {'file': roster}, format='multipart')
+        self.assertEqual(response.status_code, 403)
+        response = client.post('/api/department_resources/bulk_upsert/', [{'dept': 1, 'bed_count': 1}], format='json')
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Staff.objects.filter(name__in=['张三', '李四']).exists())
+
+
+class StaffStatisticsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        SyntheticDataGenerator(hospitals=3, seed=42, staff_per_hospital=8).generate()
+        first, second = Hospital.objects.order_by('pk')[:2]
+        # 在两家医院执业的人、没有执业记录的人
+        cls.shared = Staff.objects.filter(hospitalstaff__hospital=first).order_by('pk').first()
+        HospitalStaff.objects.create(hospital=second, staff=cls.shared)
+        Staff.objects.create(staff_id=990001, name='未执业', title='主任医师')
+
+    def test_single_query_matches_direct_counts(self):
+        from api.views.staff import staff_statistics
+        with CaptureQueriesContext(connection) as captured:
+            overview, title_structure, hospital_rows = staff_statistics()
+        self.assertEqual(len(captured), 1)
+
+        self.assertEqual(overview['total'], Staff.objects.count())
+        for category in ('doctor', 'nurse', 'other'):
+            self.assertEqual(overview[category], Staff.objects.filter(category=category).count())
+        titles = {row['title']: row['count'] for row in title_structure}
+        for title, count in titles.items():
+            self.assertEqual(count, Staff.objects.filter(title=title).count())
+        self.assertEqual(sum(titles.values()), Staff.objects.exclude(title__isnull=True).exclude(title='').count())
+
+        self.assertEqual(len(hospital_rows), HospitalStaff.objects.values('hospital_id').distinct().count())
+        for row in hospital_rows:
+            links = HospitalStaff.objects.filter(hospital_id=row['hospital_id'])
+            self.assertEqual(row['total'], links.count())
+            self.assertEqual(row['doctors'], links.filter(staff__category='doctor').count())
+            self.assertEqual(row['nurses'], links.filter(staff__category='nurse').count())
+        self.assertEqual(hospital_rows, sorted(hospital_rows, key=lambda row: (-row['total'], row['hospital_id'])))
+
+    def test_endpoints(self):
+        client = client_for_user(make_admin('stats_city', 'city_admin'))
+        response = client.get('/api/staffs/statistics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['overview']['total_staff'], Staff.objects.count())
+        response = client.get('/api/statistics/staff_structure/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['data']['overview']['total'], Staff.objects.count())
+
+
+class IdSequenceMigrationTests(TestCase):
+    def test_staff_sequence_is_seeded(self):
+        self.assertTrue(IdSequence.objects.filter(pk=staff_id_allocator.name).exists())
+
+
+class IdAllocatorTests(TransactionTestCase):
+    """号段缓存只在事务外生效，所以用 TransactionTestCase (每个测试结束清空数据，序列行在 setUp 里补上)"""
+
+    def setUp(self):
+        IdSequence.objects.get_or_create(name=staff_id_allocator.name, defaults={'next_value': 1})
+        staff_id_allocator.reset()
+        self.addCleanup(staff_id_allocator.reset)
+
+    def test_processes_get_disjoint_blocks(self):
+        Staff.objects.create(staff_id=500, name='已有')
+        # 两个分配器实例相当于两个进程，各自缓存号段
+        first = IdBlockAllocator(staff_id_allocator.name, Staff, 'staff_id', block_size=10)
+        second = IdBlockAllocator(staff_id_allocator.name, Staff, 'staff_id', block_size=10)
+        ids = first.allocate(3) + second.allocate(15) + first.allocate(12) + second.allocate(1)
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertGreater(min(ids), 500)
+        # 缓存的号段内不再访问数据库
+        with CaptureQueriesContext(connection) as captured:
+            first.allocate(2)
+        self.assertEqual(len(captured), 0)
+
+    def test_skips_ids_written_elsewhere(self):
+        start = staff_id_allocator.allocate(1)[0]
+        staff_id_allocator.reset()
+        Staff.objects.create(staff_id=start + 1000, name='外部导入')
+        self.assertGreater(staff_id_allocator.allocate(1)[0], start + 1000)
+
+    def test_allocation_inside_transaction_is_not_cached(self):
+        with transaction.atomic():
+            ids = staff_id_allocator.allocate(3)
+        self.assertEqual(IdSequence.objects.get(pk=staff_id_allocator.name).next_value, max(ids) + 1)
+        self.assertEqual(staff_id_allocator._limit, 0)
+
+
+class EventAnalyticsTests(TestCase):
+    url = '/api/events/analytics/'
+
+    @classmethod
+    def setUpTestData(cls):
+        SyntheticDataGenerator(hospitals=3, seed=42, staff_per_hospital=2).generate()
+        EmergencyEvent.objects.all().delete()
+        cls.first, cls.second = Hospital.objects.order_by('pk')[:2]
+
+        def event(day, hour, severity, participants):
+            created = EmergencyEvent.objects.create(
+                event_type='火灾', severity=severity,
+                report_time=datetime(2025, 6, day, hour, tzinfo=dt_timezone.utc))
+            for hospital, patients in participants:
+                HospitalEvent.objects.create(event=created, hospital=hospital, affected_patient_count=patients)
+
+        event(2, 1, '一般', [(cls.first, 3), (cls.second, 4)])
+        event(2, 23, '重大', [(cls.first, 10)])
+        event(3, 12, '一般', [])
+        event(9, 8, '一般', [(cls.second, 5)])
+        event(20, 0, '一般', [(cls.first, 100)])  # 范围外
+
+    def get(self, **params):
+        return APIClient().get(self.url, {'start': '2025-06-01', 'end': '2025-06-10', **params})
+
+    def test_day_buckets_sum_to_totals(self):
+        response = self.get(bucket='day', group_by='none')
+        self.assertEqual(response.status_code, 200)
+        series = response.data['data']['series']
+        self.assertEqual([(row['bucket'].day, row['event_count'], row['affected_patients']) for row in series],
+                         [(2, 2, 17), (3, 1, 0), (9, 1, 5)])
+
+    def test_group_by_severity_and_week(self):
+        series = self.get(bucket='week', group_by='severity').data['data']['series']
+        counts = {(row['bucket'].date().isoformat(), row['group']): (row['event_count'], row['affected_patients'])
+                  for row in series}
+        # 2025-06-02 是周一
+        self.assertEqual(counts, {
+            ('2025-06-02', '一般'): (2, 7),
+            ('2025-06-02', '重大'): (1, 10),
+            ('2025-06-09', '一般'): (1, 5),
+        })
+
+    def test_district_counts_each_district_once(self):
+        series = self.get(bucket='week', group_by='district').data['data']['series']
+        events = sum(row['event_count'] for row in series if row['group'] is None)
+        self.assertEqual(events, 1)  # 没有参与医院的事件
+        patients = sum(row['affected_patients'] for row in series)
+        self.assertEqual(patients, 22)
+
+    def test_hospital_filter(self):
+        series = self.get(bucket='day', group_by='none', hospital_id=self.second.pk).data['data']['series']
+        self.assertEqual([(row['bucket'].day, row['event_count'], row['affected_patients']) for row in series],
+                         [(2, 1, 4), (9, 1, 5)])
+
+    def test_invalid_parameters(self):
+        for params in ({'hospital_id': 'abc'}, {'bucket': 'month'}, {'group_by': 'x'},
+                       {'start': 'yesterday'}, {'start': '2025-06-10', 'end': '2025-06-01'}):
+            with self.subTest(params=params):
+                response = self.get(**params)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.data['code'], 400)
+
+
+    def test_event_list_hospital_filter(self):
+        response = APIClient().get('/api/events/', {'hospital_id': self.second.pk})
+        self.assertEqual({row['event_id'] for row in response.data}, set(
+            HospitalEvent.objects.filter(hospital=self.second).values_list('event_id', flat=True)))
+        response = APIClient().get('/api/events/', {'hospital_id': 'abc'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('hospital_id', response.data)
+
+class EventParticipantsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        SyntheticDataGenerator(hospitals=3, seed=42, staff_per_hospital=2).generate()
+        cls.first, cls.second, cls.third = Hospital.objects.order_by('pk')[:3]
+        cls.event = EmergencyEvent.objects.create(event_type='火灾')
+        HospitalEvent.objects.create(event=cls.event, hospital=cls.first)
+        cls.city = make_admin('participants_city', 'city_admin')
+
+    def add(self, body):
+        return client_for_user(self.city).post(f'/api/events/{self.event.pk}/add_participants/', body, format='json')
+
+    def test_adds_participants(self):
+        response = self.add({'participants': [{'hospital_id': self.second.pk, 'role': 'support'}]})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([row['hospital'] for row in response.data['data']], [self.second.pk])
+        self.assertEqual(HospitalEvent.objects.filter(event=self.event).count(), 2)
+
+    def test_field_errors_use_envelope(self):
+        for body in ([{'role': 'support'}], [{'hospital_id': 'x'}], [{'hospital_id': self.second.pk, 'role': 'boss'}],
+                     {'participants': 'nope'}):
+            with self.subTest(body=body):
+                response = self.add(body)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.data['code'], 400)
+                self.assertIn('errors', response.data)
+
+    def test_rejections_write_nothing(self):
+        for body in ([{'hospital_id': 987654}],
+                     [{'hospital_id': self.second.pk}, {'hospital_id': self.second.pk}],
+                     [{'hospital_id': self.third.pk}, {'hospital_id': self.first.pk}]):
+            with self.subTest(body=body):
+                response = self.add(body)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.data['code'], 400)
+        self.assertEqual(HospitalEvent.objects.filter(event=self.event).count(), 1)
+
+    def test_create_rechecks_hospitals(self):
+        from api.serializers import EmergencyEventSerializer
+        serializer = EmergencyEventSerializer(data={
+            'event_type': '水灾', 'participants': [{'hospital_id': self.second.pk}, {'hospital_id': self.third.pk}]})
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        # 校验通过之后医院被删除
+        Hospital.objects.filter(pk=self.third.pk).delete()
+        with self.assertRaises(ValidationError) as raised:
+            serializer.save()
+        self.assertIn('participants', raised.exception.detail)
+        self.assertFalse(EmergencyEvent.objects.filter(event_type='水灾').exists())
+
+    def test_create_with_participants(self):
+        response = client_for_user(self.city).post('/api/events/', {
+            'event_type': '水灾', 'participants': [{'hospital_id': self.second.pk, 'role': 'primary'}],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([row['hospital'] for row in response.data['participating_hospitals']], [self.second.pk])
+        response = client_for_user(self.city).post('/api/events/', {
+            'event_type': '水灾', 'participants': [{'hospital_id': 987654}],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('participants', response.data)
+
+
+def parse_sse(chunk):
+    """'id: ..\nevent: ..\ndata: {..}' -> (event, data)"""
+    fields = dict(line.split(': ', 1) for line in chunk.strip().splitlines())
+    return fields['event'], json.loads(fields['data'])
+
+
+class EventStreamTests(TestCase):
+    """SSE 推送只在 ASGI 下提供；hospital_id / severity 过滤，Last-Event-ID 补发"""
+    url = '/api/events/stream/'
+
+    async def read(self, response):
+        chunk = await asyncio.wait_for(anext(response.streaming_content), timeout=5)
+        return chunk.decode('utf-8')
+
+    async def open(self, params, last_event_id=None):
+        headers = {'Last-Event-ID': str(last_event_id)} if last_event_id is not None else {}
+        response = await self.async_client.get(self.url, params, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertTrue((await self.read(response)).startswith('retry: '))
+        return response
+
+    async def disconnect(self, response):
+        # 和 ASGI 处理器一样：客户端断开时取消正在等待下一条消息的任务，生成器在 finally 里退订
+        reader = asyncio.ensure_future(anext(response.streaming_content))
+        await asyncio.sleep(0)
+        reader.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await reader
+
+    async def test_replay_after_last_event_id(self):
+        seen = hub.publish('event.created', {'event_id': 1, 'severity': '一般', 'hospital_ids': [1]})
+        hub.publish('event.created', {'event_id': 2, 'severity': '一般', 'hospital_ids': [2]})
+        hub.publish('event.created', {'event_id': 3, 'severity': '重大', 'hospital_ids': [1, 2]})
+        response = await self.open({'hospital_id': 1}, last_event_id=seen['id'])
+        try:
+            self.assertEqual(parse_sse(await self.read(response))[1]['event_id'], 3)
+            # 补发之后是实时消息
+            hub.publish('event.created', {'event_id': 4, 'severity': '一般', 'hospital_ids': [2]})
+            hub.publish('participation.created', {'event_id': 5, 'severity': '一般', 'hospital_ids': [1]})
+            event, data = parse_sse(await self.read(response))
+            self.assertEqual((event, data['event_id']), ('participation.created', 5))
+        finally:
+            await self.disconnect(response)
+
+    async def test_severity_filter(self):
+        subscribers = hub.subscriber_count()
+        response = await self.open({'severity': ['重大', '特别重大']})
+        try:
+            self.assertEqual(hub.subscriber_count(), subscribers + 1)
+            hub.publish('event.created', {'event_id': 1, 'severity': '一般', 'hospital_ids': []})
+            # 从关注的等级降级，也要推送
+            hub.publish('event.severity_changed', {'event_id': 2, 'severity': '一般', 'old_severity': '重大',
+                                                   'hospital_ids': []})
+            hub.publish('event.created', {'event_id': 3, 'severity': '特别重大', 'hospital_ids': []})
+            received = [parse_sse(await self.read(response)) for _ in range(2)]
+            self.assertEqual([(event, data['event_id']) for event, data in received],
+                             [('event.severity_changed', 2), ('event.created', 3)])
+        finally:
+            await self.disconnect(response)
+        self.assertEqual(hub.subscriber_count(), subscribers)
+
+    @override_settings(EVENT_FEED={'HEARTBEAT': 0.01})
+    async def test_heartbeat(self):
+        response = await self.open({})
+        try:
+            self.assertEqual(await self.read(response), ': keepalive\n\n')
+        finally:
+            await self.disconnect(response)
+
+    async def test_invalid_parameters(self):
+        for params, headers in (({'hospital_id': 'abc'}, {}), ({}, {'Last-Event-ID': 'x'})):
+            with self.subTest(params=params, headers=headers):
+                response = await self.async_client.get(self.url, params, headers=headers)
+                self.assertEqual(response.status_code, 400)
+
+    def test_wsgi_is_rejected(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['code'], 400)
+
+
+@override_settings(API_RESPONSE_CACHE={'ENABLED': False})
+class AsyncViewParityTests(TestCase):
+    """ASGI 下的异步公共接口 (backend.asgi_urls) 和同步 DRF 视图的响应逐字节相同"""
+
+    @classmethod
+    def setUpTestData(cls):
+        SyntheticDataGenerator(hospitals=3, seed=42, staff_per_hospital=3).generate()
+        refresh_derived_data()
+        cls.hospital = Hospital.objects.order_by('pk').first()
+
+    def assertSameResponse(self, method, url, body=None):
+        kwargs = {'data': body, 'content_type': 'application/json'} if body is not None else {}
+        expected = getattr(self.client, method)(url, **kwargs)
+        with override_settings(ROOT_URLCONF='backend.asgi_urls'):
+            self.assertTrue(asyncio.iscoroutinefunction(resolve(url.split('?')[0]).func))
+            actual = async_to_sync(getattr(self.async_client, method))(url, **kwargs)
+        self.assertEqual(actual.status_code, expected.status_code)
+        self.assertEqual(actual['Content-Type'], expected['Content-Type'])
+        self.assertEqual(actual.content, expected.content)
+        return actual
+
+    def test_hospital_views(self):
+        pk = self.hospital.pk
+        for url in (f'/api/hospitals/{pk}/', f'/api/hospitals/{pk}/?fields=hospital_id,name,level_name',
+                    f'/api/hospitals/{pk}/departments/', f'/api/hospitals/{pk}/scores/',
+                    f'/api/hospitals/{pk}/events/', f'/api/hospitals/{pk}/events/?omit=participating_hospitals',
+                    '/api/hospitals/987654/', '/api/hospitals/987654/events/'):
+            with self.subTest(url=url):
+                self.assertSameResponse('get', url)
+
+    def test_conditional_headers(self):
+        response = self.assertSameResponse('get', f'/api/hospitals/{self.hospital.pk}/')
+        self.assertEqual(response['ETag'], self.client.get(f'/api/hospitals/{self.hospital.pk}/')['ETag'])
+
+    def test_public_search(self):
+        for body in ({}, {'name': '医院'}, {'name': '医院', 'mode': 'index'},
+                     {'level': self.hospital.level_id, 'district': self.hospital.district_id}):
+            with self.subTest(body=body):
+                self.assertSameResponse('post', '/api/public/search_hospital/', body)
+
+
+@override_settings(DATABASE_REPLICAS={'ALIASES': ['replica_test'], 'STICKY_SECONDS': 60},
+                   API_RESPONSE_CACHE={'ENABLED': False})
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    只读副本路由 (api/db_router.py)：副本是测试库在某一时刻的 SQLite 拷贝，拷贝之后主库上的修改副本看不到
+    """
+
+    def setUp(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('副本用 SQLite 备份模拟')
+        self.level = HospitalLevel.objects.create(level_id=1, level_name='三甲')
+        self.city = make_admin('replica_city', 'city_admin')
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.replica_path = os.path.join(directory.name, 'replica.sqlite3')
+        self.replicate()
+        connections.settings['replica_test'] = dict(connections[DEFAULT_DB_ALIAS].settings_dict, NAME=self.replica_path)
+        # 别名是运行时加的，不在 settings.DATABASES 里，不能写进类属性 databases (setUpClass 时会校验)
+        type(self).databases = self.databases | {'replica_test'}
+        self.addCleanup(self.drop_replica)
+        reset_replica_health()
+        self.addCleanup(reset_replica_health)
+        cache.clear()
+
+    def replicate(self):
+        connection.ensure_connection()
+        target = sqlite3.connect(self.replica_path)
+        connection.connection.backup(target)
+        target.close()
+
+    def drop_replica(self):
+        type(self).databases = self.databases - {'replica_test'}
+        connections['replica_test'].close()
+        del connections['replica_test']
+        del connections.settings['replica_test']
+
+    def level_name(self, client):
+        response = client.get(f'/api/hospital_levels/{self.level.pk}/')
+        self.assertEqual(response.status_code, 200)
+        return response.data['level_name']
+
+    def test_reads_go_to_replica(self):
+        HospitalLevel.objects.filter(pk=self.level.pk).update(level_name='已改名')
+        self.assertEqual(self.level_name(APIClient()), '三甲')
+
+    def test_writer_reads_primary_while_sticky(self):
+        admin = client_for_user(self.city)
+        response = admin.patch(f'/api/hospital_levels/{self.level.pk}/', {'level_name': '三乙'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.level_name(admin), '三乙')
+        self.assertEqual(self.level_name(APIClient()), '三甲')
+
+    def test_unreachable_replica_falls_back(self):
+        connections['replica_test'].settings_dict['NAME'] = os.path.join(self.replica_path, 'missing', 'db.sqlite3')
+        HospitalLevel.objects.filter(pk=self.level.pk).update(level_name='已改名')
+        self.assertEqual(self.level_name(APIClient()), '已改名')
+        self.assertIn('replica_test', _down_until)
+
+    def test_query_error_on_replica_retries_on_primary(self):
+        with sqlite3.connect(self.replica_path) as replica:
+            replica.execute('DROP TABLE HospitalLevel')
+        client = APIClient(raise_request_exception=False)
+        self.assertEqual(self.level_name(client), '三甲')
+        self.assertIn('replica_test', _down_until)
+
+    @override_settings(API_RESPONSE_CACHE={'ENABLED': True})
+    def test_cache_miss_reads_primary(self):
+        HospitalLevel.objects.filter(pk=self.level.pk).update(level_name='已改名')
+        client = APIClient()
+        self.assertEqual(self.level_name(client), '已改名')
+        response = client.get(f'/api/hospital_levels/{self.level.pk}/')
+        self.assertEqual((response['X-Cache'], response.data['level_name']), ('HIT', '已改名'))
+
+
+class FieldsetTests(TestCase):
+    """?fields= / ?omit= / ?expand= 裁剪输出，同时少查不用的列和关系"""
+
+    @classmethod
+    def setUpTestData(cls):
+        SyntheticDataGenerator(hospitals=3, seed=42, staff_per_hospital=2).generate()
+        refresh_derived_data()
+        cls.city = make_admin('fieldset_city', 'city_admin')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_fields(self):
+        full = APIClient().get('/api/hospitals/').data
+        sparse = APIClient().get('/api/hospitals/?fields=hospital_id,name,no_such_field').data
+        self.assertEqual(sparse, [{'hospital_id': row['hospital_id'], 'name': row['name']} for row in full])
+
+    def test_omit_skips_prefetch(self):
+        with CaptureQueriesContext(connection) as captured:
+            rows = APIClient().get('/api/events/?omit=participating_hospitals').data
+        self.assertTrue(rows)
+        self.assertTrue(all('participating_hospitals' not in row and 'event_id' in row for row in rows))
+        self.assertFalse([query for query in captured if '"HospitalEvent"' in query['sql']])
+
+    def test_expand(self):
+        client = client_for_user(self.city)
+        plain = client.get('/api/hospital_events/').data
+        expanded = client.get('/api/hospital_events/?expand=hospital').data
+        self.assertTrue(plain)
+        names = dict(Hospital.objects.values_list('pk', 'name'))
+        for before, after in zip(plain, expanded):
+            self.assertEqual(after['hospital'], {'hospital_id': before['hospital'], 'name': names[before['hospital']]})
+            self.assertEqual({**after, 'hospital': before['hospital']}, before)
+
+    def test_nested_fields(self):
+        full = APIClient().get('/api/events/').data
+        sparse = APIClient().get('/api/events/?fields=event_id,participating_hospitals.hospital_name').data
+        self.assertEqual(sparse, [{
+            'event_id': row['event_id'],
+            'participating_hospitals': [{'hospital_name': item['hospital_name']}
+                                        for item in row['participating_hospitals']],
+        } for row in full])
+
+    def test_writes_return_full_object(self):
+        hospital = Hospital.objects.order_by('pk').first()
+        response = client_for_user(self.city).patch(f'/api/hospitals/{hospital.pk}/?fields=name',
+                                                    {'phone': '0755-12345678'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['phone'], '0755-12345678')
+        self.assertIn('address', response.data)
+
+
+@skipIf(orjson is None, 'orjson 未安装')
+class FastJSONRendererTests(TestCase):
+    """orjson 的输出要和 DRF 的 JSONRenderer 逐字节相同"""
+
+    def assertSameOutput(self, data):
+        expected = JSONRenderer().render(data, 'application/json', {})
+        self.assertEqual(FastJSONRenderer().render(data, 'application/json', {}), expected)
+
+    def test_common_types(self):
+        self.assertSameOutput({
+            'name': '深圳市人民医院', 'escape': 'a\u2028b\u2029"\\', 'ints': [0, -1, 2 ** 63 - 1, 2 ** 70],
+            'decimal': Decimal('114.0512345'), 'none': None, 'bools': [True, False],
+            'when': datetime(2025, 6, 1, 8, 30, 15, 123456, tzinfo=dt_timezone.utc),
+            'naive': datetime(2025, 6, 1, 8, 30), 'day': date(2025, 6, 1), 'span': timedelta(hours=2),
+            'nested': [{'a': [1, {'b': ()}]}], 1: 'int key',
+        })
+
+    def test_floats(self):
+        for value in (0.0, -0.0, 0.1 + 0.2, 4.5, 1e-4, 9.5e-5, 1e-7, 123456789012345.6, 1e16, 1.5e300, -2e-300):
+            with self.subTest(value=value):
+                self.assertSameOutput({'value': value, 'rows': [{'value': value}]})
+                self.assertSameOutput(value)
+
+    def test_non_finite_floats_raise_like_stdlib(self):
+        for value in (float('nan'), float('inf'), -float('inf')):
+            with self.subTest(value=value):
+                with self.assertRaises(ValueError):
+                    JSONRenderer().render({'rows': [value]})
+                with self.assertRaises(ValueError):
+                    FastJSONRenderer().render({'rows': [value]})
+
+    def test_endpoint_output(self):
+        SyntheticDataGenerator(hospitals=3, seed=42, staff_per_hospital=2).generate()
+        refresh_derived_data()
+        for url in ('/api/hospitals/', '/api/events/', '/api/public/nearby/?lat=22.6&lng=114.1&k=5'):
+            with self.subTest(url=url):
+                response = APIClient().get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.content, JSONRenderer().render(response.data, 'application/json', {}))
+
+
+class CompressionTests(TestCase):
+    """不小于 GZIP_MIN_LENGTH 的响应 gzip 压缩，SSE 不压缩；压缩后 ETag 变成弱 ETag，条件请求照常 304"""
+
+    @classmethod
+    def setUpTestData(cls):
+        SyntheticDataGenerator(hospitals=3, seed=42, staff_per_hospital=4).generate()
+        refresh_derived_data()
+        cls.city = make_admin('compression_city', 'city_admin')
+        cls.hospital = Hospital.objects.order_by('pk').first()
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, url, **headers):
+        return APIClient().get(url, HTTP_ACCEPT_ENCODING='gzip', **headers)
+
+    def test_large_response_is_compressed(self):
+        plain = APIClient().get('/api/hospitals/')
+        self.assertGreaterEqual(len(plain.content), 1024)
+        self.assertFalse(plain.has_header('Content-Encoding'))
+
+        response = self.get('/api/hospitals/')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(json.loads(gzip.decompress(response.content)), json.loads(plain.content))
+
+    def test_threshold(self):
+        url = '/api/districts/'
+        response = self.get(url)
+        self.assertLess(len(response.content), 1024)
+        self.assertFalse(response.has_header('Content-Encoding'))
+        # 中间件每次响应时读取设置
+        with override_settings(API_RENDERING={'GZIP_MIN_LENGTH': 0}):
+            self.assertEqual(self.get(url)['Content-Encoding'], 'gzip')
+        with override_settings(API_RENDERING={'GZIP_MIN_LENGTH': 10 ** 9}):
+            self.assertFalse(self.get('/api/hospitals/').has_header('Content-Encoding'))
+
+    def test_streaming_export_is_compressed(self):
+        response = client_for_user(self.city).get('/api/exports/staff/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        content = gzip.decompress(b''.join(response.streaming_content)).decode('utf-8')
+        self.assertTrue(content.startswith('﻿hospital_id,'))
+
+    async def test_event_stream_is_not_compressed(self):
+        response = await self.async_client.get('/api/events/stream/', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        chunk = await asyncio.wait_for(anext(response.streaming_content), timeout=5)
+        self.assertTrue(chunk.startswith(b'retry: '))
+        await response.streaming_content.aclose()
+
+    def test_weak_etag_and_not_modified(self):
+        url = '/api/hospitals/'
+        strong = APIClient().get(url)['ETag']
+        response = self.get(url)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['ETag'], f'W/{strong}')
+        for header in (response['ETag'], strong):
+            with self.subTest(header=header):
+                not_modified = self.get(url, HTTP_IF_NONE_MATCH=header)
+                self.assertEqual(not_modified.status_code, 304)
+                self.assertEqual(not_modified.content, b'')
+                self.assertFalse(not_modified.has_header('Content-Encoding'))
+
+
+class MessagePackNegotiationTests(TestCase):
+    """Accept: application/msgpack 返回 MessagePack；msgpack 不可用时不参与内容协商"""
+
+    @classmethod
+    def setUpTestData(cls):
+        SyntheticDataGenerator(hospitals=2, seed=42, staff_per_hospital=2).generate()
+        refresh_derived_data()
+
+    def setUp(self):
+        cache.clear()
+
+    @override_settings(API_RENDERING={'MSGPACK': False})
+    def test_unavailable(self):
+        client = APIClient()
+        self.assertEqual(client.get('/api/hospitals/', HTTP_ACCEPT='application/msgpack').status_code, 406)
+        response = client.get('/api/hospitals/', HTTP_ACCEPT='application/msgpack, application/json;q=0.5')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(json.loads(response.content), json.loads(client.get('/api/hospitals/').content))
+        self.assertEqual(client.get('/api/hospitals/', {'format': 'msgpack'}).status_code, 404)
+
+    @skipIf(msgpack is None, 'msgpack 未安装')
+    def test_msgpack(self):
+        client = APIClient()
+        expected = json.loads(client.get('/api/hospitals/').content)
+        for kwargs in ({'HTTP_ACCEPT': 'application/msgpack'}, {'data': {'format': 'msgpack'}}):
+            with self.subTest(**kwargs):
+                response = client.get('/api/hospitals/', **kwargs)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response['Content-Type'], 'application/msgpack')
+                self.assertEqual(msgpack.unpackb(response.content), expected)
@@ -10,6 +10,9 @@ from api.views.event import EmergencyEventViewSet, HospitalEventViewSet
 from api.views.public import PublicViewSet
 from api.views.hospital import DistrictViewSet
 from api.views.statistics import StatisticsViewSet
+from api.views.export import ExportViewSet
+from api.metrics import MetricsView
+from api.event_feed import event_stream
 router = DefaultRouter()
 
 # 🏥 医院模块
@@ -37,6 +40,12 @@ router.register(r'public', PublicViewSet, basename='public')
 router.register(r'districts', DistrictViewSet)
 # 📊 统计模块
 router.register(r'statistics', StatisticsViewSet, basename='statistics')
+# 📤 导出模块 (流式 CSV / NDJSON)
+router.register(r'exports', ExportViewSet, basename='exports')
 urlpatterns = [
+    # 🚨 突发事件实时推送 (SSE，需要 ASGI)；放在 router 前面，否则会被 events/{pk}/ 匹配
+    path('events/stream/', event_stream, name='event-stream'),
     path('', include(router.urls)),
+    # 📈 接口性能指标 (Prometheus 文本格式)
+    path('metrics', MetricsView.as_view(), name='metrics'),
 ]
\ No newline at end of file
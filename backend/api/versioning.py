@@ -0,0 +1,127 @@
+# api/versioning.py
+"""
+基于表版本号的条件请求 (ETag / Last-Modified / 304)
+
+- 每张表在 TableVersion 里有一行 (version, updated_at)，模型保存/删除时
+  由 api/signals.py 调用 bump_table_version() 在同一事务里 +1
+- 接口用 @conditional_response('Hospital', 'District', ...) 声明依赖的表，
+  ETag = hash(依赖表的版本号 + 请求路径/参数 + Accept)，Last-Modified = 依赖表最后写入时间
+- 客户端带 If-None-Match / If-Modified-Since 且未变化时直接返回 304，
+  只查一次 TableVersion，不跑列表查询也不走序列化器
+- Last-Modified 是秒级的：最后写入还在当前这一秒内时不提供，也不按 If-Modified-Since 返回 304 (见 _settled)
+
+异步视图 (api/views/public_async.py) 用 aget_table_versions + conditional_headers，规则相同
+
+注意：queryset.update() / bulk_create() 不触发信号，批量写入后要手动 bump_table_version()
+"""
+import hashlib
+from functools import wraps
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from api.models import TableVersion
+
+
+def bump_table_version(*tables):
+    now = timezone.now()
+    for table in tables:
+        updated = TableVersion.objects.filter(pk=table).update(version=F('version') + 1, updated_at=now)
+        if not updated:
+            try:
+                with transaction.atomic():
+                    TableVersion.objects.create(table=table, version=1, updated_at=now)
+            except IntegrityError:
+                # 并发请求刚刚创建了这一行
+                TableVersion.objects.filter(pk=table).update(version=F('version') + 1, updated_at=now)
+
+
+def _versions(tables, rows):
+    rows = {row.table: row for row in rows}
+    versions = [rows[table].version if table in rows else 0 for table in tables]
+    last_modified = max((row.updated_at for row in rows.values()), default=None)
+    return versions, last_modified
+
+
+def get_table_versions(tables):
+    """返回 ([版本号...], 最后写入时间)；从未写入过的表版本号为 0"""
+    return _versions(tables, TableVersion.objects.filter(pk__in=tables))
+
+
+async def aget_table_versions(tables):
+    return _versions(tables, [row async for row in TableVersion.objects.filter(pk__in=tables)])
+
+
+def _etag_matches(header, etag):
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    # 304 比较用弱比较，忽略 W/ 前缀
+    candidates = [item.strip() for item in header.split(',')]
+    return any(candidate.removeprefix('W/') == etag for candidate in candidates)
+
+
+def _settled(last_modified):
+    """
+    Last-Modified 只有秒级精度：最后写入还在当前这一秒内时，同一秒里后续的写入不会改变它，
+    拿它做 If-Modified-Since 会得到过期的 304。这时不提供 Last-Modified，也不按它返回 304
+    """
+    return last_modified is not None and int(last_modified.timestamp()) < int(timezone.now().timestamp())
+
+
+def conditional_headers(endpoint, request, versions, last_modified):
+    """返回 (ETag, 是否未变化)"""
+    raw = '|'.join([
+        endpoint,
+        request.get_full_path(),
+        request.META.get('HTTP_ACCEPT', ''),
+        ','.join(map(str, versions)),
+    ])
+    etag = quote_etag(hashlib.sha1(raw.encode('utf-8')).hexdigest())
+
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    not_modified = _etag_matches(if_none_match, etag)
+    if if_none_match is None and _settled(last_modified):
+        # 没有 If-None-Match 时才看 If-Modified-Since (RFC 9110)
+        since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+        not_modified = since is not None and int(last_modified.timestamp()) <= since
+    return etag, not_modified
+
+
+def set_conditional_headers(response, etag, last_modified):
+    response['ETag'] = etag
+    if _settled(last_modified):
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    return response
+
+
+def conditional_response(*tables):
+    """
+    视图方法装饰器，只对 GET/HEAD 生效：
+        @conditional_response('Hospital', 'HospitalStaff')
+        def list(self, request, *args, **kwargs): ...
+    """
+    def decorator(view_method):
+        @wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view_method(self, request, *args, **kwargs)
+
+            versions, last_modified = get_table_versions(tables)
+            etag, not_modified = conditional_headers(
+                f'{self.__class__.__name__}.{view_method.__name__}', request, versions, last_modified)
+
+            if not_modified:
+                response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            else:
+                response = view_method(self, request, *args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+            return set_conditional_headers(response, etag, last_modified)
+        return wrapper
+    return decorator
@@ -1,7 +1,18 @@
-from rest_framework import viewsets
-from api.models import Department, DepartmentResource, DepartmentStaff
-from api.serializers import DepartmentSerializer, DepartmentResourceSerializer, DepartmentStaffSerializer
-from api.permission import IsCityAdmin, IsHospitalAdmin, ReadOnly
+from django.db import IntegrityError, connections, router, transaction
+from rest_framework import viewsets, status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from api.models import Department, DepartmentResource, DepartmentStaff, Hospital
+from api.serializers import (
+    DepartmentSerializer, DepartmentResourceSerializer, DepartmentStaffSerializer,
+    DepartmentResourceBulkItemSerializer,
+)
+from api.permission import IsCityAdmin, IsHospitalAdmin, ReadOnly, get_admin_hospital, get_hospital_id, get_role
+from api.search import candidate_ids, contains_q
+from api.response_cache import cache_response
+from api.versioning import conditional_response
+from api.summary import apply_summary_delta, icu_department_q
 
 
 # =========================================================
@@ -12,6 +23,25 @@ class DepartmentViewSet(viewsets.ModelViewSet):
     serializer_class = DepartmentSerializer
     permission_classes = [IsCityAdmin | ReadOnly]
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        # ?keyword= 科室名关键字搜索 (走倒排索引，见 api/search.py)
+        keyword = self.request.query_params.get('keyword')
+        if keyword:
+            queryset = queryset.filter(pk__in=candidate_ids('department', keyword)).filter(
+                contains_q('department', keyword))
+        return queryset
+
+    @conditional_response('Department')
+    @cache_response('Department')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional_response('Department')
+    @cache_response('Department')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
 
 # =========================================================
 # 2. 科室资源 (床位/设备) - [使用更新后的逻辑]
@@ -35,22 +65,164 @@ class DepartmentResourceViewSet(viewsets.ModelViewSet):
             return DepartmentResource.objects.none()
 
         # 医院管理员逻辑：只返回关联医院的资源
-        if hasattr(user, 'profile') and user.profile.role == 'hospital_admin':
-            if user.profile.hospital:
-                return DepartmentResource.objects.filter(hospital=user.profile.hospital)
+        if get_role(user) == 'hospital_admin':
+            hospital_id = get_hospital_id(user)
+            if hospital_id:
+                return DepartmentResource.objects.filter(hospital_id=hospital_id)
             return DepartmentResource.objects.none()
 
         # 市政管理员或超级用户可以看到所有
         return DepartmentResource.objects.all()
 
+    def get_serializer(self, *args, **kwargs):
+        # 医院管理员写入的记录强制绑定到本院：在校验之前换掉请求里的 hospital，
+        # (hospital, dept) 的唯一性校验才是按本院做的
+        data = kwargs.get('data')
+        if isinstance(data, dict) and get_role(self.request.user) == 'hospital_admin':
+            data = data.copy()
+            data['hospital'] = get_admin_hospital(self.request.user).pk
+            kwargs['data'] = data
+        return super().get_serializer(*args, **kwargs)
+
     def perform_create(self, serializer):
-        # 创建时的逻辑
-        user = self.request.user
-        if hasattr(user, 'profile') and user.profile.role == 'hospital_admin':
-            # 强制绑定到当前管理员的医院
-            serializer.save(hospital=user.profile.hospital)
-        else:
-            serializer.save()
+        self._save(serializer)
+
+    def perform_update(self, serializer):
+        self._save(serializer)
+
+    @staticmethod
+    def _save(serializer):
+        # 并发写入同一 (hospital, dept) 时由唯一约束兜底，返回 400 而不是 500
+        try:
+            with transaction.atomic():
+                serializer.save()
+        except IntegrityError:
+            raise ValidationError({'non_field_errors': ['该医院已有这个科室的资源记录']})
+
+    BULK_MAX_RECORDS = 5000
+    BULK_BATCH_SIZE = 500
+    RESOURCE_FIELDS = ('bed_count', 'device_count', 'daily_capacity')
+
+    # POST /api/department_resources/bulk_upsert/
+    # 请求体: [{"hospital": 1, "dept": 3, "bed_count": 50, "device_count": 10, "daily_capacity": 200}, ...]
+    #        (也可以是 {"records": [...]})
+    @action(detail=False, methods=['post'])
+    def bulk_upsert(self, request):
+        """
+        批量新增/更新科室资源，按 (hospital, dept) 匹配已有记录
+        - 医院管理员的记录一律绑定到本院 (和 perform_create 一致)
+        - 整批在一个事务里：任何一行校验失败则全部不写入，返回 400 和逐行错误
+        - 成功时返回逐行结果 {index, status: created/updated, dept_res_id}
+        """
+        records = request.data.get('records') if isinstance(request.data, dict) else request.data
+        if not isinstance(records, list):
+            return Response({"code": 400, "message": "请求体必须是记录列表"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(records) > self.BULK_MAX_RECORDS:
+            return Response({"code": 400, "message": f"单次最多 {self.BULK_MAX_RECORDS} 条"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        user = request.user
+        forced_hospital_id = None
+        if get_role(user) == 'hospital_admin':
+            forced_hospital_id = get_admin_hospital(user).pk
+
+        # 1. 逐行校验格式
+        results = []
+        rows = []
+        for index, record in enumerate(records):
+            item = DepartmentResourceBulkItemSerializer(data=record)
+            if not item.is_valid():
+                results.append({"index": index, "status": "error", "errors": item.errors})
+                continue
+            row = dict(item.validated_data)
+            if forced_hospital_id is not None:
+                row['hospital'] = forced_hospital_id
+            elif 'hospital' not in row:
+                results.append({"index": index, "status": "error", "errors": {"hospital": ["该字段是必填项。"]}})
+                continue
+            rows.append((index, row))
+            results.append(None)
+
+        # 2. 批量校验外键是否存在、批内是否重复 (各一次查询)
+        hospital_ids = {row['hospital'] for _, row in rows}
+        dept_ids = {row['dept'] for _, row in rows}
+        existing_hospitals = set(Hospital.objects.filter(pk__in=hospital_ids).values_list('pk', flat=True))
+        existing_depts = set(Department.objects.filter(pk__in=dept_ids).values_list('pk', flat=True))
+        seen = {}
+        for index, row in rows:
+            errors = {}
+            if row['hospital'] not in existing_hospitals:
+                errors['hospital'] = [f"医院 {row['hospital']} 不存在"]
+            if row['dept'] not in existing_depts:
+                errors['dept'] = [f"科室 {row['dept']} 不存在"]
+            key = (row['hospital'], row['dept'])
+            if key in seen:
+                errors['non_field_errors'] = [f"与第 {seen[key]} 行重复"]
+            seen.setdefault(key, index)
+            if errors:
+                results[index] = {"index": index, "status": "error", "errors": errors}
+
+        if any(result is not None for result in results):
+            return Response({
+                "code": 400,
+                "message": "部分记录校验失败，未写入任何数据",
+                "data": [result for result in results if result is not None],
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        # 3. 一个事务内：锁定已有记录 (计算汇总增量、区分新增/更新)，再按 (hospital, dept) 唯一约束分批 upsert
+        #    (MySQL: INSERT ... ON DUPLICATE KEY UPDATE；PostgreSQL / SQLite: ON CONFLICT DO UPDATE)
+        icu_depts = set(Department.objects.filter(icu_department_q(), pk__in=dept_ids).values_list('pk', flat=True))
+        device_delta = 0
+        icu_delta = 0
+        using = router.db_for_write(DepartmentResource)
+        # MySQL 不支持指定冲突列，ON DUPLICATE KEY UPDATE 按表上的唯一约束匹配
+        conflict_target = (
+            {'unique_fields': ['hospital', 'dept']}
+            if connections[using].features.supports_update_conflicts_with_target else {}
+        )
+        with transaction.atomic(using=using):
+            existing = {
+                (resource.hospital_id, resource.dept_id): resource
+                for resource in DepartmentResource.objects.using(using).select_for_update().filter(
+                    hospital_id__in=hospital_ids, dept_id__in=dept_ids)
+            }
+            upserts = []
+            for index, row in rows:
+                old = existing.get((row['hospital'], row['dept']))
+                resource = DepartmentResource(hospital_id=row['hospital'], dept_id=row['dept'])
+                for field in self.RESOURCE_FIELDS:
+                    # 冲突时 update_fields 整列覆盖：请求里没给的字段带上原值
+                    setattr(resource, field, row[field] if field in row else getattr(old, field, None))
+                device_delta += (resource.device_count or 0) - ((old.device_count or 0) if old else 0)
+                if row['dept'] in icu_depts:
+                    icu_delta += (resource.bed_count or 0) - ((old.bed_count or 0) if old else 0)
+                upserts.append((index, resource, old))
+
+            DepartmentResource.objects.using(using).bulk_create(
+                [resource for _, resource, _ in upserts], batch_size=self.BULK_BATCH_SIZE,
+                update_conflicts=True, update_fields=self.RESOURCE_FIELDS, **conflict_target)
+            if any(resource.pk is None for _, resource, _ in upserts):
+                # MySQL 的 upsert 不回填主键，按 (hospital, dept) 补查一次
+                ids = {
+                    (hospital_id, dept_id): pk
+                    for pk, hospital_id, dept_id in DepartmentResource.objects.using(using).filter(
+                        hospital_id__in=hospital_ids, dept_id__in=dept_ids).values_list('pk', 'hospital_id', 'dept_id')
+                }
+                for _, resource, _ in upserts:
+                    resource.pk = ids.get((resource.hospital_id, resource.dept_id))
+            # 批量写入不触发信号，手动维护全市汇总
+            apply_summary_delta(total_devices=device_delta, icu_beds=icu_delta)
+
+        for index, resource, old in upserts:
+            results[index] = {
+                "index": index, "status": "created" if old is None else "updated", "dept_res_id": resource.dept_res_id,
+            }
+
+        return Response({
+            "code": 0,
+            "message": "success",
+            "data": results
+        })
 
 
 # =========================================================
@@ -1,24 +1,187 @@
 # backend/api/views/event.py
-from rest_framework import viewsets, permissions
+from datetime import datetime, time, timedelta
+
+from django.db.models import Count, Exists, OuterRef, Sum
+from django.db.models.functions import Coalesce, TruncDay, TruncHour, TruncWeek
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.db import transaction
+from rest_framework import viewsets, permissions, status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from api.fieldsets import prune_queryset
 from api.models import EmergencyEvent, HospitalEvent
-from api.permission import IsCityAdmin, IsHospitalAdmin, IsCityOrHospitalAdmin, ReadOnly
-from api.serializers import EmergencyEventSerializer, HospitalEventSerializer
+from api.permission import IsCityAdmin, IsHospitalAdmin, IsCityOrHospitalAdmin, ReadOnly, get_admin_hospital, get_role
+from api.serializers import (
+    EmergencyEventSerializer, HospitalEventParticipantSerializer, HospitalEventSerializer,
+    create_participants, validate_participants,
+)
+
+def participated_by(hospital_id):
+    """事件有该医院的参与记录 (EXISTS 子查询)"""
+    return Exists(HospitalEvent.objects.filter(event=OuterRef('pk'), hospital_id=hospital_id))
+
 
 # 1. 突发事件定义
 class EmergencyEventViewSet(viewsets.ModelViewSet):
     queryset = EmergencyEvent.objects.all().order_by('-report_time') # 默认按时间倒序
     serializer_class = EmergencyEventSerializer
     permission_classes = [IsCityOrHospitalAdmin | ReadOnly]
+    # 分页时按上报时间倒序翻页 (主键自动作为决胜字段)
+    keyset_ordering = ('-report_time',)
 
     def get_queryset(self):
         queryset = super().get_queryset()
         # 获取 URL 参数中的 hospital_id
         hospital_id = self.request.query_params.get('hospital_id')
         if hospital_id:
-            # 筛选出 该医院参与的 事件
-            queryset = queryset.filter(hospital_participations__hospital_id=hospital_id).distinct()
+            try:
+                hospital_id = int(hospital_id)
+            except ValueError:
+                raise ValidationError({'hospital_id': [f'hospital_id 必须是整数: {hospital_id}']})
+            # 筛选出 该医院参与的 事件 (EXISTS 子查询，不用 JOIN + DISTINCT)
+            queryset = queryset.filter(participated_by(hospital_id))
+        # list/retrieve 的参与医院预取由 FieldsetFilterBackend 按返回字段加上 (?omit=participating_hospitals 时不预取)
         return queryset
 
+    # POST /api/events/{id}/add_participants/
+    # 请求体: [{"hospital_id": 3, "role": "support"}, ...] (也可以是 {"participants": [...]})
+    @action(detail=True, methods=['post'])
+    def add_participants(self, request, pk=None):
+        """
+        给已有事件追加参与医院：一次查询校验全部医院 id，一条 bulk_create 写入，整批在一个事务里
+        """
+        event = self.get_object()
+        records = request.data.get('participants') if isinstance(request.data, dict) else request.data
+        serializer = HospitalEventParticipantSerializer(data=records, many=True)
+        if not serializer.is_valid():
+            return Response({"code": 400, "message": "参与医院校验失败", "errors": serializer.errors},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            # 锁住事件行，并发追加同一家医院时第二个请求会在这里等待，随后被"已参与"校验拦下；
+            # 医院也一并锁住，校验通过后不会被并发删除
+            EmergencyEvent.objects.select_for_update().filter(pk=event.pk).first()
+            try:
+                participants = validate_participants(serializer.validated_data, event=event, lock=True)
+            except ValidationError as exc:
+                return Response({"code": 400, "message": "参与医院校验失败", "errors": exc.detail},
+                                status=status.HTTP_400_BAD_REQUEST)
+            create_participants(event, participants)
+
+        # bulk_create 在 MySQL 上不回填主键，重新查一次 (带医院名)
+        context = {'request': request}
+        rows = prune_queryset(HospitalEvent.objects.filter(
+            event=event, hospital_id__in=[p['hospital_id'] for p in participants]).order_by('pk'),
+            HospitalEventSerializer(context=context))
+        return Response({
+            "code": 0,
+            "message": "success",
+            "data": HospitalEventSerializer(rows, many=True, context=context).data
+        }, status=status.HTTP_201_CREATED)
+
+    # analytics 的时间粒度：(截断函数, 单个桶的时长, 不传 start 时的默认跨度)
+    ANALYTICS_BUCKETS = {
+        'hour': (TruncHour, timedelta(hours=1), timedelta(days=2)),
+        'day': (TruncDay, timedelta(days=1), timedelta(days=30)),
+        'week': (TruncWeek, timedelta(weeks=1), timedelta(weeks=26)),
+    }
+    # 分组维度 -> values() 字段；district 取参与医院所在行政区
+    ANALYTICS_GROUPS = {
+        'none': None,
+        'severity': 'severity',
+        'event_type': 'event_type',
+        'district': 'hospital_participations__hospital__district__district_name',
+    }
+    ANALYTICS_MAX_BUCKETS = 2000
+
+    @staticmethod
+    def _parse_bound(value, is_end):
+        """接受 YYYY-MM-DD 或 ISO 时间；只给日期的 end 包含当天整天"""
+        parsed = parse_datetime(value)
+        if parsed is None:
+            day = parse_date(value)
+            if day is None:
+                raise ValueError(value)
+            parsed = datetime.combine(day + timedelta(days=1) if is_end else day, time.min)
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        return parsed
+
+    # GET /api/events/analytics/?bucket=day&group_by=severity&start=2025-06-01&end=2025-06-30&hospital_id=
+    @action(detail=False, methods=['get'])
+    def analytics(self, request):
+        """
+        按时间桶统计事件数和受影响患者数 (HospitalEvent.affected_patient_count 之和)，
+        在数据库里一次 GROUP BY 算完，前端趋势图不用再拉全量事件
+        - bucket: hour / day / week (周一开始)，默认 day
+        - group_by: none / severity / event_type / district，默认 severity
+          district 按参与医院所在行政区统计：跨区事件在每个相关行政区各计一次，没有参与医院的事件行政区为 null
+        - start / end: 时间范围 [start, end)，默认最近一段 (随 bucket 变化)
+        桶的时间按 settings.TIME_ZONE 截断 (MySQL 需要加载时区表)
+        """
+        bucket = request.query_params.get('bucket', 'day')
+        group_by = request.query_params.get('group_by', 'severity')
+        if bucket not in self.ANALYTICS_BUCKETS:
+            return Response({"code": 400, "message": f"不支持的时间粒度: {bucket}"}, status=400)
+        if group_by not in self.ANALYTICS_GROUPS:
+            return Response({"code": 400, "message": f"不支持的分组: {group_by}"}, status=400)
+        trunc, step, default_span = self.ANALYTICS_BUCKETS[bucket]
+
+        try:
+            end = request.query_params.get('end')
+            end = self._parse_bound(end, is_end=True) if end else timezone.now()
+            start = request.query_params.get('start')
+            start = self._parse_bound(start, is_end=False) if start else end - default_span
+        except ValueError as exc:
+            return Response({"code": 400, "message": f"时间格式错误: {exc}"}, status=400)
+        if start >= end:
+            return Response({"code": 400, "message": "start 必须早于 end"}, status=400)
+        hospital_id = request.query_params.get('hospital_id')
+        if hospital_id:
+            try:
+                hospital_id = int(hospital_id)
+            except ValueError:
+                return Response({"code": 400, "message": f"hospital_id 必须是整数: {hospital_id}"}, status=400)
+        if (end - start) / step > self.ANALYTICS_MAX_BUCKETS:
+            return Response({"code": 400, "message": f"时间范围过大，最多 {self.ANALYTICS_MAX_BUCKETS} 个 {bucket}"},
+                            status=400)
+
+        # 走 report_time 索引做范围过滤
+        queryset = EmergencyEvent.objects.filter(report_time__gte=start, report_time__lt=end)
+        if hospital_id:
+            queryset = queryset.filter(hospital_participations__hospital_id=hospital_id)
+
+        group_field = self.ANALYTICS_GROUPS[group_by]
+        keys = ['bucket'] + ([group_field] if group_field else [])
+        rows = queryset.annotate(bucket=trunc('report_time')).values(*keys).annotate(
+            # 和 HospitalEvent 连接后一个事件会有多行，事件数要去重
+            event_count=Count('pk', distinct=True),
+            affected_patients=Coalesce(Sum('hospital_participations__affected_patient_count'), 0),
+        ).order_by(*keys)
+
+        series = [
+            {
+                "bucket": row['bucket'],
+                "group": row[group_field] if group_field else None,
+                "event_count": row['event_count'],
+                "affected_patients": row['affected_patients'],
+            }
+            for row in rows
+        ]
+        return Response({
+            "code": 0,
+            "message": "success",
+            "data": {
+                "bucket": bucket,
+                "group_by": group_by,
+                "start": start,
+                "end": end,
+                "series": series,
+            }
+        })
+
 # 2. 医院参与事件记录
 class HospitalEventViewSet(viewsets.ModelViewSet):
     queryset = HospitalEvent.objects.all()
@@ -27,7 +190,7 @@ class HospitalEventViewSet(viewsets.ModelViewSet):
 
     def perform_create(self, serializer):
         user = self.request.user
-        if hasattr(user, 'profile') and user.profile.role == 'hospital_admin':
-            serializer.save(hospital=user.profile.hospital)
+        if get_role(user) == 'hospital_admin':
+            serializer.save(hospital=get_admin_hospital(user))
         else:
             serializer.save()
\ No newline at end of file
@@ -0,0 +1,141 @@
+# backend/api/views/export.py
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rest_framework import viewsets, status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+from api.models import DepartmentResource, HospitalEvent, HospitalStaff
+from api.permission import IsCityAdmin, IsHospitalAdmin, get_hospital_id, get_role
+
+EXPORT_FORMATS = ('csv', 'ndjson')
+EXPORT_BATCH_SIZE = 2000
+
+
+class _Echo:
+    """csv.writer 需要一个带 write() 的对象，这里直接把写入的行返回给生成器"""
+    def write(self, value):
+        return value
+
+
+def iter_rows(queryset, fields, batch_size=EXPORT_BATCH_SIZE):
+    """
+    按主键分批 (keyset) 读取 .values() 投影，每批只在内存里放 batch_size 行。
+    MySQL 驱动会把 .iterator() 的整个结果集缓存在客户端，所以这里用 pk > last_pk 分批，
+    在 MySQL / SQLite 上内存都是常数
+    """
+    pk_name = queryset.model._meta.pk.attname
+    fields = list(fields)
+    if pk_name not in fields:
+        fields.insert(0, pk_name)
+    last_pk = None
+    while True:
+        batch = queryset.order_by(pk_name)
+        if last_pk is not None:
+            batch = batch.filter(**{pk_name + '__gt': last_pk})
+        rows = list(batch.values(*fields)[:batch_size])
+        if not rows:
+            return
+        yield from rows
+        last_pk = rows[-1][pk_name]
+        if len(rows) < batch_size:
+            return
+
+
+def stream_csv(rows, columns):
+    writer = csv.writer(_Echo())
+    # BOM：让 Excel 正确识别中文
+    yield '\ufeff' + writer.writerow([label for _, label in columns])
+    for row in rows:
+        yield writer.writerow(['' if row[field] is None else row[field] for field, _ in columns])
+
+
+def stream_ndjson(rows, columns):
+    for row in rows:
+        yield json.dumps({label: row[field] for field, label in columns},
+                         ensure_ascii=False, cls=DjangoJSONEncoder) + '\n'
+
+
+class ExportViewSet(viewsets.ViewSet):
+    """
+    数据导出 (流式 CSV / NDJSON，全市数据量也是常数内存)
+    GET /api/exports/staff/?file_format=csv|ndjson
+    - 医院管理员只能导出本院数据，市政管理员导出全市 (和 HospitalStaffViewSet.get_queryset 一致)
+    """
+    permission_classes = [IsCityAdmin | IsHospitalAdmin]
+
+    def scope_to_hospital(self, queryset):
+        user = self.request.user
+        if get_role(user) == 'hospital_admin':
+            return queryset.filter(hospital_id=get_hospital_id(user))
+        return queryset
+
+    def export(self, name, queryset, columns):
+        file_format = self.request.query_params.get('file_format', 'csv')
+        if file_format not in EXPORT_FORMATS:
+            return Response({"code": 400, "message": f"不支持的格式: {file_format}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        rows = iter_rows(queryset, [field for field, _ in columns])
+        if file_format == 'csv':
+            content = stream_csv(rows, columns)
+            content_type = 'text/csv; charset=utf-8'
+        else:
+            content = stream_ndjson(rows, columns)
+            content_type = 'application/x-ndjson; charset=utf-8'
+
+        filename = f"{name}_{timezone.now():%Y%m%d%H%M%S}.{file_format}"
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    # GET /api/exports/staff/  医护人员花名册 (按医院执业关系)
+    @action(detail=False, methods=['get'])
+    def staff(self, request):
+        queryset = self.scope_to_hospital(HospitalStaff.objects.all())
+        return self.export('staff', queryset, [
+            ('hospital_id', 'hospital_id'),
+            ('hospital__name', 'hospital_name'),
+            ('staff_id', 'staff_id'),
+            ('staff__name', 'name'),
+            ('staff__gender', 'gender'),
+            ('staff__title', 'title'),
+            ('staff__phone', 'phone'),
+            ('staff__hire_date', 'hire_date'),
+            ('employment_type', 'employment_type'),
+        ])
+
+    # GET /api/exports/resources/  科室资源 (床位/设备/日接诊能力)
+    @action(detail=False, methods=['get'])
+    def resources(self, request):
+        queryset = self.scope_to_hospital(DepartmentResource.objects.all())
+        return self.export('resources', queryset, [
+            ('dept_res_id', 'dept_res_id'),
+            ('hospital_id', 'hospital_id'),
+            ('hospital__name', 'hospital_name'),
+            ('dept_id', 'dept_id'),
+            ('dept__dept_name', 'dept_name'),
+            ('bed_count', 'bed_count'),
+            ('device_count', 'device_count'),
+            ('daily_capacity', 'daily_capacity'),
+        ])
+
+    # GET /api/exports/event_participation/  医院参与突发事件记录
+    @action(detail=False, methods=['get'])
+    def event_participation(self, request):
+        queryset = self.scope_to_hospital(HospitalEvent.objects.all())
+        return self.export('event_participation', queryset, [
+            ('event_id', 'event_id'),
+            ('event__event_type', 'event_type'),
+            ('event__severity', 'severity'),
+            ('event__report_time', 'report_time'),
+            ('hospital_id', 'hospital_id'),
+            ('hospital__name', 'hospital_name'),
+            ('role', 'role'),
+            ('response_time', 'response_time'),
+            ('affected_patient_count', 'affected_patient_count'),
+        ])
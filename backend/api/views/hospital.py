@@ -1,13 +1,16 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from api.permission import IsCityAdmin, IsHospitalAdmin, IsCityOrHospitalAdmin,ReadOnly
+from api.permission import IsCityAdmin, IsHospitalAdmin, IsCityOrHospitalAdmin,ReadOnly, get_admin_hospital, get_role
+from api.fieldsets import prune_queryset
+from api.response_cache import cache_response
+from api.versioning import conditional_response
 from rest_framework import permissions
 from rest_framework.permissions import IsAuthenticated
 # 引入我们定义好的模型和序列化器
 from api.models import (
     Hospital, HospitalLevel, HospitalDepartment,District ,
-    HospitalServiceScore, EmergencyEvent, HospitalEvent,
+    HospitalServiceScore, EmergencyEvent,
     Department, DepartmentResource
 )
 from api.serializers import (
@@ -15,6 +18,7 @@ from api.serializers import (
     HospitalDepartmentSerializer, HospitalServiceScoreSerializer,
     EmergencyEventSerializer
 )
+from api.views.event import participated_by
 
 
 # 🏥 2. 医院等级 (改为 ModelViewSet 以支持 POST)
@@ -29,11 +33,31 @@ class HospitalLevelViewSet(viewsets.ModelViewSet):
     # 只有市政能增删改，其他人(包括居民)只能看
     permission_classes = [IsCityAdmin | ReadOnly]
 
+    @conditional_response('HospitalLevel')
+    @cache_response('HospitalLevel')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional_response('HospitalLevel')
+    @cache_response('HospitalLevel')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
 # --- 2. 医院核心视图 ---
 # 🏥 1. 医院基础信息
 class HospitalViewSet(viewsets.ModelViewSet):
     queryset = Hospital.objects.all()
     serializer_class = HospitalSerializer
+    # list/retrieve/update 的等级、行政区 JOIN 和员工数子查询由 FieldsetFilterBackend 按返回字段加上
+
+    # 医院列表/详情依赖医院本身、员工数、行政区名和等级名
+    @conditional_response('Hospital', 'HospitalStaff', 'District', 'HospitalLevel')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional_response('Hospital', 'HospitalStaff', 'District', 'HospitalLevel')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
 
     def get_permissions(self):
         # POST(创建医院): 只有市政
@@ -50,11 +74,14 @@ class HospitalViewSet(viewsets.ModelViewSet):
     # 【自定义功能 1】: 获取某医院的所有科室
     # URL: GET /api/hospitals/{id}/departments/
     @action(detail=True, methods=['get'])
+    @cache_response('hospital:{pk}', 'Department')
     def departments(self, request, pk=None):
         hospital = self.get_object()  # 获取当前医院对象
-        # 查询中间表
-        relations = HospitalDepartment.objects.filter(hospital=hospital)
-        serializer = HospitalDepartmentSerializer(relations, many=True)
+        # 查询中间表 (医院名/科室名一次 JOIN 进来，?fields= 裁剪后只取用到的列)
+        context = {'request': request}
+        relations = prune_queryset(HospitalDepartment.objects.filter(hospital=hospital),
+                                   HospitalDepartmentSerializer(context=context))
+        serializer = HospitalDepartmentSerializer(relations, many=True, context=context)
 
         # 返回符合 qwen.md 定义的格式
         return Response({
@@ -66,10 +93,13 @@ class HospitalViewSet(viewsets.ModelViewSet):
     # 【自定义功能 2】: 获取某医院的评分
     # URL: GET /api/hospitals/{id}/scores/
     @action(detail=True, methods=['get'])
+    @cache_response('hospital:{pk}')
     def scores(self, request, pk=None):
         hospital = self.get_object()
-        scores = HospitalServiceScore.objects.filter(hospital=hospital).order_by('-last_inspection_date')
-        serializer = HospitalServiceScoreSerializer(scores, many=True)
+        context = {'request': request}
+        scores = prune_queryset(HospitalServiceScore.objects.filter(hospital=hospital).order_by('-last_inspection_date'),
+                                HospitalServiceScoreSerializer(context=context))
+        serializer = HospitalServiceScoreSerializer(scores, many=True, context=context)
         return Response({
             "code": 0,
             "message": "success",
@@ -79,14 +109,14 @@ class HospitalViewSet(viewsets.ModelViewSet):
     # 【自定义功能 3】: 获取某医院参与的突发事件
     # URL: GET /api/hospitals/{id}/events/
     @action(detail=True, methods=['get'])
+    @cache_response('hospital:{pk}', 'Hospital')
     def events(self, request, pk=None):
         hospital = self.get_object()
-        # 通过多对多关系反向查询
-        # 注意: 这里的查询逻辑稍微复杂一点，我们查 HospitalEvent 中间表
-        hospital_events = HospitalEvent.objects.filter(hospital=hospital)
-        # 如果你想返回事件详情，需要取出 event 对象
-        events = [he.event for he in hospital_events]
-        serializer = EmergencyEventSerializer(events, many=True)
+        # 该医院参与的事件 (EXISTS 子查询)，参与记录和医院一次预取，查询数和事件数无关
+        context = {'request': request}
+        events = prune_queryset(EmergencyEvent.objects.filter(participated_by(hospital.pk)).order_by('-report_time', 'pk'),
+                                EmergencyEventSerializer(context=context))
+        serializer = EmergencyEventSerializer(events, many=True, context=context)
         return Response({
             "code": 0,
             "message": "success",
@@ -148,8 +178,8 @@ class HospitalDepartmentViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         # 自动填充 hospital_id，防止医院管理员给别的医院加科室
         user = self.request.user
-        if user.profile.role == 'hospital_admin':
-            serializer.save(hospital=user.profile.hospital)
+        if get_role(user) == 'hospital_admin':
+            serializer.save(hospital=get_admin_hospital(user))
         else:
             serializer.save()
 
@@ -162,8 +192,8 @@ class HospitalServiceScoreViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         # 医院管理员上报评分，自动绑定本院
         user = self.request.user
-        if user.profile.role == 'hospital_admin':
-            serializer.save(hospital=user.profile.hospital)
+        if get_role(user) == 'hospital_admin':
+            serializer.save(hospital=get_admin_hospital(user))
         else:
             serializer.save()
 
@@ -171,4 +201,14 @@ class HospitalServiceScoreViewSet(viewsets.ModelViewSet):
 class DistrictViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = District.objects.all()
     serializer_class = DistrictSerializer
-    permission_classes = [permissions.AllowAny] # 允许前端随意获取列表
\ No newline at end of file
+    permission_classes = [permissions.AllowAny] # 允许前端随意获取列表
+
+    @conditional_response('District')
+    @cache_response('District')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional_response('District')
+    @cache_response('District')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
\ No newline at end of file
@@ -1,10 +1,50 @@
 # api/views/public.py
-from rest_framework import viewsets
+from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
-from api.models import Hospital
+from api.models import Hospital, HospitalDepartment
 from api.serializers import HospitalSerializer
+from api.fieldsets import prune_queryset
+from api.search import SEARCH_TARGETS, search
+from api.geo import hospital_index
+from api.response_cache import cache_response
+
+
+def hospital_search_queryset(data, serializer):
+    """
+    公众医院搜索的筛选条件 -> (查询集, 索引搜索关键字)
+    关键字不为 None 时 (mode=index) 还要在索引上搜索排序；同步/异步视图共用 (见 api/views/public_async.py)
+    serializer 为返回结果用的 HospitalSerializer (带 request，按 ?fields= 裁剪查询)
+    """
+    # 获取前端传来的筛选条件
+    district_id = data.get('district')
+    level_id = data.get('level')
+    name_keyword = data.get('name')
+
+    # ✅ 新增：获取科室ID
+    dept_id = data.get('department')
+    # mode=index: 走二元组倒排索引，同时匹配名称和地址，结果按相关度排序
+    mode = data.get('mode')
+
+    # 构造查询 (等级/行政区/员工数按返回字段一次查好，见 api/fieldsets.py)；
+    # 索引搜索按名称和地址打分，这两列总要取出来
+    ranked = SEARCH_TARGETS['hospital'][1] if name_keyword and mode == 'index' else ()
+    qs = prune_queryset(Hospital.objects.all(), serializer, extra_columns=ranked)
+    if district_id:
+        qs = qs.filter(district_id=district_id)
+    if level_id:
+        qs = qs.filter(level_id=level_id)
+    if name_keyword and mode != 'index':
+        qs = qs.filter(name__contains=name_keyword)
+
+    # ✅ 新增：根据科室ID过滤 (通过 HospitalDepartment 中间表反向查询)
+    # HospitalDepartment 上 (hospital, dept) 唯一，JOIN 不会产生重复行，不需要 distinct
+    if dept_id:
+        qs = qs.filter(hospitaldepartment__dept_id=dept_id)
+
+    return qs, (name_keyword if name_keyword and mode == 'index' else None)
+
 
 class PublicViewSet(viewsets.ViewSet):
     """
@@ -15,58 +55,66 @@ class PublicViewSet(viewsets.ViewSet):
 
     # POST /api/public/search_hospital/
     @action(detail=False, methods=['post'])
+    @cache_response('Hospital', 'HospitalDepartment', 'HospitalStaff', 'District', 'HospitalLevel')
     def search_hospital(self, request):
-        # 获取前端传来的筛选条件
-        district_id = request.data.get('district')
-        level_id = request.data.get('level')
-        name_keyword = request.data.get('name')
-
-        # 构造查询
-        qs = Hospital.objects.all()
-        if district_id:
-            qs = qs.filter(district_id=district_id)
-        if level_id:
-            qs = qs.filter(level_id=level_id)
-        if name_keyword:
-            qs = qs.filter(name__contains=name_keyword)
-
-        serializer = HospitalSerializer(qs, many=True)
+        context = {'request': request}
+        qs, keyword = hospital_search_queryset(request.data, HospitalSerializer(context=context))
+        if keyword is not None:
+            qs = search('hospital', keyword, qs)
+
+        serializer = HospitalSerializer(qs, many=True, context=context)
         return Response({
             "code": 0,
             "message": "success",
             "data": serializer.data
         })
 
-    # POST /api/public/search_hospital/
-    @action(detail=False, methods=['post'])
-    def search_hospital(self, request):
-        # 获取前端传来的筛选条件
-        district_id = request.data.get('district')
-        level_id = request.data.get('level')
-        name_keyword = request.data.get('name')
-
-        # ✅ 新增：获取科室ID
-        dept_id = request.data.get('department')
-
-        # 构造查询
-        qs = Hospital.objects.all()
-        if district_id:
-            qs = qs.filter(district_id=district_id)
-        if level_id:
-            qs = qs.filter(level_id=level_id)
-        if name_keyword:
-            qs = qs.filter(name__contains=name_keyword)
-
-        # ✅ 新增：根据科室ID过滤 (通过 HospitalDepartment 中间表反向查询)
-        if dept_id:
-            qs = qs.filter(hospitaldepartment__dept_id=dept_id)
-
-        # 去重 (防止因为 join 导致同一医院出现多次)
-        qs = qs.distinct()
-
-        serializer = HospitalSerializer(qs, many=True)
+    NEARBY_MAX_K = 100
+
+    # GET /api/public/nearby/?lat=22.54&lng=114.06&k=10&department=3&level=1&radius=20
+    @action(detail=False, methods=['get'])
+    def nearby(self, request):
+        """
+        离我最近的 k 家医院 (可按科室、等级、半径 km 过滤)，距离用 haversine 计算，
+        候选由进程内网格索引给出 (见 api/geo.py)
+        """
+        params = request.query_params
+        try:
+            lat = float(params['lat'])
+            lng = float(params['lng'])
+            k = min(int(params.get('k', 10)), self.NEARBY_MAX_K)
+            radius_km = float(params['radius']) if params.get('radius') else None
+            level_id = int(params['level']) if params.get('level') else None
+            dept_id = int(params['department']) if params.get('department') else None
+        except (KeyError, ValueError):
+            return Response({"code": 400, "message": "lat、lng 必填，k/radius/level/department 必须是数字"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+            return Response({"code": 400, "message": "经纬度超出范围"}, status=status.HTTP_400_BAD_REQUEST)
+
+        hospital_ids = None
+        if dept_id is not None:
+            # 开设了该科室的医院
+            hospital_ids = set(HospitalDepartment.objects.filter(dept_id=dept_id).values_list('hospital_id', flat=True))
+
+        nearest = hospital_index.nearest(lat, lng, k=k, radius_km=radius_km,
+                                         hospital_ids=hospital_ids, level_id=level_id)
+
+        context = {'request': request}
+        hospitals = prune_queryset(Hospital.objects.all(), HospitalSerializer(context=context)).in_bulk(
+            [point.hospital_id for _, point in nearest])
+        data = []
+        for distance, point in nearest:
+            hospital = hospitals.get(point.hospital_id)
+            if hospital is None:
+                # 索引还没来得及刷新 (其他进程删除了医院)
+                continue
+            item = HospitalSerializer(hospital, context=context).data
+            item['distance_km'] = round(distance, 3)
+            data.append(item)
+
         return Response({
             "code": 0,
             "message": "success",
-            "data": serializer.data
-        })
\ No newline at end of file
+            "data": data
+        })
@@ -0,0 +1,209 @@
+# api/views/public_async.py
+"""
+公众只读接口的异步实现 (只在 ASGI 下挂载，见 backend/asgi.py、backend/asgi_urls.py)
+
+    POST /api/public/search_hospital/
+    GET  /api/hospitals/{id}/
+    GET  /api/hospitals/{id}/departments/
+    GET  /api/hospitals/{id}/scores/
+    GET  /api/hospitals/{id}/events/
+
+- 查询用 Django 异步 ORM (afirst / aexists / async for)，请求在等数据库时不占住一个同步视图线程，
+  也不走 DRF 的认证/权限/内容协商这一整套同步调用
+- 序列化器只读取预取好的数据；漏掉 select_related/prefetch 时会抛 SynchronousOnlyOperation，
+  N+1 在开发时就能发现
+- 返回内容、ETag/304 和同步视图一致；响应缓存用同样的接口名，两边共用缓存条目
+- 其他方法 (PUT/PATCH/DELETE)、浏览器可视化 API (Accept: text/html 或 ?format=)、
+  MessagePack (Accept: application/msgpack)、非 JSON 的请求体都交给原来的 DRF 视图
+"""
+import json
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, HttpResponseNotModified
+from django.urls import path
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.csrf import csrf_exempt
+
+from api.models import EmergencyEvent, Hospital, HospitalDepartment, HospitalServiceScore
+from api.fieldsets import prune_queryset
+from api.renderers import FastJSONRenderer, MessagePackRenderer
+from api.response_cache import acache_lookup, acache_store
+from api.search import asearch
+from api.serializers import (
+    EmergencyEventSerializer, HospitalDepartmentSerializer, HospitalSerializer,
+    HospitalServiceScoreSerializer,
+)
+from api.urls import router
+from api.versioning import aget_table_versions, conditional_headers, set_conditional_headers
+from api.views.event import participated_by
+from api.views.public import hospital_search_queryset
+
+_renderer = FastJSONRenderer()
+
+
+def render(data, status=200):
+    """和 DRF Response + FastJSONRenderer 的输出相同；data 留在响应上，给响应缓存用"""
+    response = HttpResponse(_renderer.render(data), status=status, content_type=_renderer.media_type)
+    # 同一个 URL 按 Accept 可能返回可视化页面 (交给 DRF)，和 DRF 一样声明 Vary
+    patch_vary_headers(response, ['Accept'])
+    response.data = data
+    return response
+
+
+def success(data):
+    return render({"code": 0, "message": "success", "data": data})
+
+
+def hospital_not_found():
+    # 和 DRF get_object() 的 404 相同
+    return render({"detail": "No Hospital matches the given query."}, status=404)
+
+
+def _router_view(name):
+    """router 里同一个 URL 的 DRF 视图 (PUT/DELETE 等请求交给它)"""
+    return next(pattern.callback for pattern in router.urls if pattern.name == name)
+
+
+def _needs_negotiation(request):
+    """要可视化 API、MessagePack 或指定了 ?format= 的请求由 DRF 做内容协商"""
+    accept = request.META.get('HTTP_ACCEPT', '')
+    return ('format' in request.GET or 'text/html' in accept
+            or (MessagePackRenderer.media_type in accept and MessagePackRenderer.is_available()))
+
+
+def async_view(fallback_name, method='GET'):
+    """
+    只异步处理 method 指定的请求，其他请求交给 router 里名为 fallback_name 的 DRF 视图
+    POST 的 JSON 请求体解析后作为 body 参数传入
+    """
+    fallback = _router_view(fallback_name)
+
+    def decorator(handler):
+        async def delegate(request, **kwargs):
+            return await sync_to_async(fallback)(request, **kwargs)
+
+        @csrf_exempt
+        @wraps(handler)
+        async def view(request, **kwargs):
+            if request.method != method or _needs_negotiation(request):
+                return await delegate(request, **kwargs)
+            if method == 'POST':
+                if request.content_type != 'application/json':
+                    return await delegate(request, **kwargs)
+                try:
+                    body = json.loads(request.body or b'{}')
+                except ValueError:
+                    # 解析错误的 400 由 DRF 返回，格式和以前一样
+                    return await delegate(request, **kwargs)
+                if not isinstance(body, dict):
+                    return await delegate(request, **kwargs)
+                kwargs['body'] = body
+            return await handler(request, **kwargs)
+        return view
+    return decorator
+
+
+def cached(endpoint, *scopes):
+    """异步版的 @cache_response；endpoint 用同步视图的名称 (视图类.action)"""
+    def decorator(handler):
+        @wraps(handler)
+        async def wrapper(request, **kwargs):
+            resolved = [scope.format(**kwargs) for scope in scopes]
+            key, data = await acache_lookup(endpoint, resolved, request, request.GET, kwargs.get('body'))
+            if data is not None:
+                response = render(data)
+                response['X-Cache'] = 'HIT'
+                return response
+            response = await handler(request, **kwargs)
+            if key is not None:
+                if response.status_code == 200:
+                    await acache_store(key, response.data)
+                response['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
+
+
+def conditional(endpoint, *tables):
+    """异步版的 @conditional_response"""
+    def decorator(handler):
+        @wraps(handler)
+        async def wrapper(request, **kwargs):
+            versions, last_modified = await aget_table_versions(tables)
+            etag, not_modified = conditional_headers(endpoint, request, versions, last_modified)
+            if not_modified:
+                response = HttpResponseNotModified()
+            else:
+                response = await handler(request, **kwargs)
+                if response.status_code != 200:
+                    return response
+            return set_conditional_headers(response, etag, last_modified)
+        return wrapper
+    return decorator
+
+
+@async_view('public-search-hospital', method='POST')
+@cached('PublicViewSet.search_hospital', 'Hospital', 'HospitalDepartment', 'HospitalStaff', 'District', 'HospitalLevel')
+async def search_hospital(request, body):
+    context = {'request': request}
+    qs, keyword = hospital_search_queryset(body, HospitalSerializer(context=context))
+    if keyword is not None:
+        hospitals = await asearch('hospital', keyword, qs)
+    else:
+        hospitals = [hospital async for hospital in qs]
+    return success(HospitalSerializer(hospitals, many=True, context=context).data)
+
+
+@async_view('hospital-detail')
+@conditional('HospitalViewSet.retrieve', 'Hospital', 'HospitalStaff', 'District', 'HospitalLevel')
+async def hospital_detail(request, pk):
+    context = {'request': request}
+    hospital = await prune_queryset(Hospital.objects.filter(pk=pk), HospitalSerializer(context=context)).afirst()
+    if hospital is None:
+        return hospital_not_found()
+    return render(HospitalSerializer(hospital, context=context).data)
+
+
+@async_view('hospital-departments')
+@cached('HospitalViewSet.departments', 'hospital:{pk}', 'Department')
+async def hospital_departments(request, pk):
+    if not await Hospital.objects.filter(pk=pk).aexists():
+        return hospital_not_found()
+    context = {'request': request}
+    relations = prune_queryset(HospitalDepartment.objects.filter(hospital_id=pk),
+                               HospitalDepartmentSerializer(context=context))
+    return success(HospitalDepartmentSerializer([relation async for relation in relations], many=True,
+                                                context=context).data)
+
+
+@async_view('hospital-scores')
+@cached('HospitalViewSet.scores', 'hospital:{pk}')
+async def hospital_scores(request, pk):
+    if not await Hospital.objects.filter(pk=pk).aexists():
+        return hospital_not_found()
+    context = {'request': request}
+    scores = prune_queryset(HospitalServiceScore.objects.filter(hospital_id=pk).order_by('-last_inspection_date'),
+                            HospitalServiceScoreSerializer(context=context))
+    return success(HospitalServiceScoreSerializer([score async for score in scores], many=True, context=context).data)
+
+
+@async_view('hospital-events')
+@cached('HospitalViewSet.events', 'hospital:{pk}', 'Hospital')
+async def hospital_events(request, pk):
+    if not await Hospital.objects.filter(pk=pk).aexists():
+        return hospital_not_found()
+    context = {'request': request}
+    events = prune_queryset(EmergencyEvent.objects.filter(participated_by(pk)).order_by('-report_time', 'pk'),
+                            EmergencyEventSerializer(context=context))
+    return success(EmergencyEventSerializer([event async for event in events], many=True, context=context).data)
+
+
+# 挂在 /api/ 下，放在 api.urls 前面 (见 backend/asgi_urls.py)
+urlpatterns = [
+    path('public/search_hospital/', search_hospital, name='public-search-hospital-async'),
+    path('hospitals/<int:pk>/', hospital_detail, name='hospital-detail-async'),
+    path('hospitals/<int:pk>/departments/', hospital_departments, name='hospital-departments-async'),
+    path('hospitals/<int:pk>/scores/', hospital_scores, name='hospital-scores-async'),
+    path('hospitals/<int:pk>/events/', hospital_events, name='hospital-events-async'),
+]
@@ -1,15 +1,63 @@
 # backend/api/views/staff.py
-from django.db import transaction, models
+from django.db import transaction
+from django.db.models import Count, OuterRef, Q, Subquery
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from django.db.models import Count, Q
+from rest_framework.parsers import MultiPartParser, FormParser
 from api.models import Staff, HospitalStaff
 from api.serializers import (
     StaffSerializer, HospitalStaffSerializer,HospitalStaffReadSerializer,
     HospitalStaffCreateCompositeSerializer,StaffDetailSerializer)
 from django.utils import timezone
-from api.permission import IsCityAdmin, IsHospitalAdmin
+from api.permission import IsCityAdmin, IsHospitalAdmin, get_admin_hospital, get_hospital_id, get_role
+from api.search import candidate_ids, contains_q
+from api.id_allocator import staff_id_allocator
+from api.staff_import import FORMATS, guess_format, import_staff, normalize_encoding
+
+
+def staff_statistics():
+    """
+    医护人员规模 / 职称结构 / 各医院分布 (staffs/statistics 和 statistics/staff_structure 共用)，一次查询：
+    Staff LEFT JOIN HospitalStaff 按 (category, title, 医院) 分组，
+    links 是执业记录数 (各医院分布)，staff 是人数 (在多家医院执业的人只在第一条执业记录上计一次)
+    返回 (overview, title_structure, hospital_rows)
+    """
+    first_link = HospitalStaff.objects.filter(staff=OuterRef('pk')).order_by('pk').values('pk')[:1]
+    rows = Staff.objects.values(
+        'category', 'title', 'hospitalstaff__hospital_id', 'hospitalstaff__hospital__name',
+    ).annotate(
+        links=Count('hospitalstaff'),
+        staff=Count('pk', filter=Q(hospitalstaff__isnull=True) | Q(hospitalstaff__pk=Subquery(first_link))),
+    ).order_by()
+
+    overview = {'total': 0, 'doctor': 0, 'nurse': 0, 'other': 0}
+    titles = {}
+    hospitals = {}
+    for row in rows:
+        overview['total'] += row['staff']
+        overview[row['category']] = overview.get(row['category'], 0) + row['staff']
+        if row['title'] and row['staff']:
+            titles[row['title']] = titles.get(row['title'], 0) + row['staff']
+        hospital_id = row['hospitalstaff__hospital_id']
+        if hospital_id is None:
+            continue
+        hospital = hospitals.setdefault(hospital_id, {
+            'hospital_id': hospital_id, 'hospital__name': row['hospitalstaff__hospital__name'],
+            'total': 0, 'doctors': 0, 'nurses': 0,
+        })
+        hospital['total'] += row['links']
+        if row['category'] == 'doctor':
+            hospital['doctors'] += row['links']
+        elif row['category'] == 'nurse':
+            hospital['nurses'] += row['links']
+
+    title_structure = [
+        {'title': title, 'count': count}
+        for title, count in sorted(titles.items(), key=lambda item: (-item[1], item[0]))
+    ]
+    hospital_rows = sorted(hospitals.values(), key=lambda row: (-row['total'], row['hospital_id']))
+    return overview, title_structure, hospital_rows
 
 # 1. 员工基础信息表
 class StaffViewSet(viewsets.ModelViewSet):
@@ -17,6 +65,15 @@ class StaffViewSet(viewsets.ModelViewSet):
     serializer_class = StaffSerializer
     permission_classes = [IsCityAdmin | IsHospitalAdmin]
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        # ?keyword= 姓名关键字搜索 (走倒排索引，见 api/search.py)
+        keyword = self.request.query_params.get('keyword')
+        if keyword:
+            queryset = queryset.filter(pk__in=candidate_ids('staff', keyword)).filter(
+                contains_q('staff', keyword))
+        return queryset
+
     def get_serializer_class(self):
     # 根据不同的action动作返回不同的序列化器类
     # 如果当前动作是'retrieve'（获取详情），则返回StaffDetailSerializer
@@ -29,36 +86,25 @@ class StaffViewSet(viewsets.ModelViewSet):
         """
         统计接口：返回全市人员规模、职称结构、各医院分布
         """
-        # 1. 规模统计 (基于 title 字段模糊匹配)
-        total_staff = Staff.objects.count()
-        # 假设 title 包含 "医" 为医生，包含 "护" 为护士
-        doctors_count = Staff.objects.filter(title__contains='医').count()
-        nurses_count = Staff.objects.filter(title__contains='护').count()
-        others_count = total_staff - doctors_count - nurses_count
-
-        # 2. 职称结构 (Group By title)
-        # 过滤掉空职称
-        title_structure = Staff.objects.exclude(title__isnull=True).exclude(title='').values('title').annotate(
-            count=Count('staff_id')
-        ).order_by('-count')
-
-        # 3. 各医院人员分布 (通过中间表 HospitalStaff 关联)
-        # 统计每家医院的总人数、医生数、护士数
-        hospital_stats = HospitalStaff.objects.values(
-            'hospital__hospital_id',
-            'hospital__name'
-        ).annotate(
-            total=Count('staff_id'),
-            doctors_count=Count('staff_id', filter=Q(staff__title__contains='医')),
-            nurses_count=Count('staff_id', filter=Q(staff__title__contains='护'))
-        ).order_by('-total')
+        # 按 Staff.category 分组聚合 (见上面的 staff_statistics)，字段名保持和原接口一致
+        overview, title_structure, hospital_rows = staff_statistics()
+        hospital_stats = [
+            {
+                'hospital__hospital_id': row['hospital_id'],
+                'hospital__name': row['hospital__name'],
+                'total': row['total'],
+                'doctors_count': row['doctors'],
+                'nurses_count': row['nurses'],
+            }
+            for row in hospital_rows
+        ]
 
         data = {
             'overview': {
-                'total_staff': total_staff,
-                'total_doctors': doctors_count,
-                'total_nurses': nurses_count,
-                'total_others': others_count,
+                'total_staff': overview['total'],
+                'total_doctors': overview['doctor'],
+                'total_nurses': overview['nurse'],
+                'total_others': overview['other'],
             },
             'title_structure': title_structure,
             'hospital_distribution': hospital_stats
@@ -80,9 +126,9 @@ class HospitalStaffViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         user = self.request.user
-        if user.is_authenticated and hasattr(user, 'profile') and user.profile.role == 'hospital_admin':
+        if get_role(user) == 'hospital_admin':
             # 仅返回本院的员工
-            return HospitalStaff.objects.filter(hospital=user.profile.hospital)
+            return HospitalStaff.objects.filter(hospital_id=get_hospital_id(user))
         return super().get_queryset()
 
     def create(self, request, *args, **kwargs):
@@ -90,28 +136,27 @@ class HospitalStaffViewSet(viewsets.ModelViewSet):
         重写 create 方法，支持直接创建 Staff 并关联到本院
         """
         user = request.user
-        if not (hasattr(user, 'profile') and user.profile.role == 'hospital_admin' and user.profile.hospital):
+        if not (get_role(user) == 'hospital_admin' and get_hospital_id(user)):
             return Response({"detail": "只有医院管理员可以执行此操作"}, status=status.HTTP_403_FORBIDDEN)
+        hospital = get_admin_hospital(user)
 
         serializer = HospitalStaffCreateCompositeSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         data = serializer.validated_data
 
-        hospital = user.profile.hospital
+        existing_id = data.get('existing_staff_id')
+        if not existing_id:
+            # 从进程内号段分配 staff_id (api/id_allocator.py)，在事务外分配，并发新增不会撞主键
+            new_id = staff_id_allocator.allocate(1)[0]
 
         with transaction.atomic():
             # 1. 获取或创建 Staff 对象
-            existing_id = data.get('existing_staff_id')
             if existing_id:
                 try:
                     staff = Staff.objects.get(pk=existing_id)
                 except Staff.DoesNotExist:
                     return Response({"detail": "指定的员工ID不存在"}, status=status.HTTP_400_BAD_REQUEST)
             else:
-                # 自动生成递增的 staff_id
-                max_staff_id = Staff.objects.aggregate(max_id=models.Max('staff_id'))['max_id']
-                new_id = (max_staff_id or 0) + 1
-
                 staff = Staff.objects.create(
                     staff_id=new_id,
                     name=data['name'],
@@ -133,4 +178,34 @@ class HospitalStaffViewSet(viewsets.ModelViewSet):
 
         # 返回读取序列化器的数据
         read_serializer = HospitalStaffReadSerializer(hospital_staff)
-        return Response(read_serializer.data, status=status.HTTP_201_CREATED)
\ No newline at end of file
+        return Response(read_serializer.data, status=status.HTTP_201_CREATED)
+
+    # POST /api/hospital_staffs/import_roster/
+    # (multipart: file=花名册, file_format=csv|ndjson 可选, encoding=utf-8|gbk 可选，默认 utf-8)
+    @action(detail=False, methods=['post'], parser_classes=[MultiPartParser, FormParser])
+    def import_roster(self, request):
+        """
+        批量导入本院花名册 (CSV / NDJSON)，逐行流式解析、分块写入，返回逐行错误报告
+        """
+        user = request.user
+        if not (get_role(user) == 'hospital_admin' and get_hospital_id(user)):
+            return Response({"detail": "只有医院管理员可以执行此操作"}, status=status.HTTP_403_FORBIDDEN)
+
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({"detail": "请上传花名册文件 (file)"}, status=status.HTTP_400_BAD_REQUEST)
+        file_format = request.data.get('file_format') or guess_format(upload.name)
+        if file_format not in FORMATS:
+            return Response({"detail": f"不支持的格式: {file_format}"}, status=status.HTTP_400_BAD_REQUEST)
+        encoding = request.data.get('encoding') or 'utf-8'
+        try:
+            normalize_encoding(encoding)
+        except LookupError:
+            return Response({"detail": f"不支持的编码: {encoding}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        report = import_staff(get_admin_hospital(user), upload, file_format, encoding)
+        return Response({
+            "code": 0,
+            "message": "success",
+            "data": report.as_dict()
+        })
@@ -2,9 +2,12 @@ from rest_framework import viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from django.db.models import Sum, Count, Q ,Case, When, IntegerField
-from api.models import Hospital, DepartmentResource, HospitalDepartment, Department,Staff,HospitalStaff
+from django.db.models import Sum, Case, When, IntegerField, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from api.models import Hospital, DepartmentResource, HospitalDepartment
 from api.permission import IsCityAdmin
+from api.summary import get_city_summary
+from api.views.staff import staff_statistics
 
 
 class StatisticsViewSet(viewsets.ViewSet):
@@ -17,45 +20,55 @@ class StatisticsViewSet(viewsets.ViewSet):
     def dashboard(self, request):
         """
         获取顶部卡片数据 (Dashboard)
+        数据来自 CitySummary 汇总表 (一次主键查询)，由 api/signals.py 在写入时增量维护，
+        可以用 python manage.py rebuild_city_summary [--check] 重建/校验
         """
-        # 1. 基础计数
-        total_hospitals = Hospital.objects.count()
-
-        # 2. 资源总和 (使用 Django 聚合函数)
-        # 注意：如果没有数据，aggregate 返回 None，所以要用 or 0
-        total_beds = Hospital.objects.aggregate(sum=Sum('bed_total'))['sum'] or 0
-        total_rooms = HospitalDepartment.objects.aggregate(sum=Sum('room_count'))['sum'] or 0
-        total_devices = DepartmentResource.objects.aggregate(sum=Sum('device_count'))['sum'] or 0
-
-        # 3. ICU 特殊统计 (假设科室名包含 "ICU" 或 "重症")
-        icu_departments = Department.objects.filter(Q(dept_name__icontains='ICU') | Q(dept_name__icontains='重症'))
-        icu_beds = DepartmentResource.objects.filter(dept__in=icu_departments).aggregate(sum=Sum('bed_count'))[
-                       'sum'] or 0
-
-        # 4. 科室覆盖率 (全市一共有多少种不同的科室)
-        total_dept_types = Department.objects.count()
+        summary = get_city_summary()
 
         return Response({
             "code": 0,
             "message": "success",
             "data": {
-                "total_hospitals": total_hospitals,
-                "total_dept_types": total_dept_types,
-                "total_beds": total_beds,
-                "total_rooms": total_rooms,
-                "total_devices": total_devices,
-                "icu_beds": icu_beds,
+                "total_hospitals": summary.total_hospitals,
+                "total_dept_types": summary.total_dept_types,
+                "total_beds": summary.total_beds,
+                "total_rooms": summary.total_rooms,
+                "total_devices": summary.total_devices,
+                "icu_beds": summary.icu_beds,
             }
         })
 
+    # hospital_rank 允许的排序字段 (前缀 - 表示倒序)
+    RANK_ORDERING_FIELDS = {
+        'hospital_id', 'name', 'bed_total', 'dept_bed_count',
+        'room_count', 'device_count', 'stress',
+    }
+    RANK_MAX_LIMIT = 1000
+    STRESS_LABELS = {0: "normal", 1: "medium", 2: "high"}
+
     @action(detail=False, methods=['get'])
     def hospital_rank(self, request):
         """
         获取资源统计表数据 (带筛选)
+        GET /api/statistics/hospital_rank/?district=&level=&ordering=-device_count&limit=20
+
+        诊室数/设备数/科室床位数用相关子查询一次算出，紧张度也在数据库里用 CASE 计算，
+        所以不管多少家医院都只有一条 SQL
         """
         # 获取筛选参数
         district_id = request.query_params.get('district')
         level_id = request.query_params.get('level')
+        ordering = request.query_params.get('ordering', 'hospital_id')
+        limit = request.query_params.get('limit')
+
+        if ordering.lstrip('-') not in self.RANK_ORDERING_FIELDS:
+            return Response({"code": 400, "message": f"不支持的排序字段: {ordering}"}, status=400)
+        if limit is not None:
+            try:
+                limit = int(limit)
+            except ValueError:
+                return Response({"code": 400, "message": "limit 必须是整数"}, status=400)
+            limit = max(0, min(limit, self.RANK_MAX_LIMIT))
 
         qs = Hospital.objects.all()
 
@@ -64,37 +77,59 @@ class StatisticsViewSet(viewsets.ViewSet):
         if level_id:
             qs = qs.filter(level_id=level_id)
 
+        def hospital_sum(model, field):
+            # 每家医院的 SUM(field)，作为相关子查询挂到医院行上
+            sub = model.objects.filter(hospital=OuterRef('pk')).values('hospital').annotate(
+                s=Sum(field)
+            ).values('s')
+            return Coalesce(Subquery(sub), 0)
+
+        # 简单模拟紧张度：日门诊量 / 总床位 > 5 视为紧张，> 3 为中等
+        # 写成乘法避免除零 (床位为空或 0 一律 normal)；stress_rank 用于排序 (high > medium > normal)
+        stress_rank = Case(
+            When(bed_total__gt=0, outpatient_capacity__gt=F('bed_total') * 5, then=Value(2)),
+            When(bed_total__gt=0, outpatient_capacity__gt=F('bed_total') * 3, then=Value(1)),
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+
+        qs = qs.annotate(
+            district_name=F('district__district_name'),
+            level_name=F('level__level_name'),
+            room_count=hospital_sum(HospitalDepartment, 'room_count'),
+            device_count=hospital_sum(DepartmentResource, 'device_count'),
+            dept_bed_count=hospital_sum(DepartmentResource, 'bed_count'),
+            stress_rank=stress_rank,
+        )
+
+        order_field = ordering.lstrip('-')
+        if order_field == 'stress':
+            order_field = 'stress_rank'
+        descending = ordering.startswith('-')
+        qs = qs.order_by(F(order_field).desc() if descending else F(order_field).asc(), 'hospital_id')
+        if limit is not None:
+            qs = qs[:limit]
+
+        rows = qs.values(
+            'hospital_id', 'name', 'district_name', 'level_name', 'bed_total',
+            'dept_bed_count', 'room_count', 'device_count', 'stress_rank',
+        )
+
         # 构造列表数据
-        data = []
-        for h in qs:
-            # 统计该医院下的资源
-            # 诊室数 (从中间表查)
-            room_count = HospitalDepartment.objects.filter(hospital=h).aggregate(sum=Sum('room_count'))['sum'] or 0
-
-            # 设备数 & ICU床位 (从资源表查)
-            resources = DepartmentResource.objects.filter(hospital=h)
-            device_count = resources.aggregate(sum=Sum('device_count'))['sum'] or 0
-
-            # 简单模拟紧张度 (床位越少越紧张，或者根据门诊量)
-            # 逻辑：如果 日门诊量 / 总床位 > 5，视为紧张
-            stress = "normal"
-            if h.bed_total and h.outpatient_capacity:
-                ratio = h.outpatient_capacity / h.bed_total
-                if ratio > 5:
-                    stress = "high"
-                elif ratio > 3:
-                    stress = "medium"
-
-            data.append({
-                "hospital_id": h.hospital_id,
-                "name": h.name,
-                "district": h.district.district_name,
-                "level": h.level.level_name,
-                "bed_total": h.bed_total,
-                "room_count": room_count,
-                "device_count": device_count,
-                "stress": stress
-            })
+        data = [
+            {
+                "hospital_id": row['hospital_id'],
+                "name": row['name'],
+                "district": row['district_name'],
+                "level": row['level_name'],
+                "bed_total": row['bed_total'],
+                "dept_bed_count": row['dept_bed_count'],
+                "room_count": row['room_count'],
+                "device_count": row['device_count'],
+                "stress": self.STRESS_LABELS[row['stress_rank']],
+            }
+            for row in rows
+        ]
 
         return Response({
             "code": 0,
@@ -102,68 +137,39 @@ class StatisticsViewSet(viewsets.ViewSet):
             "data": data
         })
 
+    # GET /api/statistics/staff_structure/
+    @action(detail=False, methods=['get'])
+    def staff_structure(self, request):
+        """
+        统计全市医护人员规模、医生护士比例、职称结构
+        (按 Staff.category 分组聚合，见 api.views.staff.staff_statistics)
+        """
+        overview, title_structure, hospital_rows = staff_statistics()
+
+        # 格式化为前端需要的结构
+        formatted_hospital_dist = [
+            {
+                "hospitalId": row['hospital_id'],
+                "hospitalName": row['hospital__name'],
+                "doctorsCount": row['doctors'],
+                "nursesCount": row['nurses'],
+                "otherCount": row['total'] - row['doctors'] - row['nurses'],
+                "total": row['total'],
+            }
+            for row in hospital_rows
+        ]
 
-@action(detail=False, methods=['get'])
-def staff_structure(self, request):
-    """
-    统计全市医护人员规模、医生护士比例、职称结构
-    """
-    # 1. 总体规模 (基于 Staff 表)
-    total_staff = Staff.objects.count()
-
-    # 使用 title 字段进行模糊匹配统计
-    doctors_count = Staff.objects.filter(title__contains='医').count()
-    nurses_count = Staff.objects.filter(title__contains='护').count()
-    # 其他人员 = 总数 - 医生 - 护士
-    others_count = total_staff - doctors_count - nurses_count
-
-    # 2. 职称结构分布 (Group By Title)
-    # 过滤掉 title 为空的数据
-    title_distribution = Staff.objects.exclude(title__isnull=True).exclude(title='').values('title').annotate(
-        count=Count('staff_id')
-    ).order_by('-count')
-
-    # 3. 各医院人员分布 (基于 HospitalStaff 中间表)
-    # 使用条件聚合 (Case/When) 统计各医院的 医生/护士/其他 数量
-    hospital_stats = HospitalStaff.objects.values(
-        'hospital__name',
-        'hospital__hospital_id'
-    ).annotate(
-        total=Count('staff__staff_id'),
-        # 统计医生：关联的 staff 表 title 包含 '医'
-        doctors=Count(Case(When(staff__title__contains='医', then=1), output_field=IntegerField())),
-        # 统计护士：关联的 staff 表 title 包含 '护'
-        nurses=Count(Case(When(staff__title__contains='护', then=1), output_field=IntegerField())),
-    ).order_by('-total')
-
-    # 格式化为前端需要的结构
-    formatted_hospital_dist = []
-    for h in hospital_stats:
-        doc = h['doctors']
-        nur = h['nurses']
-        total = h['total']
-        other = total - doc - nur
-
-        formatted_hospital_dist.append({
-            "hospitalId": h['hospital__hospital_id'],
-            "hospitalName": h['hospital__name'],
-            "doctorsCount": doc,
-            "nursesCount": nur,
-            "otherCount": other,
-            "total": total
+        return Response({
+            "code": 0,
+            "message": "success",
+            "data": {
+                "overview": {
+                    "total": overview['total'],
+                    "doctors": overview['doctor'],
+                    "nurses": overview['nurse'],
+                    "others": overview['other'],
+                },
+                "title_structure": title_structure,
+                "hospital_distribution": formatted_hospital_dist,
+            }
         })
-
-    return Response({
-        "code": 0,
-        "message": "success",
-        "data": {
-            "overview": {
-                "total": total_staff,
-                "doctors": doctors_count,
-                "nurses": nurses_count,
-                "others": others_count
-            },
-            "title_structure": title_distribution,
-            "hospital_distribution": formatted_hospital_dist
-        }
-    })
\ No newline at end of file
@@ -1,2 +1,6 @@
-import pymysql
-pymysql.install_as_MySQLdb()
\ No newline at end of file
+try:
+    import pymysql
+    pymysql.install_as_MySQLdb()
+except ImportError:
+    # 使用 SQLite (DJANGO_SQLITE=1) 时不需要 pymysql
+    pass
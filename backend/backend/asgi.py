@@ -14,3 +14,13 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
 
 application = get_asgi_application()
+
+from django.core.handlers.asgi import ASGIRequest  # noqa: E402  (需要在 django.setup() 之后导入)
+
+
+class AsyncRoutesRequest(ASGIRequest):
+    # 公众只读接口走异步视图 (backend/asgi_urls.py)；去掉这一行即全部回到同步的 DRF 视图
+    urlconf = 'backend.asgi_urls'
+
+
+application.request_class = AsyncRoutesRequest
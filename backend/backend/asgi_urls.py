@@ -0,0 +1,12 @@
+"""
+ASGI 下使用的 URL 配置：公众只读接口换成异步实现 (api/views/public_async.py)，
+其余路由和 backend/urls.py 完全相同。由 backend/asgi.py 通过 request.urlconf 启用
+"""
+from django.urls import include, path
+
+from api.views.public_async import urlpatterns as public_async_urlpatterns
+from backend.urls import urlpatterns as base_urlpatterns
+
+urlpatterns = [
+    path('api/', include(public_async_urlpatterns)),
+] + base_urlpatterns
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -43,6 +44,12 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # 放在最前面：耗时统计覆盖整个中间件链 (见 api/metrics.py)
+    'api.metrics.MetricsMiddleware',
+    # 读请求分流到只读副本 (见 api/db_router.py)；没有配置副本时不加载
+    'api.db_router.ReplicaRoutingMiddleware',
+    # 大于 API_RENDERING['GZIP_MIN_LENGTH'] 的响应 gzip 压缩 (见 api/renderers.py)
+    'api.renderers.CompressionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -88,6 +95,30 @@ DATABASES = {
     }
 }
 
+# 本地开发/跑测试和性能基准时可以不装 MySQL：DJANGO_SQLITE=1 python manage.py test api
+if os.environ.get('DJANGO_SQLITE'):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+        }
+    }
+    # 本地模拟只读副本：DJANGO_SQLITE_REPLICA=1 时 db_replica.sqlite3 作为副本，
+    # "复制" 就是把 db.sqlite3 拷过去 (拷贝之前副本上看不到新写入，可以用来验证写后读主库)
+    if os.environ.get('DJANGO_SQLITE_REPLICA'):
+        DATABASES['replica1'] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db_replica.sqlite3',
+            'TEST': {'MIRROR': 'default'},
+        }
+
+# MySQL 只读副本：DB_REPLICA_HOSTS=10.0.0.12,10.0.0.13 (账号、库名和主库相同)
+for _index, _host in enumerate(filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(',')), 1):
+    DATABASES[f'replica{_index}'] = dict(DATABASES['default'], HOST=_host.strip(), TEST={'MIRROR': 'default'})
+
+# default 以外的别名都是只读副本，由 api/db_router.py 分流读请求
+DATABASE_ROUTERS = ['api.db_router.ReplicaRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -134,7 +165,71 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 REST_FRAMEWORK = {
     # 告诉 Django: 凡是带了 Token 的，请用 JWT 方式来验证身份
+    # 角色 / 所属医院写在 token 声明里，认证和权限判断不查库 (见 api/authentication.py)
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.ClaimsJWTAuthentication',
     ),
-}
\ No newline at end of file
+    # 所有 router 注册的列表接口统一使用 keyset 分页 (见 api/pagination.py)
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.KeysetPagination',
+    # ?fields= / ?omit= / ?expand= 裁剪返回字段，查询集按保留的字段 JOIN / 预取 / only() (见 api/fieldsets.py)
+    'DEFAULT_FILTER_BACKENDS': (
+        'api.fieldsets.FieldsetFilterBackend',
+    ),
+    # orjson 编码 JSON (输出和 DRF 默认的一样)，可选 MessagePack (见 api/renderers.py)
+    'DEFAULT_RENDERER_CLASSES': (
+        'api.renderers.FastJSONRenderer',
+        'api.renderers.MessagePackRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_CONTENT_NEGOTIATION_CLASS': 'api.renderers.ContentNegotiation',
+}
+
+SIMPLE_JWT = {
+    'TOKEN_OBTAIN_SERIALIZER': 'api.authentication.ClaimsTokenObtainPairSerializer',
+}
+
+# 列表分页配置
+API_PAGINATION = {
+    'ALWAYS': False,        # False: 只有带 cursor / page_size 参数的请求才分页，兼容旧前端
+    'PAGE_SIZE': 50,
+    'MAX_PAGE_SIZE': 500,
+}
+
+# 缓存 (本地内存，不依赖外部服务；多进程部署可换成 FileBasedCache / Redis)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'city-health',
+    }
+}
+
+# 公共/基础数据接口响应缓存 (见 api/response_cache.py)
+API_RESPONSE_CACHE = {
+    'ENABLED': True,
+    'ALIAS': 'default',
+    'TIMEOUT': 300,
+}
+
+# 接口性能指标 (见 api/metrics.py，GET /api/metrics)；关闭后中间件不加载，没有额外开销
+API_METRICS = {
+    'ENABLED': True,
+}
+
+# 突发事件实时推送 (见 api/event_feed.py，GET /api/events/stream/，需要 ASGI 部署)
+EVENT_FEED = {
+    'MAX_SUBSCRIBERS': 1000,
+    'HEARTBEAT': 15,
+}
+
+# 响应编码 (见 api/renderers.py)：orjson / msgpack 是可选依赖，没装时自动回退
+API_RENDERING = {
+    'ORJSON': True,
+    'MSGPACK': True,
+    'GZIP_MIN_LENGTH': 1024,
+}
+
+# 只读副本分流 (见 api/db_router.py)
+DATABASE_REPLICAS = {
+    'STICKY_SECONDS': 5,
+    'RETRY_SECONDS': 30,
+}